@@ -0,0 +1,121 @@
+-- Cheaper row-level-security checks
+-- Run this in Supabase SQL Editor after supabase_schema.sql,
+-- update_booking_status.sql and the other migrations that add policies
+--
+-- The original admin policies ran
+--     EXISTS (SELECT 1 FROM profiles WHERE id = auth.uid() AND role = 'admin')
+-- for every row, so an admin scan of 100k bookings ran 100k subqueries.
+-- is_admin() does the same lookup, and wrapping the call as
+-- (SELECT public.is_admin()) turns it into an InitPlan that Postgres runs
+-- once per statement. auth.uid() in the owner policies is wrapped the same
+-- way. See admin_policies_benchmark.sql for before/after plans.
+--
+-- The API uses the same rule (require_admin in main.py): role 'admin' in the
+-- app metadata, which handle_new_user copies into profiles.role. Only the
+-- service role can write app metadata; user metadata is set by the user at
+-- sign-up or with auth.updateUser(), so a role there grants nothing. Users
+-- can update their own profile, but not its role.
+
+CREATE OR REPLACE FUNCTION public.handle_new_user()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO public.profiles (id, email, name, role)
+    VALUES (
+        NEW.id,
+        NEW.email,
+        NEW.raw_user_meta_data->>'name',
+        COALESCE(NEW.raw_app_meta_data->>'role', 'user')
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION public.is_admin()
+RETURNS BOOLEAN AS $$
+    SELECT EXISTS (
+        SELECT 1 FROM public.profiles
+        WHERE id = auth.uid()
+        AND role = 'admin'
+    );
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+GRANT EXECUTE ON FUNCTION public.is_admin TO authenticated, service_role;
+
+-- Events
+DROP POLICY IF EXISTS "Admins can create events" ON events;
+CREATE POLICY "Admins can create events"
+    ON events FOR INSERT
+    TO authenticated
+    WITH CHECK ((SELECT public.is_admin()));
+
+DROP POLICY IF EXISTS "Admins can update events" ON events;
+CREATE POLICY "Admins can update events"
+    ON events FOR UPDATE
+    TO authenticated
+    USING ((SELECT public.is_admin()));
+
+-- Bookings
+DROP POLICY IF EXISTS "Admins can view all bookings" ON bookings;
+CREATE POLICY "Admins can view all bookings"
+    ON bookings FOR SELECT
+    TO authenticated
+    USING ((SELECT public.is_admin()));
+
+DROP POLICY IF EXISTS "Admins can update bookings" ON bookings;
+CREATE POLICY "Admins can update bookings"
+    ON bookings FOR UPDATE
+    TO authenticated
+    USING ((SELECT public.is_admin()));
+
+DROP POLICY IF EXISTS "Users can view their own bookings" ON bookings;
+CREATE POLICY "Users can view their own bookings"
+    ON bookings FOR SELECT
+    USING ((SELECT auth.uid()) = user_id);
+
+DROP POLICY IF EXISTS "Users can create bookings" ON bookings;
+CREATE POLICY "Users can create bookings"
+    ON bookings FOR INSERT
+    WITH CHECK ((SELECT auth.uid()) = user_id);
+
+-- Profiles
+DROP POLICY IF EXISTS "Users can view their own profile" ON profiles;
+CREATE POLICY "Users can view their own profile"
+    ON profiles FOR SELECT
+    USING ((SELECT auth.uid()) = id);
+
+DROP POLICY IF EXISTS "Users can update their own profile" ON profiles;
+CREATE POLICY "Users can update their own profile"
+    ON profiles FOR UPDATE
+    USING ((SELECT auth.uid()) = id)
+    WITH CHECK ((SELECT auth.uid()) = id);
+
+-- role (and id, email) stay as the server set them
+REVOKE UPDATE ON profiles FROM anon, authenticated;
+GRANT UPDATE (name, updated_at) ON profiles TO authenticated;
+
+-- Read models added by later migrations; tables that don't exist (their
+-- migration wasn't run) are skipped
+DO $$
+BEGIN
+    IF to_regclass('public.user_bookings') IS NOT NULL THEN
+        DROP POLICY IF EXISTS "Users can view their own booking summaries" ON user_bookings;
+        CREATE POLICY "Users can view their own booking summaries"
+            ON user_bookings FOR SELECT
+            USING ((SELECT auth.uid()) = user_id);
+    END IF;
+
+    IF to_regclass('public.waitlist') IS NOT NULL THEN
+        DROP POLICY IF EXISTS "Users can view their own waitlist entries" ON waitlist;
+        CREATE POLICY "Users can view their own waitlist entries"
+            ON waitlist FOR SELECT
+            USING ((SELECT auth.uid()) = user_id);
+    END IF;
+
+    IF to_regclass('public.seat_holds') IS NOT NULL THEN
+        DROP POLICY IF EXISTS "Users can view their own holds" ON seat_holds;
+        CREATE POLICY "Users can view their own holds"
+            ON seat_holds FOR SELECT
+            USING ((SELECT auth.uid()) = user_id);
+    END IF;
+END
+$$;
@@ -0,0 +1,36 @@
+-- Before/after plans for the RLS rewrite in admin_policies.sql
+-- Run in Supabase SQL Editor on a database with a realistic number of
+-- bookings (e.g. one generated with the scale scripts). Replace the uuid with
+-- an admin user's id. Everything runs in a transaction that is rolled back.
+
+BEGIN;
+
+-- Act as that admin, the way PostgREST does for an API request
+SET LOCAL role authenticated;
+SELECT set_config('request.jwt.claims',
+    '{"sub": "00000000-0000-0000-0000-000000000000", "role": "authenticated"}', true);
+
+-- 1. The old per-row predicate: one SubPlan execution per booking
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT COUNT(*) FROM bookings
+WHERE EXISTS (
+    SELECT 1 FROM profiles
+    WHERE profiles.id = auth.uid()
+    AND profiles.role = 'admin'
+);
+
+-- 2. is_admin() called per row: cheaper, but still evaluated for every row
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT COUNT(*) FROM bookings
+WHERE public.is_admin();
+
+-- 3. The new policy form: one InitPlan for the whole statement
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT COUNT(*) FROM bookings
+WHERE (SELECT public.is_admin());
+
+-- 4. What the API actually runs, with the policies applied
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT * FROM bookings ORDER BY created_at DESC;
+
+ROLLBACK;
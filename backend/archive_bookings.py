@@ -0,0 +1,72 @@
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from supabase import create_client
+
+# Load environment variables
+load_dotenv()
+
+# Usage (e.g. nightly from cron):
+#   python archive_bookings.py
+#   python archive_bookings.py --days 30 --batch 10000
+#   python archive_bookings.py --export archive-2026-10.jsonl.gz
+# Moves bookings of events older than --days into bookings_archive (see
+# bookings_archive.sql), one batch per transaction so locks stay short.
+
+def export_rows(supabase, since, path, page_size=1000):
+    # Archived rows from this run, as gzip-compressed JSON lines
+    exported = 0
+    with gzip.open(path, "wt", encoding="utf-8") as out:
+        while True:
+            page = supabase.table("bookings_archive")\
+                .select("*")\
+                .gte("archived_at", since)\
+                .order("id")\
+                .range(exported, exported + page_size - 1)\
+                .execute()
+            for row in page.data:
+                out.write(json.dumps(row) + "\n")
+            exported += len(page.data)
+            if len(page.data) < page_size:
+                return exported
+
+def main():
+    parser = argparse.ArgumentParser(description="Move bookings of past events into bookings_archive")
+    parser.add_argument("--days", type=int, default=90, help="Archive events that started more than this many days ago")
+    parser.add_argument("--batch", type=int, default=5000, help="Bookings moved per transaction")
+    parser.add_argument("--pause", type=float, default=0.1, help="Seconds to sleep between batches")
+    parser.add_argument("--export", help="Also write the archived rows to this .jsonl.gz file")
+    args = parser.parse_args()
+
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")  # Using service role key for admin access
+
+    if not supabase_url or not supabase_key:
+        print("Error: SUPABASE_URL and SUPABASE_KEY must be set in .env file")
+        exit(1)
+
+    supabase = create_client(supabase_url, supabase_key)
+
+    started = datetime.now(timezone.utc)
+    before = (started - timedelta(days=args.days)).isoformat()
+    total = 0
+    while True:
+        moved = supabase.rpc("archive_past_bookings", {"p_before": before, "p_batch": args.batch}).execute().data
+        total += moved or 0
+        if not moved:
+            break
+        print(f"  Moved {moved} bookings ({total} so far)")
+        time.sleep(args.pause)
+
+    print(f"✅ Archived {total} bookings of events before {before[:10]}")
+
+    if args.export and total:
+        exported = export_rows(supabase, started.isoformat(), args.export)
+        print(f"✅ Exported {exported} archived bookings to {args.export}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Seat availability push over WebSocket.
+
+Clients subscribe to event ids on ``/ws/availability``. The booking write path
+only calls ``publish(event_id)``, which marks the event dirty. Every
+``interval`` seconds the broadcaster looks up the remaining seats of all dirty
+events in one call and hands each subscriber the new counts, so an on-sale
+with hundreds of bookings per second still sends at most one message per
+event per interval.
+
+Each connection holds a dict of unsent counts keyed by event id rather than a
+message queue: a slow client just has its pending values overwritten, so
+memory per connection is bounded by its number of subscriptions. Idle
+connections cost one small object and an entry in the subscriber index.
+
+Subscribers only see bookings made by the worker process they are connected
+to.
+"""
+import asyncio
+import json
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+
+class Subscriber:
+    __slots__ = ("event_ids", "pending", "ready")
+
+    def __init__(self):
+        self.event_ids = set()
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def offer(self, counts):
+        self.pending.update(counts)
+        self.ready.set()
+
+
+class AvailabilityBroadcaster:
+    def __init__(self, fetch_availability, interval=0.5, max_subscriptions=200):
+        # fetch_availability: async callable taking a list of event ids and
+        # returning {event_id: remaining_seats}
+        self.fetch_availability = fetch_availability
+        self.interval = interval
+        self.max_subscriptions = max_subscriptions
+        self._subscribers = {}
+        self._dirty = set()
+        self._wakeup = asyncio.Event()
+
+    def publish(self, event_id):
+        if event_id in self._subscribers:
+            self._dirty.add(event_id)
+            self._wakeup.set()
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            dirty, self._dirty = self._dirty, set()
+            try:
+                counts = await self.fetch_availability(list(dirty))
+            except Exception as e:
+                print(f"Availability broadcast failed: {str(e)}")
+                counts = {}
+            self._fan_out(counts)
+            # Anything published while we were sending waits for the next tick
+            await asyncio.sleep(self.interval)
+
+    def _fan_out(self, counts):
+        per_subscriber = {}
+        for event_id, remaining in counts.items():
+            for subscriber in self._subscribers.get(event_id, ()):
+                per_subscriber.setdefault(subscriber, {})[event_id] = remaining
+        for subscriber, update in per_subscriber.items():
+            subscriber.offer(update)
+
+    def _subscribe(self, subscriber, event_ids):
+        added = []
+        for event_id in event_ids:
+            if len(subscriber.event_ids) >= self.max_subscriptions:
+                break
+            if event_id not in subscriber.event_ids:
+                subscriber.event_ids.add(event_id)
+                self._subscribers.setdefault(event_id, set()).add(subscriber)
+                added.append(event_id)
+        return added
+
+    def _unsubscribe(self, subscriber, event_ids):
+        for event_id in event_ids:
+            subscriber.event_ids.discard(event_id)
+            subscribers = self._subscribers.get(event_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[event_id]
+            subscriber.pending.pop(event_id, None)
+
+    async def _send_initial(self, subscriber, event_ids):
+        if event_ids:
+            subscriber.offer(await self.fetch_availability(event_ids))
+
+    async def serve(self, websocket: WebSocket, event_ids):
+        """Run one client connection until it disconnects.
+
+        Clients may send ``{"subscribe": [...]}`` or ``{"unsubscribe": [...]}``
+        and receive ``{"type": "availability", "seats": {event_id: remaining}}``.
+        """
+        await websocket.accept()
+        subscriber = Subscriber()
+
+        async def receive():
+            while True:
+                try:
+                    message = json.loads(await websocket.receive_text())
+                except ValueError:
+                    continue
+                if not isinstance(message, dict):
+                    continue
+                self._unsubscribe(subscriber, [str(i) for i in message.get("unsubscribe") or []])
+                added = self._subscribe(subscriber, [str(i) for i in message.get("subscribe") or []])
+                await self._send_initial(subscriber, added)
+
+        async def send():
+            while True:
+                await subscriber.ready.wait()
+                subscriber.ready.clear()
+                seats, subscriber.pending = subscriber.pending, {}
+                if seats:
+                    await websocket.send_text(json.dumps({"type": "availability", "seats": seats}))
+
+        receiver = asyncio.create_task(receive())
+        sender = asyncio.create_task(send())
+        try:
+            await self._send_initial(subscriber, self._subscribe(subscriber, event_ids))
+            await asyncio.wait([receiver, sender], return_when=asyncio.FIRST_COMPLETED)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in (receiver, sender):
+                task.cancel()
+                if task.done() and not task.cancelled():
+                    # Usually WebSocketDisconnect; retrieve it so it isn't logged
+                    task.exception()
+            self._unsubscribe(subscriber, list(subscriber.event_ids))
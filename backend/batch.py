@@ -0,0 +1,99 @@
+"""Several GET requests to the API's own routes in one round trip.
+
+/api/batch authenticates the caller once and then runs each sub-request
+through the ASGI app concurrently, so they still pass through the
+middleware, dependencies and error handling of their route. While they run,
+two context variables are set:
+
+- ``verified_auth`` holds the token and the user it was verified as, so
+  get_current_user returns it without another auth round trip.
+- ``batch_users`` holds one UserDirectory shared by all sub-requests, so a
+  user that appears in both /api/admin/bookings and /api/admin/users is
+  fetched from Supabase once.
+"""
+import asyncio
+import json
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+verified_auth = ContextVar("verified_auth", default=None)
+batch_users = ContextVar("batch_users", default=None)
+
+
+class UserDirectory:
+    # Auth users by id, each fetched at most once. ``fetch`` is an async
+    # function returning the user (or None); failures are returned as the
+    # exception from get_many() so one missing user doesn't fail the rest.
+
+    def __init__(self, fetch, concurrency=10):
+        self.fetch = fetch
+        self._users = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _load(self, user_id):
+        async with self._semaphore:
+            return await self.fetch(user_id)
+
+    async def get(self, user_id):
+        task = self._users.get(user_id)
+        if task is None:
+            task = self._users[user_id] = asyncio.ensure_future(self._load(user_id))
+        return await task
+
+    async def get_many(self, user_ids):
+        user_ids = list(dict.fromkeys(user_ids))
+        users = await asyncio.gather(*[self.get(user_id) for user_id in user_ids], return_exceptions=True)
+        return dict(zip(user_ids, users))
+
+
+async def dispatch(app, scope, path, headers):
+    """Run ``GET path`` through ``app`` and return (status, body).
+
+    ``scope`` is the batch request's scope (for client, server and scheme);
+    ``headers`` are the raw headers passed on to the sub-request. JSON bodies
+    are decoded, anything else is returned as text.
+    """
+    url = urlsplit(path)
+    sub_scope = {
+        "type": "http",
+        "asgi": scope.get("asgi", {"version": "3.0"}),
+        "http_version": scope.get("http_version", "1.1"),
+        "scheme": scope.get("scheme", "http"),
+        "server": scope.get("server"),
+        "client": scope.get("client"),
+        "root_path": scope.get("root_path", ""),
+        "method": "GET",
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "headers": headers,
+    }
+    response = {"status": 500, "json": False, "body": []}
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["json"] = any(
+                k == b"content-type" and v.startswith(b"application/json") for k, v in message.get("headers", [])
+            )
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    try:
+        await app(sub_scope, receive, send)
+    except Exception as e:
+        # The app already logged it and answered 500; keep the other sub-requests
+        print(f"Batch sub-request {path} failed: {str(e)}")
+        return 500, {"detail": "Internal Server Error"}
+    body = b"".join(response["body"])
+    if response["json"] and body:
+        return response["status"], json.loads(body)
+    return response["status"], body.decode("utf-8", errors="replace")
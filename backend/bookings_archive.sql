@@ -0,0 +1,150 @@
+-- Hot/archive split for bookings
+-- Run this in Supabase SQL Editor after event_availability.sql (re-run that
+-- file first if it was applied before this migration existed) and
+-- event_report.sql
+--
+-- Bookings of events that ended more than a retention window ago (check-in
+-- status included) are moved from bookings into bookings_archive, which is
+-- range-partitioned by event date, one partition per year. The hot bookings
+-- table and its indexes then only hold current events. The API reads the
+-- archive only when a request passes include_archived=true.
+--
+-- Moving a row does not release seats: track_booked_seats skips rows while
+-- app.archiving is on, so events.booked_count stays as it was.
+
+CREATE TABLE IF NOT EXISTS bookings_archive (
+    id UUID NOT NULL,
+    event_id UUID REFERENCES events(id) ON DELETE CASCADE,
+    user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE,
+    quantity INTEGER NOT NULL,
+    total_price DECIMAL(10, 2),
+    status TEXT,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    event_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW()),
+    PRIMARY KEY (id, event_date)
+) PARTITION BY RANGE (event_date);
+
+-- Catches anything outside the yearly partitions created below
+CREATE TABLE IF NOT EXISTS bookings_archive_default PARTITION OF bookings_archive DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_archive_user ON bookings_archive(user_id, event_date);
+CREATE INDEX IF NOT EXISTS idx_bookings_archive_event ON bookings_archive(event_id);
+
+ALTER TABLE bookings_archive ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view their own archived bookings" ON bookings_archive;
+CREATE POLICY "Users can view their own archived bookings"
+    ON bookings_archive FOR SELECT
+    USING ((SELECT auth.uid()) = user_id);
+
+DROP POLICY IF EXISTS "Admins can view archived bookings" ON bookings_archive;
+CREATE POLICY "Admins can view archived bookings"
+    ON bookings_archive FOR SELECT
+    TO authenticated
+    USING ((SELECT public.is_admin()));
+
+-- Moves up to p_batch bookings of events that started before p_before and
+-- returns how many were moved. Call it repeatedly until it returns 0
+-- (archive_bookings.py does), or schedule it with pg_cron:
+--     SELECT cron.schedule('archive-bookings', '0 3 * * *', 'SELECT archive_past_bookings()');
+CREATE OR REPLACE FUNCTION public.archive_past_bookings(
+    p_before TIMESTAMP WITH TIME ZONE DEFAULT NOW() - INTERVAL '90 days',
+    p_batch INTEGER DEFAULT 5000
+)
+RETURNS INTEGER AS $$
+DECLARE
+    partition_year INTEGER;
+    moved INTEGER;
+BEGIN
+    FOR partition_year IN
+        SELECT DISTINCT EXTRACT(YEAR FROM e.date)::INTEGER
+        FROM events e
+        WHERE e.date < p_before
+        AND EXISTS (SELECT 1 FROM bookings b WHERE b.event_id = e.id)
+    LOOP
+        IF to_regclass(format('public.bookings_archive_%s', partition_year)) IS NULL THEN
+            -- Rows already in the default partition for that year have to move first
+            EXECUTE format(
+                'CREATE TABLE bookings_archive_%1$s (LIKE bookings_archive INCLUDING DEFAULTS);
+                 WITH stray AS (
+                     DELETE FROM bookings_archive_default
+                     WHERE event_date >= make_date(%1$s, 1, 1) AND event_date < make_date(%1$s + 1, 1, 1)
+                     RETURNING *
+                 )
+                 INSERT INTO bookings_archive_%1$s SELECT * FROM stray;
+                 ALTER TABLE bookings_archive ATTACH PARTITION bookings_archive_%1$s
+                     FOR VALUES FROM (make_date(%1$s, 1, 1)) TO (make_date(%1$s + 1, 1, 1));',
+                partition_year
+            );
+        END IF;
+    END LOOP;
+
+    PERFORM set_config('app.archiving', 'on', true);
+
+    WITH batch AS (
+        SELECT b.id
+        FROM bookings b
+        JOIN events e ON e.id = b.event_id
+        WHERE e.date < p_before
+        LIMIT p_batch
+        FOR UPDATE OF b SKIP LOCKED
+    ), moved_rows AS (
+        DELETE FROM bookings b
+        USING batch, events e
+        WHERE b.id = batch.id AND e.id = b.event_id
+        RETURNING b.id, b.event_id, b.user_id, b.quantity, b.total_price, b.status,
+                  b.created_at, b.updated_at, e.date
+    )
+    INSERT INTO bookings_archive (id, event_id, user_id, quantity, total_price, status,
+                                  created_at, updated_at, event_date)
+    SELECT * FROM moved_rows;
+
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    PERFORM set_config('app.archiving', 'off', true);
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Same columns as event_report(), over archived bookings only. The API adds
+-- it to the live report when asked for include_archived.
+CREATE OR REPLACE FUNCTION public.archived_event_report(
+    date_from TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    date_to TIMESTAMP WITH TIME ZONE DEFAULT NULL
+)
+RETURNS TABLE (
+    event_id UUID,
+    title TEXT,
+    date TIMESTAMP WITH TIME ZONE,
+    capacity INTEGER,
+    bookings BIGINT,
+    sold BIGINT,
+    confirmed BIGINT,
+    checked_in BIGINT,
+    cancelled BIGINT,
+    no_show_rate NUMERIC,
+    revenue NUMERIC
+) AS $$
+    SELECT
+        e.id,
+        e.title,
+        e.date,
+        e.capacity,
+        COUNT(a.id) FILTER (WHERE a.status IS DISTINCT FROM 'cancelled'),
+        COALESCE(SUM(a.quantity) FILTER (WHERE a.status IS DISTINCT FROM 'cancelled'), 0),
+        COUNT(a.id) FILTER (WHERE COALESCE(a.status, 'confirmed') = 'confirmed'),
+        COUNT(a.id) FILTER (WHERE a.status = 'checked_in'),
+        COUNT(a.id) FILTER (WHERE a.status = 'cancelled'),
+        NULL::NUMERIC,
+        COALESCE(SUM(a.total_price) FILTER (WHERE a.status IS DISTINCT FROM 'cancelled'), 0)
+    FROM bookings_archive a
+    JOIN events e ON e.id = a.event_id
+    WHERE (date_from IS NULL OR a.event_date >= date_from)
+      AND (date_to IS NULL OR a.event_date < date_trunc('day', date_to) + INTERVAL '1 day')
+    GROUP BY e.id
+    ORDER BY e.date;
+$$ LANGUAGE sql STABLE;
+
+GRANT EXECUTE ON FUNCTION public.archive_past_bookings TO service_role;
+GRANT EXECUTE ON FUNCTION public.archived_event_report TO service_role;
@@ -0,0 +1,35 @@
+"""Small in-process TTL cache shared by the API endpoints."""
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    # Entries expire ``ttl`` seconds after they were set. The oldest entries
+    # are dropped once ``maxsize`` is reached, so memory stays bounded.
+
+    def __init__(self, ttl, maxsize=10_000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
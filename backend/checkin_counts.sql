@@ -0,0 +1,20 @@
+-- Per-event check-in counters used by GET /api/admin/checkins/stream
+-- Run this in Supabase SQL Editor after supabase_schema.sql
+--
+-- The door dashboard loads its counters once per process. Grouping in the
+-- database returns one row per event and status instead of every booking,
+-- and isn't cut off by PostgREST's row limit.
+
+CREATE OR REPLACE FUNCTION public.checkin_counts()
+RETURNS TABLE (
+    event_id UUID,
+    status TEXT,
+    count BIGINT
+) AS $$
+    SELECT b.event_id, COALESCE(b.status, 'confirmed'), COUNT(*)
+    FROM bookings b
+    WHERE COALESCE(b.status, 'confirmed') IN ('confirmed', 'checked_in')
+    GROUP BY b.event_id, COALESCE(b.status, 'confirmed');
+$$ LANGUAGE sql STABLE;
+
+GRANT EXECUTE ON FUNCTION public.checkin_counts TO service_role;
@@ -0,0 +1,145 @@
+"""Live per-event check-in counters for the admin door dashboard.
+
+The counters are loaded from the bookings table once (grouped by
+checkin_counts.sql), then kept current by the write endpoints: a booking adds one confirmed, a check-in moves one from
+confirmed to checked_in and records an arrival. Dashboard streams read the
+shared counters, so the cost of a scan is one counter update no matter how
+many admins are watching.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+
+ARRIVAL_WINDOW_SECONDS = 60
+
+
+class CheckinTracker:
+    def __init__(self):
+        self._counts = {}
+        self._arrivals = {}
+        self._version = 0
+        self._changed = asyncio.Event()
+        self._loaded = False
+        self._loading = False
+        self._pending = []
+        self._load_lock = asyncio.Lock()
+        self._snapshot_version = -1
+        self._snapshot = None
+
+    async def ensure_loaded(self, fetch_rows):
+        # fetch_rows: async callable returning [{"event_id", "status", "count"}, ...]
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            # Writes made while the rows are in flight are kept and applied
+            # after them, instead of being lost
+            self._loading = True
+            try:
+                rows = await fetch_rows()
+            except BaseException:
+                self._pending.clear()
+                raise
+            finally:
+                self._loading = False
+            for row in rows:
+                status = row.get("status") or "confirmed"
+                if status in ("confirmed", "checked_in"):
+                    counts = self._event_counts(row["event_id"])
+                    counts[status] += row.get("count", 1)
+            self._loaded = True
+            pending, self._pending = self._pending, []
+            for record, event_id in pending:
+                record(event_id)
+            self._bump()
+
+    def _defer(self, record, event_id):
+        # True if the counters aren't loaded yet; the write is kept for the
+        # load in progress, or dropped when there is none (it will be counted)
+        if self._loaded:
+            return False
+        if self._loading:
+            self._pending.append((record, event_id))
+        return True
+
+    def _event_counts(self, event_id):
+        counts = self._counts.get(event_id)
+        if counts is None:
+            counts = self._counts[event_id] = {"confirmed": 0, "checked_in": 0}
+        return counts
+
+    def _bump(self):
+        self._version += 1
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def record_booking(self, event_id):
+        if self._defer(self.record_booking, event_id):
+            return
+        self._event_counts(event_id)["confirmed"] += 1
+        self._bump()
+
+    def record_cancellation(self, event_id):
+        if self._defer(self.record_cancellation, event_id):
+            return
+        counts = self._event_counts(event_id)
+        counts["confirmed"] = max(counts["confirmed"] - 1, 0)
+        self._bump()
+
+    def record_checkin(self, event_id):
+        if self._defer(self.record_checkin, event_id):
+            return
+        counts = self._event_counts(event_id)
+        counts["confirmed"] = max(counts["confirmed"] - 1, 0)
+        counts["checked_in"] += 1
+
+        now = int(time.monotonic())
+        buckets = self._arrivals.setdefault(event_id, deque())
+        if buckets and buckets[-1][0] == now:
+            buckets[-1][1] += 1
+        else:
+            buckets.append([now, 1])
+        self._bump()
+
+    def _arrivals_per_minute(self, event_id, now):
+        buckets = self._arrivals.get(event_id)
+        if not buckets:
+            return 0
+        while buckets and buckets[0][0] <= now - ARRIVAL_WINDOW_SECONDS:
+            buckets.popleft()
+        return sum(count for _, count in buckets)
+
+    def snapshot(self):
+        # Built at most once per change and shared by every viewer
+        if self._snapshot_version != self._version:
+            now = int(time.monotonic())
+            self._snapshot = {
+                event_id: {**counts, "arrivals_per_minute": self._arrivals_per_minute(event_id, now)}
+                for event_id, counts in self._counts.items()
+            }
+            self._snapshot_version = self._version
+        return self._snapshot
+
+    async def stream(self, event_id=None, interval=1.0, heartbeat=15.0):
+        """Yield Server-Sent Events with the counters whenever they change.
+
+        Changes are coalesced into at most one message per ``interval``; a
+        comment line every ``heartbeat`` seconds keeps idle proxies from
+        closing the connection.
+        """
+        while True:
+            snapshot = self.snapshot()
+            data = {event_id: snapshot.get(event_id)} if event_id else snapshot
+            yield f"data: {json.dumps(data)}\n\n"
+
+            # Rate-per-minute decays even without scans, so refresh at least
+            # once per heartbeat
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                self._snapshot_version = -1
+            await asyncio.sleep(interval)
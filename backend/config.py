@@ -0,0 +1,87 @@
+"""Typed settings for the API, read from the environment and .env.
+
+Every field maps to the upper-case environment variable of the same name
+(``supabase_url`` -> ``SUPABASE_URL``). Nothing here is required at import
+time: missing Supabase credentials make /readyz fail instead of crashing the
+process, so the app still starts and reports what is wrong.
+"""
+from functools import lru_cache
+from typing import List, Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    supabase_url: Optional[str] = None
+    supabase_key: Optional[str] = None
+    supabase_jwt_secret: Optional[str] = None
+    supabase_pool_size: int = 20
+    supabase_keepalive_connections: int = 10
+    supabase_connect_timeout: float = 2.0
+    supabase_read_timeout: float = 5.0
+
+    # Read replicas: PostgREST/Supabase API URLs sharing the primary's key,
+    # e.g. SUPABASE_REPLICA_URLS='["https://<ref>-rr-eu-west-1.supabase.co"]'
+    supabase_replica_urls: List[str] = []
+    replica_max_lag_seconds: float = 5.0
+    replica_check_interval: float = 5.0
+    read_your_writes_seconds: float = 10.0
+
+    upstream_read_timeout: float = 3.0
+    upstream_write_timeout: float = 8.0
+    upstream_auth_timeout: float = 3.0
+    upstream_read_retries: int = 2
+    upstream_breaker_threshold: float = 0.5
+    upstream_breaker_cooldown: float = 10.0
+
+    cors_origins: List[str] = [
+        "http://localhost:3000", "http://localhost:3001", "http://localhost:3002", "http://localhost:3003"
+    ]
+    rate_limit_sqlite_path: Optional[str] = None
+
+    # Stored responses for Idempotency-Key retries. Set IDEMPOTENCY_TABLE
+    # (e.g. "idempotency_keys", see idempotency.sql) to share them between workers
+    idempotency_ttl_seconds: float = 86400.0
+    idempotency_max_keys: int = 100_000
+    idempotency_table: Optional[str] = None
+
+    media_root: str = "media"
+    media_base_url: str = "http://localhost:8000/media"
+    image_workers: int = 2
+    ticket_cache_dir: str = "local_data/tickets"
+
+    availability_ttl_seconds: float = 3.0
+    availability_push_interval: float = 0.5
+    report_ttl_seconds: float = 300.0
+    batch_max_requests: int = 20
+    hold_minutes: float = 10.0
+    # Set once event_seat_shards.sql is applied: event reads then include the
+    # booked_seats computed column, which adds up a sharded event's counters
+    seat_shards: bool = False
+
+    job_queue_path: str = "local_data/jobs.db"
+    job_workers: int = 4
+    job_max_attempts: int = 5
+
+    smtp_host: Optional[str] = None
+    smtp_port: int = 587
+    smtp_user: Optional[str] = None
+    smtp_password: Optional[str] = None
+    smtp_from: str = "no-reply@example.com"
+
+    # Upper bound for the startup warm-up; the app turns ready either way
+    warmup_timeout: float = 10.0
+
+    @property
+    def jwks_url(self):
+        return f"{self.supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json" if self.supabase_url else None
+
+    def missing(self):
+        return [name for name in ("supabase_url", "supabase_key") if not getattr(self, name)]
+
+
+@lru_cache
+def get_settings():
+    return Settings()
@@ -5,9 +5,11 @@
 -- Then run this to upgrade the user to admin:
 
 -- Replace 'admin@example.com' with your actual email
+-- The role goes in the app metadata: users can change their own user
+-- metadata, so the API and is_admin() ignore a role set there
 UPDATE auth.users
-SET raw_user_meta_data = jsonb_set(
-    COALESCE(raw_user_meta_data, '{}'::jsonb),
+SET raw_app_meta_data = jsonb_set(
+    COALESCE(raw_app_meta_data, '{}'::jsonb),
     '{role}',
     '"admin"'
 )
@@ -19,6 +21,6 @@ SET role = 'admin'
 WHERE email = 'admin@example.com';
 
 -- Verify the admin was created
-SELECT id, email, raw_user_meta_data->>'role' as role
+SELECT id, email, raw_app_meta_data->>'role' as role
 FROM auth.users
 WHERE email = 'admin@example.com';
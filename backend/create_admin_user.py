@@ -36,8 +36,8 @@ def create_admin():
         print("3. Add to backend/.env: SUPABASE_SERVICE_ROLE_KEY=your_service_role_key")
         print("\n💡 Or use the easier method:")
         print("1. Register at http://localhost:3000/register")
-        print("2. Go to Supabase Dashboard → Authentication → Users")
-        print("3. Edit your user's 'Raw User Meta Data' to: {\"name\": \"Your Name\", \"role\": \"admin\"}")
+        print("2. Put your email in backend/create_admin.sql")
+        print("3. Run it in the Supabase SQL Editor (it sets role 'admin' in raw_app_meta_data)")
         return
     
     supabase = create_client(supabase_url, supabase_key)
@@ -63,7 +63,9 @@ def create_admin():
             "password": password,
             "email_confirm": True,
             "user_metadata": {
-                "name": name,
+                "name": name
+            },
+            "app_metadata": {
                 "role": "admin"
             }
         })
@@ -80,15 +82,13 @@ def create_admin():
         
         if "User not allowed" in error_msg or "not authorized" in error_msg.lower():
             print("\n🔧 This error means you need the SERVICE ROLE key, not the anon key")
-            print("\n📝 Quick fix - Use the web interface instead:")
+            print("\n📝 Quick fix - Use the SQL Editor instead:")
             print("1. Register at http://localhost:3000/register with this email")
-            print("2. Go to https://supabase.com/dashboard")
-            print("3. Authentication → Users → Click your user")
-            print("4. Edit 'Raw User Meta Data' to:")
-            print('   {"name": "' + name + '", "role": "admin"}')
-            print("5. Save and login at /admin/login")
+            print("2. Put this email in backend/create_admin.sql")
+            print("3. Run it in the Supabase SQL Editor (it sets role 'admin' in raw_app_meta_data)")
+            print("4. Login at /admin/login")
         else:
-            print("\nNote: If user already exists, use the web interface method above")
+            print("\nNote: If user already exists, use the create_admin.sql method above")
 
 if __name__ == "__main__":
     create_admin()
@@ -0,0 +1,65 @@
+-- Live seat availability: a booked_count counter on events
+-- Run this in Supabase SQL Editor after supabase_schema.sql
+--
+-- The counter is maintained by a trigger on bookings, so remaining seats are
+-- simply capacity - booked_count and the API never has to count bookings.
+-- The same trigger rejects bookings that would exceed capacity, which makes
+-- the capacity check atomic with the insert.
+
+ALTER TABLE events ADD COLUMN IF NOT EXISTS booked_count INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill from existing bookings (cancelled bookings don't hold seats)
+UPDATE events e
+SET booked_count = COALESCE((
+    SELECT SUM(b.quantity)
+    FROM bookings b
+    WHERE b.event_id = e.id
+    AND COALESCE(b.status, '') <> 'cancelled'
+), 0);
+
+CREATE OR REPLACE FUNCTION public.track_booked_seats()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Bookings moved to bookings_archive (archive_past_bookings) keep their
+    -- seats counted
+    IF current_setting('app.archiving', true) = 'on' THEN
+        RETURN COALESCE(NEW, OLD);
+    END IF;
+
+    -- Status changes such as confirmed -> checked_in don't move seats; skip
+    -- them so check-ins never touch the event row.
+    IF TG_OP = 'UPDATE'
+        AND NEW.event_id = OLD.event_id
+        AND NEW.quantity = OLD.quantity
+        AND (COALESCE(NEW.status, '') = 'cancelled') = (COALESCE(OLD.status, '') = 'cancelled') THEN
+        RETURN NEW;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') AND COALESCE(OLD.status, '') <> 'cancelled' THEN
+        UPDATE events
+        SET booked_count = booked_count - OLD.quantity
+        WHERE id = OLD.event_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND COALESCE(NEW.status, '') <> 'cancelled' THEN
+        UPDATE events
+        SET booked_count = booked_count + NEW.quantity
+        WHERE id = NEW.event_id
+        AND booked_count + NEW.quantity <= capacity;
+
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'Not enough capacity' USING ERRCODE = 'check_violation';
+        END IF;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS bookings_track_booked_seats ON bookings;
+CREATE TRIGGER bookings_track_booked_seats
+    AFTER INSERT OR UPDATE OR DELETE ON bookings
+    FOR EACH ROW EXECUTE FUNCTION public.track_booked_seats();
@@ -0,0 +1,8 @@
+-- Resized image variants for events
+-- Run this in Supabase SQL Editor after supabase_schema.sql
+--
+-- Filled in by the API after an event is created or imported, e.g.
+-- {"webp": {"320": "https://.../media/ab/ab12.../320.webp", "640": ..., "1280": ...},
+--  "avif": {...}}
+
+ALTER TABLE events ADD COLUMN IF NOT EXISTS image_variants JSONB;
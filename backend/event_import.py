@@ -0,0 +1,170 @@
+"""Bulk event import shared by POST /api/admin/events/import and import_events.py.
+
+Rows are streamed from CSV or JSONL, validated with the ``Event`` model and
+inserted in chunks, several chunks at a time. Each row gets a deterministic
+id derived from the batch id (a hash of the file) and its row number, and
+chunks are upserted with ``ignore_duplicates``. Re-running an import after a
+failure is therefore safe: rows that already made it in are skipped.
+
+The checkpoint is the last row number up to which every chunk has finished,
+so resuming from it never skips rows even though chunks complete out of
+order.
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import uuid
+
+from pydantic import ValidationError
+
+from models import Event
+
+IMPORT_NAMESPACE = uuid.UUID("5b0e3f0c-6c1d-4c8e-9a53-0f6f1c1d2e7a")
+
+
+class ImportAborted(Exception):
+    pass
+
+
+def batch_id_for(binary_file):
+    # Hash the content so the same file always maps to the same row ids
+    digest = hashlib.sha256()
+    for block in iter(lambda: binary_file.read(1 << 20), b""):
+        digest.update(block)
+    binary_file.seek(0)
+    return digest.hexdigest()[:32]
+
+
+def read_rows(binary_file, fmt):
+    """Yield (row_number, dict) from a CSV or JSONL binary file, one row at a time."""
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        for row_number, row in enumerate(csv.DictReader(text), start=1):
+            yield row_number, row
+    elif fmt == "jsonl":
+        row_number = 0
+        for line in text:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                yield row_number, json.loads(line)
+            except ValueError as e:
+                yield row_number, {"__error__": f"Invalid JSON: {str(e)}"}
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+    text.detach()
+
+
+def validate_row(row):
+    if "__error__" in row:
+        raise ValueError(row["__error__"])
+    # CSV cells are strings; empty ones mean "not set"
+    cleaned = {key: value for key, value in row.items() if key and value not in ("", None)}
+    return Event(**cleaned).dict()
+
+
+async def import_events(rows, insert_chunk, batch_id, chunk_size=500, concurrency=4,
+                        start_after=0, on_checkpoint=None):
+    """Validate and insert ``rows`` ((row_number, dict) pairs).
+
+    ``insert_chunk`` is an async callable taking a list of event dicts and
+    upserting them. Returns a summary with per-row errors and the checkpoint.
+    """
+    errors = []
+    totals = {"inserted": 0, "processed": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    finished = {}
+    state = {"next_chunk": 0, "checkpoint": start_after, "aborted": None}
+    tasks = set()
+
+    def advance():
+        while state["next_chunk"] in finished:
+            state["checkpoint"] = finished.pop(state["next_chunk"])
+            state["next_chunk"] += 1
+        if on_checkpoint:
+            on_checkpoint(state["checkpoint"])
+
+    async def insert_with_fallback(chunk):
+        try:
+            await insert_chunk([event for _, event in chunk])
+            return len(chunk)
+        except Exception as chunk_error:
+            # Find the offending rows one by one
+            inserted = 0
+            row_errors = []
+            for row_number, event in chunk:
+                try:
+                    await insert_chunk([event])
+                    inserted += 1
+                except Exception as e:
+                    row_errors.append({"row": row_number, "error": str(e)})
+            if not inserted:
+                # Nothing goes through: the database is the problem, not the rows
+                raise ImportAborted(str(chunk_error))
+            errors.extend(row_errors)
+            return inserted
+
+    async def run(index, chunk, last_row):
+        try:
+            inserted = await insert_with_fallback(chunk)
+            totals["inserted"] += inserted
+            finished[index] = last_row
+            advance()
+        except ImportAborted as e:
+            state["aborted"] = str(e)
+        finally:
+            semaphore.release()
+
+    chunk = []
+    chunk_index = 0
+    last_row = start_after
+
+    async def dispatch():
+        nonlocal chunk, chunk_index
+        await semaphore.acquire()
+        task = asyncio.create_task(run(chunk_index, chunk, last_row))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        chunk = []
+        chunk_index += 1
+
+    for row_number, row in rows:
+        if row_number <= start_after:
+            continue
+        if state["aborted"]:
+            break
+        last_row = row_number
+        totals["processed"] += 1
+        try:
+            event = validate_row(row)
+        except (ValidationError, ValueError, TypeError) as e:
+            errors.append({"row": row_number, "error": str(e)})
+            continue
+        event["id"] = str(uuid.uuid5(IMPORT_NAMESPACE, f"{batch_id}:{row_number}"))
+        chunk.append((row_number, event))
+        if len(chunk) >= chunk_size:
+            await dispatch()
+
+    if not state["aborted"]:
+        if chunk:
+            await dispatch()
+        else:
+            # Trailing invalid rows are done as soon as everything before them is
+            finished[chunk_index] = last_row
+    if tasks:
+        await asyncio.gather(*tasks)
+    advance()
+
+    errors.sort(key=lambda error: error["row"])
+    return {
+        "batch_id": batch_id,
+        "processed": totals["processed"],
+        "inserted": totals["inserted"],
+        "failed": len(errors),
+        "errors": errors,
+        "checkpoint": state["checkpoint"],
+        "aborted": state["aborted"],
+    }
@@ -0,0 +1,86 @@
+-- Per-event attendance and revenue report used by GET /api/admin/reports/events
+-- Run this in Supabase SQL Editor after supabase_schema.sql
+
+-- total_price is derived from the event price when a booking is written, so
+-- clients can't set it and revenue is a plain SUM.
+CREATE OR REPLACE FUNCTION public.set_booking_total_price()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT price * NEW.quantity INTO NEW.total_price
+    FROM events
+    WHERE id = NEW.event_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS bookings_set_total_price ON bookings;
+CREATE TRIGGER bookings_set_total_price
+    BEFORE INSERT OR UPDATE OF quantity, event_id ON bookings
+    FOR EACH ROW EXECUTE FUNCTION public.set_booking_total_price();
+
+-- Backfill existing bookings
+UPDATE bookings b
+SET total_price = e.price * b.quantity
+FROM events e
+WHERE e.id = b.event_id
+AND b.total_price IS NULL;
+
+-- One row per event. NULL parameters disable their filter; event_ids lets the
+-- API refresh only the events whose cached rows were invalidated.
+-- no_show_rate is only set once the event has started.
+-- Bookings are aggregated per event in a LATERAL subquery, so each selected
+-- event reads only its own bookings through idx_bookings_event_id instead of
+-- the whole table being joined and grouped.
+CREATE OR REPLACE FUNCTION public.event_report(
+    date_from TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    date_to TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    event_ids UUID[] DEFAULT NULL
+)
+RETURNS TABLE (
+    event_id UUID,
+    title TEXT,
+    date TIMESTAMP WITH TIME ZONE,
+    capacity INTEGER,
+    bookings BIGINT,
+    sold BIGINT,
+    confirmed BIGINT,
+    checked_in BIGINT,
+    cancelled BIGINT,
+    no_show_rate NUMERIC,
+    revenue NUMERIC
+) AS $$
+    SELECT
+        e.id,
+        e.title,
+        e.date,
+        e.capacity,
+        s.active,
+        s.sold,
+        s.confirmed,
+        s.checked_in,
+        s.cancelled,
+        CASE
+            WHEN e.date > NOW() THEN NULL
+            WHEN s.active = 0 THEN NULL
+            ELSE ROUND(s.confirmed::NUMERIC / s.active, 4)
+        END,
+        s.revenue
+    FROM events e
+    LEFT JOIN LATERAL (
+        SELECT
+            COUNT(b.id) FILTER (WHERE b.status IS DISTINCT FROM 'cancelled') AS active,
+            COALESCE(SUM(b.quantity) FILTER (WHERE b.status IS DISTINCT FROM 'cancelled'), 0) AS sold,
+            COUNT(b.id) FILTER (WHERE COALESCE(b.status, 'confirmed') = 'confirmed') AS confirmed,
+            COUNT(b.id) FILTER (WHERE b.status = 'checked_in') AS checked_in,
+            COUNT(b.id) FILTER (WHERE b.status = 'cancelled') AS cancelled,
+            COALESCE(SUM(b.total_price) FILTER (WHERE b.status IS DISTINCT FROM 'cancelled'), 0) AS revenue
+        FROM bookings b
+        WHERE b.event_id = e.id
+    ) s ON TRUE
+    WHERE (date_from IS NULL OR e.date >= date_from)
+      AND (date_to IS NULL OR e.date < date_trunc('day', date_to) + INTERVAL '1 day')
+      AND (event_ids IS NULL OR e.id = ANY(event_ids))
+    ORDER BY e.date;
+$$ LANGUAGE sql STABLE;
+
+GRANT EXECUTE ON FUNCTION public.event_report TO service_role;
@@ -0,0 +1,45 @@
+-- Event search: indexes + search_events() used by GET /api/events/search
+-- Run this in Supabase SQL Editor after supabase_schema.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Full-text search over title + description
+CREATE INDEX IF NOT EXISTS idx_events_search
+    ON events USING GIN (to_tsvector('english', title || ' ' || COALESCE(description, '')));
+
+-- Substring matching on location (ILIKE '%...%')
+CREATE INDEX IF NOT EXISTS idx_events_location_trgm
+    ON events USING GIN (location gin_trgm_ops);
+
+-- Price range filter (date ranges use the existing idx_events_date)
+CREATE INDEX IF NOT EXISTS idx_events_price ON events(price);
+
+-- NULL parameters disable their filter. The function is plain SQL and STABLE
+-- so the planner inlines it and the NULL checks fold away, leaving index
+-- conditions on whatever filters were actually given.
+-- date_to is inclusive of the whole day it names. loc matches literally:
+-- % and _ in it are escaped rather than acting as wildcards.
+CREATE OR REPLACE FUNCTION public.search_events(
+    q TEXT DEFAULT NULL,
+    date_from TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    date_to TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    min_price DECIMAL DEFAULT NULL,
+    max_price DECIMAL DEFAULT NULL,
+    loc TEXT DEFAULT NULL,
+    max_results INTEGER DEFAULT 50
+)
+RETURNS SETOF events AS $$
+    SELECT *
+    FROM events
+    WHERE (q IS NULL OR to_tsvector('english', title || ' ' || COALESCE(description, ''))
+                        @@ websearch_to_tsquery('english', q))
+      AND (date_from IS NULL OR date >= date_from)
+      AND (date_to IS NULL OR date < date_trunc('day', date_to) + INTERVAL '1 day')
+      AND (min_price IS NULL OR price >= min_price)
+      AND (max_price IS NULL OR price <= max_price)
+      AND (loc IS NULL OR location ILIKE '%' || replace(replace(replace(loc, '\', '\\'), '%', '\%'), '_', '\_') || '%')
+    ORDER BY date
+    LIMIT max_results;
+$$ LANGUAGE sql STABLE;
+
+GRANT EXECUTE ON FUNCTION public.search_events TO anon, authenticated, service_role;
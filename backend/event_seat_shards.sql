@@ -0,0 +1,525 @@
+-- Sharded seat counters for events with very high booking rates
+-- Run this in Supabase SQL Editor after event_availability.sql, waitlist.sql,
+-- seat_holds.sql and bookings_archive.sql. It replaces track_booked_seats,
+-- track_held_seats and promote_waitlist from those files.
+--
+-- Every booking and hold updates events.booked_count, so all writers for one
+-- event queue on that row's lock. shard_event_seats() splits an event's free
+-- seats over N rows in event_seat_shards instead. A writer takes seats from a
+-- shard that has enough left, starting at a random one and skipping shards
+-- other writers hold, so up to N bookings for the event commit in parallel.
+-- When no single shard has enough seats left but the shards together do, the
+-- writer locks all of them and spreads the free seats evenly again.
+--
+-- Lock order. One transaction can touch an event's shards several times
+-- (cancel_booking releases seats, then promote_waitlist takes them again),
+-- so shard locks follow two rules that keep transactions from deadlocking:
+--   * The event row comes before its shards. Functions that release seats
+--     and then promote waiters lock the event row first.
+--   * A transaction only ever waits for a shard numbered higher than every
+--     shard of the event it already holds. Lower shards are taken with SKIP
+--     LOCKED or not at all. The shards held so far are recorded in the
+--     transaction-local setting app.seat_shard_locks.
+--
+-- Once an event is sharded, booked_count keeps the seats taken before that
+-- and each shard's taken column counts the seats taken (or, when negative,
+-- released) through it since. booked_seats(events) adds them up; PostgREST
+-- exposes it as a computed column (select=*,booked_seats), which the API
+-- uses when SEAT_SHARDS is on. Events that aren't sharded work as before.
+
+ALTER TABLE events ADD COLUMN IF NOT EXISTS seat_shards INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS event_seat_shards (
+    event_id UUID NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+    shard INTEGER NOT NULL,
+    free INTEGER NOT NULL CHECK (free >= 0),
+    taken INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (event_id, shard)
+);
+
+ALTER TABLE event_seat_shards ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.booked_seats(e events)
+RETURNS INTEGER AS $$
+    SELECT e.booked_count + CASE
+        WHEN e.seat_shards > 0 THEN
+            COALESCE((SELECT SUM(s.taken) FROM event_seat_shards s WHERE s.event_id = e.id), 0)::INTEGER
+        ELSE 0
+    END;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- Shards of p_event_id this transaction has locked so far
+CREATE OR REPLACE FUNCTION public.held_seat_shards(p_event_id UUID)
+RETURNS INTEGER[] AS $$
+    SELECT ARRAY(
+        SELECT jsonb_array_elements_text(
+            COALESCE(NULLIF(current_setting('app.seat_shard_locks', true), ''), '{}')::JSONB -> p_event_id::TEXT
+        )::INTEGER
+    );
+$$ LANGUAGE sql VOLATILE;
+
+-- Records shards this transaction locked (p_replace: instead of the ones
+-- recorded so far). A rolled back savepoint undoes both the locks and this.
+CREATE OR REPLACE FUNCTION public.note_seat_shards(p_event_id UUID, p_shards INTEGER[], p_replace BOOLEAN DEFAULT false)
+RETURNS VOID AS $$
+    SELECT set_config(
+        'app.seat_shard_locks',
+        jsonb_set(
+            COALESCE(NULLIF(current_setting('app.seat_shard_locks', true), ''), '{}')::JSONB,
+            ARRAY[p_event_id::TEXT],
+            to_jsonb(ARRAY(
+                SELECT DISTINCT shard
+                FROM unnest(CASE WHEN p_replace THEN p_shards ELSE held_seat_shards(p_event_id) || p_shards END) shard
+                ORDER BY shard
+            ))
+        )::TEXT,
+        true
+    );
+$$ LANGUAGE sql VOLATILE;
+
+-- Locks the first of p_shards that has p_quantity seats free and returns it,
+-- or NULL if there is none. Without p_wait it skips shards other
+-- transactions hold. With p_wait it waits for them, so p_shards must all be
+-- above the shards the transaction holds. A shard can turn out to be short
+-- once it's locked; it stays locked (a row lock can't be given back without
+-- a savepoint, which costs too much on this path) and is recorded like the
+-- others.
+CREATE OR REPLACE FUNCTION public.lock_seat_shard(p_event_id UUID, p_shards INTEGER[], p_quantity INTEGER, p_wait BOOLEAN)
+RETURNS INTEGER AS $$
+DECLARE
+    candidates INTEGER[] := p_shards;
+    picked INTEGER;
+    shard_free INTEGER;
+BEGIN
+    WHILE cardinality(candidates) > 0 LOOP
+        -- Key columns only in the WHERE: with a recheck on free, a row that
+        -- changed since the snapshot could stay locked without being returned
+        IF p_wait THEN
+            picked := candidates[1];
+            SELECT s.free INTO shard_free FROM event_seat_shards s
+            WHERE s.event_id = p_event_id AND s.shard = picked
+            FOR UPDATE;
+        ELSE
+            SELECT s.shard, s.free INTO picked, shard_free FROM event_seat_shards s
+            WHERE s.event_id = p_event_id AND s.shard = ANY(candidates)
+            ORDER BY array_position(candidates, s.shard)
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED;
+            IF NOT FOUND THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+
+        IF FOUND THEN
+            PERFORM note_seat_shards(p_event_id, ARRAY[picked]);
+            IF shard_free >= p_quantity THEN
+                RETURN picked;
+            END IF;
+        END IF;
+
+        IF p_wait THEN
+            -- Now that picked is held, only higher shards may be waited for
+            candidates := ARRAY(
+                SELECT c FROM unnest(candidates) WITH ORDINALITY AS t(c, i)
+                WHERE c > picked ORDER BY i
+            );
+        ELSE
+            candidates := array_remove(candidates, picked);
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Locks every shard of the event that this transaction can lock without
+-- breaking the lock order: the ones above those it holds, waiting for them
+-- in shard order, and the ones below only if nobody else holds them.
+-- Returns all the shards it now holds.
+CREATE OR REPLACE FUNCTION public.lock_seat_shards(p_event_id UUID)
+RETURNS INTEGER[] AS $$
+DECLARE
+    held INTEGER[] := held_seat_shards(p_event_id);
+    highest INTEGER := COALESCE((SELECT MAX(h) FROM unnest(held) h), -1);
+BEGIN
+    held := held || ARRAY(
+        SELECT s.shard FROM event_seat_shards s
+        WHERE s.event_id = p_event_id AND s.shard > highest
+        ORDER BY s.shard
+        FOR UPDATE
+    );
+    held := held || ARRAY(
+        SELECT s.shard FROM event_seat_shards s
+        WHERE s.event_id = p_event_id AND s.shard < highest AND NOT s.shard = ANY(held)
+        ORDER BY s.shard
+        FOR UPDATE SKIP LOCKED
+    );
+    PERFORM note_seat_shards(p_event_id, held);
+    RETURN held_seat_shards(p_event_id);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Sets every shard's free seats so they add up to what the event has left,
+-- spread as evenly as possible, with p_take seats taken from shard 0 first.
+-- The caller holds the locks on all of the event's shards.
+CREATE OR REPLACE FUNCTION public.spread_seat_shards(p_event_id UUID, p_take INTEGER DEFAULT 0)
+RETURNS VOID AS $$
+DECLARE
+    shards INTEGER;
+    remaining INTEGER;
+BEGIN
+    SELECT COUNT(*), MAX(e.capacity - e.booked_count) - COALESCE(SUM(s.taken), 0) - p_take
+    INTO shards, remaining
+    FROM event_seat_shards s
+    JOIN events e ON e.id = s.event_id
+    WHERE s.event_id = p_event_id;
+
+    remaining := GREATEST(remaining, 0);
+
+    UPDATE event_seat_shards s
+    SET free = remaining / shards + CASE WHEN s.shard < remaining % shards THEN 1 ELSE 0 END,
+        taken = s.taken + CASE WHEN s.shard = 0 THEN p_take ELSE 0 END
+    WHERE s.event_id = p_event_id;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Splits an event's seats over p_shards counters (re-sharding if it already
+-- is sharded). p_shards = 0 folds the shards back into booked_count.
+CREATE OR REPLACE FUNCTION public.shard_event_seats(p_event_id UUID, p_shards INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    IF p_shards < 0 THEN
+        RAISE EXCEPTION 'p_shards must be 0 or more';
+    END IF;
+
+    -- Writers on the unsharded path update this row, so they wait here.
+    -- NO KEY keeps booking inserts' foreign key checks from waiting too.
+    PERFORM 1 FROM events WHERE id = p_event_id FOR NO KEY UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Event not found' USING ERRCODE = 'no_data_found';
+    END IF;
+
+    PERFORM lock_seat_shards(p_event_id);
+
+    UPDATE events e
+    SET booked_count = e.booked_count
+            + COALESCE((SELECT SUM(s.taken) FROM event_seat_shards s WHERE s.event_id = e.id), 0),
+        seat_shards = p_shards
+    WHERE e.id = p_event_id;
+
+    DELETE FROM event_seat_shards WHERE event_id = p_event_id;
+
+    IF p_shards > 0 THEN
+        INSERT INTO event_seat_shards (event_id, shard, free)
+        SELECT p_event_id, g, 0 FROM generate_series(0, p_shards - 1) g;
+        PERFORM spread_seat_shards(p_event_id);
+    END IF;
+    -- The new rows aren't visible to anyone else until commit
+    PERFORM note_seat_shards(p_event_id, ARRAY(SELECT generate_series(0, p_shards - 1)), true);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Spreads the free seats evenly again, e.g. after the capacity changed
+CREATE OR REPLACE FUNCTION public.rebalance_seat_shards(p_event_id UUID)
+RETURNS VOID AS $$
+DECLARE
+    shards INTEGER;
+BEGIN
+    SELECT seat_shards INTO shards FROM events WHERE id = p_event_id;
+    IF shards > 0 THEN
+        -- Capacity edits normally run before the transaction takes any of
+        -- the event's seats, so this gets every shard in shard order
+        IF cardinality(lock_seat_shards(p_event_id)) < shards THEN
+            PERFORM 1 FROM event_seat_shards WHERE event_id = p_event_id ORDER BY shard FOR UPDATE;
+        END IF;
+        PERFORM spread_seat_shards(p_event_id);
+    END IF;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION public.take_event_seats(p_event_id UUID, p_quantity INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    shards INTEGER;
+    held INTEGER[];
+    highest INTEGER;
+    first_shard INTEGER;
+    candidate INTEGER;
+    shard_free INTEGER;
+    picked INTEGER;
+    total_free INTEGER;
+    needed INTEGER;
+BEGIN
+    LOOP
+        -- Not sharded: the single counter on the event row, as before
+        UPDATE events
+        SET booked_count = booked_count + p_quantity
+        WHERE id = p_event_id
+        AND seat_shards = 0
+        AND booked_count + p_quantity <= capacity;
+
+        IF FOUND THEN
+            RETURN;
+        END IF;
+
+        SELECT seat_shards INTO shards FROM events WHERE id = p_event_id;
+        IF shards IS NULL OR shards = 0 THEN
+            RAISE EXCEPTION 'Not enough capacity' USING ERRCODE = 'check_violation';
+        END IF;
+
+        held := held_seat_shards(p_event_id);
+        highest := COALESCE((SELECT MAX(h) FROM unnest(held) h), -1);
+        picked := NULL;
+
+        -- A shard this transaction already holds, e.g. the one a cancellation
+        -- just released seats into
+        SELECT s.shard INTO picked
+        FROM event_seat_shards s
+        WHERE s.event_id = p_event_id AND s.shard = ANY(held) AND s.free >= p_quantity
+        ORDER BY s.shard
+        LIMIT 1;
+
+        -- A shard with enough seats that nobody else holds, starting at a
+        -- random one
+        IF picked IS NULL THEN
+            first_shard := floor(random() * shards)::INTEGER;
+            picked := lock_seat_shard(p_event_id, ARRAY(
+                SELECT s.shard FROM event_seat_shards s
+                WHERE s.event_id = p_event_id AND s.free >= p_quantity AND NOT s.shard = ANY(held)
+                ORDER BY (s.shard + shards - first_shard) % shards
+            ), p_quantity, false);
+        END IF;
+
+        -- All of them are busy: wait for one that still has enough, but only
+        -- above the shards already held. Waiters start at a random one too,
+        -- so they don't all queue on the same shard.
+        IF picked IS NULL THEN
+            picked := lock_seat_shard(p_event_id, ARRAY(
+                SELECT s.shard FROM event_seat_shards s
+                WHERE s.event_id = p_event_id AND s.free >= p_quantity AND s.shard > highest
+                ORDER BY (s.shard + shards - first_shard) % shards
+            ), p_quantity, true);
+        END IF;
+
+        IF picked IS NOT NULL THEN
+            UPDATE event_seat_shards
+            SET free = free - p_quantity, taken = taken + p_quantity
+            WHERE event_id = p_event_id AND shard = picked;
+            RETURN;
+        END IF;
+
+        -- No shard has enough on its own: pool what's left
+        held := lock_seat_shards(p_event_id);
+        IF cardinality(held) = 0 THEN
+            -- Unsharded in the meantime: go round again
+            CONTINUE;
+        END IF;
+
+        SELECT COALESCE(SUM(s.free), 0) INTO total_free
+        FROM event_seat_shards s
+        WHERE s.event_id = p_event_id AND s.shard = ANY(held);
+        IF total_free < p_quantity THEN
+            -- Also when shards below the ones already held were busy: waiting
+            -- for those could deadlock, so the caller sees the event as full
+            RAISE EXCEPTION 'Not enough capacity' USING ERRCODE = 'check_violation';
+        END IF;
+
+        IF cardinality(held) = shards THEN
+            PERFORM spread_seat_shards(p_event_id, p_quantity);
+        ELSE
+            -- Only some shards are held: take from them in shard order
+            needed := p_quantity;
+            FOR candidate, shard_free IN
+                SELECT s.shard, s.free FROM event_seat_shards s
+                WHERE s.event_id = p_event_id AND s.shard = ANY(held) AND s.free > 0
+                ORDER BY s.shard
+            LOOP
+                UPDATE event_seat_shards
+                SET free = free - LEAST(shard_free, needed), taken = taken + LEAST(shard_free, needed)
+                WHERE event_id = p_event_id AND shard = candidate;
+                needed := needed - LEAST(shard_free, needed);
+                EXIT WHEN needed = 0;
+            END LOOP;
+        END IF;
+        RETURN;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION public.release_event_seats(p_event_id UUID, p_quantity INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    shards INTEGER;
+    held INTEGER[];
+    first_shard INTEGER;
+    picked INTEGER;
+BEGIN
+    LOOP
+        UPDATE events
+        SET booked_count = booked_count - p_quantity
+        WHERE id = p_event_id
+        AND seat_shards = 0;
+
+        IF FOUND THEN
+            RETURN;
+        END IF;
+
+        SELECT seat_shards INTO shards FROM events WHERE id = p_event_id;
+        IF shards IS NULL OR shards = 0 THEN
+            -- The event is gone
+            RETURN;
+        END IF;
+
+        -- Released seats can go to any shard: one already held, else one
+        -- nobody holds, else wait for one (nothing is held yet, so any shard
+        -- keeps the lock order)
+        held := held_seat_shards(p_event_id);
+        SELECT s.shard INTO picked
+        FROM event_seat_shards s
+        WHERE s.event_id = p_event_id AND s.shard = ANY(held)
+        ORDER BY s.shard
+        LIMIT 1;
+
+        IF NOT FOUND THEN
+            first_shard := floor(random() * shards)::INTEGER;
+            SELECT s.shard INTO picked
+            FROM event_seat_shards s
+            WHERE s.event_id = p_event_id
+            ORDER BY (s.shard + shards - first_shard) % shards
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED;
+        END IF;
+
+        IF NOT FOUND THEN
+            SELECT s.shard INTO picked
+            FROM event_seat_shards s
+            WHERE s.event_id = p_event_id AND s.shard = first_shard
+            FOR UPDATE;
+        END IF;
+
+        IF FOUND THEN
+            PERFORM note_seat_shards(p_event_id, ARRAY[picked]);
+            UPDATE event_seat_shards
+            SET free = free + p_quantity, taken = taken - p_quantity
+            WHERE event_id = p_event_id AND shard = picked;
+            RETURN;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Same rules as in event_availability.sql, with the counter updates going
+-- through take_event_seats / release_event_seats
+CREATE OR REPLACE FUNCTION public.track_booked_seats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('app.archiving', true) = 'on' THEN
+        RETURN COALESCE(NEW, OLD);
+    END IF;
+
+    IF TG_OP = 'UPDATE'
+        AND NEW.event_id = OLD.event_id
+        AND NEW.quantity = OLD.quantity
+        AND (COALESCE(NEW.status, '') = 'cancelled') = (COALESCE(OLD.status, '') = 'cancelled') THEN
+        RETURN NEW;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') AND COALESCE(OLD.status, '') <> 'cancelled' THEN
+        PERFORM release_event_seats(OLD.event_id, OLD.quantity);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND COALESCE(NEW.status, '') <> 'cancelled' THEN
+        PERFORM take_event_seats(NEW.event_id, NEW.quantity);
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Same as in seat_holds.sql
+CREATE OR REPLACE FUNCTION public.track_held_seats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM release_event_seats(OLD.event_id, OLD.quantity);
+        RETURN OLD;
+    END IF;
+
+    PERFORM take_event_seats(NEW.event_id, NEW.quantity);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Capacity edits on a sharded event resize its shards
+CREATE OR REPLACE FUNCTION public.resize_seat_shards()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.seat_shards > 0 AND NEW.capacity IS DISTINCT FROM OLD.capacity THEN
+        PERFORM rebalance_seat_shards(NEW.id);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS events_resize_seat_shards ON events;
+CREATE TRIGGER events_resize_seat_shards
+    AFTER UPDATE OF capacity ON events
+    FOR EACH ROW EXECUTE FUNCTION public.resize_seat_shards();
+
+-- As in waitlist.sql, with free seats from booked_seats() so sharded events
+-- promote waiters too
+CREATE OR REPLACE FUNCTION public.promote_waitlist(p_event_id UUID)
+RETURNS TABLE (waitlist_id BIGINT, booking_id UUID, user_id UUID, quantity INTEGER) AS $$
+DECLARE
+    free_seats INTEGER;
+    waiter waitlist%ROWTYPE;
+    new_booking_id UUID;
+BEGIN
+    -- Serializes promotions per event. Bookings for a sharded event don't
+    -- wait for this lock, so a promotion can still find the seats gone.
+    -- Callers that released seats first took this lock before doing so.
+    SELECT e.capacity - booked_seats(e) INTO free_seats
+    FROM events e
+    WHERE e.id = p_event_id
+    FOR NO KEY UPDATE;
+
+    LOOP
+        EXIT WHEN free_seats IS NULL OR free_seats <= 0;
+
+        SELECT * INTO waiter
+        FROM waitlist w
+        WHERE w.event_id = p_event_id AND w.status = 'waiting'
+        ORDER BY w.id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED;
+
+        EXIT WHEN NOT FOUND OR waiter.quantity > free_seats;
+
+        BEGIN
+            INSERT INTO bookings (event_id, user_id, quantity, status)
+            VALUES (p_event_id, waiter.user_id, waiter.quantity, 'confirmed')
+            RETURNING id INTO new_booking_id;
+        EXCEPTION WHEN check_violation THEN
+            -- Taken by a concurrent booking; the waiter stays first in line
+            EXIT;
+        END;
+
+        UPDATE waitlist w
+        SET status = 'promoted', booking_id = new_booking_id, promoted_at = NOW()
+        WHERE w.id = waiter.id;
+
+        free_seats := free_seats - waiter.quantity;
+        waitlist_id := waiter.id;
+        booking_id := new_booking_id;
+        user_id := waiter.user_id;
+        quantity := waiter.quantity;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+GRANT EXECUTE ON FUNCTION public.booked_seats TO anon, authenticated, service_role;
+GRANT EXECUTE ON FUNCTION public.shard_event_seats TO service_role;
+GRANT EXECUTE ON FUNCTION public.rebalance_seat_shards TO service_role;
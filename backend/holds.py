@@ -0,0 +1,102 @@
+"""In-process expiry for seat holds (see seat_holds.sql).
+
+Each hold created by this process is pushed onto a min-heap keyed by its
+deadline. One task sleeps until the earliest deadline, pops everything that
+is due and expires it in batches, so the cost is O(log n) per hold and
+nothing scans the holds table on a timer. Confirmed or released holds are
+dropped lazily when they reach the top of the heap; only ids that are in the
+heap are remembered for that, so memory stays bounded by the scheduled holds.
+
+Holds owned by a process that restarted are found again through the
+indexed ``expires_at`` column: ``recover`` loads the ones still running and
+``sweep`` releases any already past their deadline.
+"""
+import asyncio
+import heapq
+import time
+
+import metrics
+
+
+class HoldExpiry:
+    def __init__(self, expire_batch, batch_size=1000, grace=1.0, sweep_interval=60.0):
+        # expire_batch: async callable taking a list of hold ids, or None to
+        # release every expired hold in the table
+        self.expire_batch = expire_batch
+        self.batch_size = batch_size
+        self.grace = grace
+        self.sweep_interval = sweep_interval
+        self._heap = []
+        self._scheduled = set()
+        self._done = set()
+        self._changed = None
+        metrics.register_gauge("holds.scheduled", lambda: len(self._scheduled) - len(self._done))
+
+    def add(self, hold_id, expires_at):
+        # expires_at: unix timestamp
+        heapq.heappush(self._heap, (expires_at, hold_id))
+        self._scheduled.add(hold_id)
+        self._done.discard(hold_id)
+        if self._changed is not None and self._heap[0][1] == hold_id:
+            self._changed.set()
+
+    def discard(self, hold_id):
+        # Holds scheduled by another process are none of this heap's business
+        if hold_id in self._scheduled:
+            self._done.add(hold_id)
+
+    def recover(self, holds):
+        for hold_id, expires_at in holds:
+            if hold_id not in self._scheduled:
+                heapq.heappush(self._heap, (expires_at, hold_id))
+                self._scheduled.add(hold_id)
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] + self.grace <= now and len(due) < self.batch_size:
+            _, hold_id = heapq.heappop(self._heap)
+            self._scheduled.discard(hold_id)
+            if hold_id in self._done:
+                self._done.discard(hold_id)
+                continue
+            due.append(hold_id)
+        return due
+
+    async def sweep(self):
+        try:
+            await self.expire_batch(None)
+        except Exception as e:
+            print(f"Hold sweep failed: {str(e)}")
+
+    async def run(self):
+        self._changed = asyncio.Event()
+        last_sweep = time.time()
+        while True:
+            now = time.time()
+            due = self._pop_due(now)
+            if due:
+                try:
+                    await self.expire_batch(due)
+                    metrics.inc("holds.expired", len(due))
+                except Exception as e:
+                    # Put them back; the next pass retries
+                    print(f"Expiring {len(due)} holds failed: {str(e)}")
+                    for hold_id in due:
+                        heapq.heappush(self._heap, (now, hold_id))
+                        self._scheduled.add(hold_id)
+                    await asyncio.sleep(1.0)
+                continue
+
+            if now - last_sweep >= self.sweep_interval:
+                # Catches holds from other processes that died before expiring them
+                last_sweep = now
+                await self.sweep()
+
+            timeout = self.sweep_interval - (now - last_sweep)
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] + self.grace - now)
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=max(timeout, 0.01))
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
@@ -0,0 +1,301 @@
+"""Idempotency-Key support for write endpoints, as an ASGI middleware.
+
+A client that retries a write sends the same ``Idempotency-Key`` header as
+the first attempt. The first request runs normally and its response is
+stored; a retry gets that stored response back (with
+``Idempotent-Replayed: true``) without reaching the endpoint, so there is no
+duplicate check and no second insert. A duplicate that arrives while the
+first attempt is still running waits for it.
+
+Keys are scoped by method, path and caller and bound to a hash of the
+request body; reusing a key for a different body gets a 422. The caller is
+the user id ``identify`` returns after verifying the token, so a replay
+never goes to someone who merely claims another user's id. Requests it
+can't identify pass through untouched and fail in the endpoint's auth.
+
+Only successful and deterministic error responses are stored. 5xx, 401,
+403, 408 and 429 depend on the moment (an expired token, an empty rate limit
+bucket, an outage), so retrying after one of those runs the request again.
+
+Stored responses live in an in-process LRU with a TTL. With several workers,
+``DatabaseIdempotencyStore`` also keeps them in the idempotency_keys table
+(see idempotency.sql), which makes the key claim atomic across processes.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+
+import metrics
+
+PENDING = "pending"
+DONE = "done"
+
+# Error statuses that a retry of the same request would get again
+STORED_ERRORS = {400, 404, 409, 422}
+
+
+def storable(status):
+    return 200 <= status < 300 or status in STORED_ERRORS
+
+
+class MemoryIdempotencyStore:
+    def __init__(self, ttl=86400, max_keys=100_000):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._records = OrderedDict()
+
+    def _get(self, key):
+        item = self._records.get(key)
+        if item is None:
+            return None
+        expires_at, record = item
+        if expires_at < time.time():
+            del self._records[key]
+            return None
+        return record
+
+    def _set(self, key, record):
+        self._records[key] = (time.time() + self.ttl, record)
+        self._records.move_to_end(key)
+        while len(self._records) > self.max_keys:
+            self._records.popitem(last=False)
+
+    async def get(self, key):
+        return self._get(key)
+
+    async def claim(self, key, fingerprint):
+        if self._get(key) is not None:
+            return False
+        self._set(key, {"state": PENDING, "fingerprint": fingerprint})
+        return True
+
+    async def complete(self, key, record):
+        self._set(key, record)
+
+    async def release(self, key):
+        self._records.pop(key, None)
+
+
+class DatabaseIdempotencyStore(MemoryIdempotencyStore):
+    # Memory first, then the idempotency_keys table. ``client`` is a
+    # supabase client; its calls are blocking and run in worker threads.
+
+    def __init__(self, client, table="idempotency_keys", ttl=86400, max_keys=100_000):
+        super().__init__(ttl, max_keys)
+        self.client = client
+        self.table = table
+
+    async def get(self, key):
+        record = self._get(key)
+        if record is not None and record["state"] == DONE:
+            return record
+        response = await asyncio.to_thread(
+            lambda: self.client.table(self.table).select("*").eq("key", key).gt("expires_at", _iso(time.time())).execute()
+        )
+        if not response.data:
+            return record
+        row = response.data[0]
+        record = {
+            "state": row["state"],
+            "fingerprint": row["fingerprint"],
+            "status": row["response_status"],
+            "headers": row["response_headers"],
+            "body": row["response_body"],
+        }
+        if record["state"] == DONE:
+            self._set(key, record)
+        return record
+
+    async def claim(self, key, fingerprint):
+        if not await super().claim(key, fingerprint):
+            return False
+        # The primary key makes exactly one worker win the claim
+        try:
+            await asyncio.to_thread(
+                lambda: self.client.table(self.table).insert({
+                    "key": key,
+                    "fingerprint": fingerprint,
+                    "state": PENDING,
+                    "expires_at": _iso(time.time() + self.ttl),
+                }).execute()
+            )
+        except Exception as e:
+            if "duplicate key" not in str(e):
+                await super().release(key)
+                raise
+            existing = await self.get(key)
+            if existing is not None:
+                await super().release(key)
+                return False
+            # The row was expired: take it over, unless another worker just did
+            response = await asyncio.to_thread(
+                lambda: self.client.table(self.table).update({
+                    "fingerprint": fingerprint,
+                    "state": PENDING,
+                    "response_status": None,
+                    "response_headers": None,
+                    "response_body": None,
+                    "expires_at": _iso(time.time() + self.ttl),
+                }).eq("key", key).lte("expires_at", _iso(time.time())).execute()
+            )
+            if not response.data:
+                await super().release(key)
+                return False
+        return True
+
+    async def complete(self, key, record):
+        await super().complete(key, record)
+        await asyncio.to_thread(
+            lambda: self.client.table(self.table).update({
+                "state": DONE,
+                "response_status": record["status"],
+                "response_headers": record["headers"],
+                "response_body": record["body"],
+            }).eq("key", key).execute()
+        )
+
+    async def release(self, key):
+        await super().release(key)
+        await asyncio.to_thread(
+            lambda: self.client.table(self.table).delete().eq("key", key).eq("state", PENDING).execute()
+        )
+
+
+def _iso(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, paths, identify, store=None, wait_timeout=30.0, poll_interval=0.2):
+        # paths: (method, path regex) pairs that honour Idempotency-Key.
+        # identify: async fn(scope) -> verified user id, or None
+        self.app = app
+        self.identify = identify
+        self.paths = [(method, re.compile(pattern)) for method, pattern in paths]
+        self.store = store or MemoryIdempotencyStore()
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._inflight = {}
+
+    def _applies(self, method, path):
+        return any(m == method and pattern.fullmatch(path) for m, pattern in self.paths)
+
+    @staticmethod
+    def _header(scope, name):
+        for key, value in scope.get("headers", []):
+            if key == name:
+                return value.decode("latin-1")
+        return None
+
+    async def _respond(self, send, status, headers, body, replayed=False):
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+        if replayed:
+            headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body.encode("latin-1")})
+
+    async def _error(self, send, status, detail):
+        body = json.dumps({"detail": detail})
+        await self._respond(send, status, [("content-type", "application/json")], body)
+
+    async def _replay(self, record, fingerprint, send):
+        if record["fingerprint"] != fingerprint:
+            return await self._error(send, 422, "Idempotency-Key was already used with a different request")
+        metrics.inc("idempotency.replayed")
+        await self._respond(send, record["status"], record["headers"], record["body"], replayed=True)
+
+    async def _wait_for(self, key):
+        # Another worker holds the claim: poll the shared store until it finishes
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            record = await self.store.get(key)
+            if record is None or record["state"] == DONE:
+                return record
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._applies(scope["method"], scope["path"]):
+            return await self.app(scope, receive, send)
+        idempotency_key = self._header(scope, b"idempotency-key")
+        if not idempotency_key:
+            return await self.app(scope, receive, send)
+        if len(idempotency_key) > 255:
+            return await self._error(send, 400, "Idempotency-Key is too long")
+        caller = await self.identify(scope)
+        if caller is None:
+            return await self.app(scope, receive, send)
+
+        # The body is needed for the fingerprint, then replayed to the app
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        fingerprint = hashlib.sha256(
+            scope["method"].encode() + scope["path"].encode() + scope.get("query_string", b"") + body
+        ).hexdigest()
+        key = hashlib.sha256(
+            f"{scope['method']} {scope['path']}|{caller}|{idempotency_key}".encode()
+        ).hexdigest()
+
+        while True:
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                # Concurrent duplicate in this process: wait for the first attempt
+                metrics.inc("idempotency.waited")
+                await asyncio.shield(inflight)
+            record = await self.store.get(key)
+            if record is not None and record["state"] == DONE:
+                return await self._replay(record, fingerprint, send)
+            if record is not None and record["fingerprint"] != fingerprint:
+                return await self._error(send, 422, "Idempotency-Key was already used with a different request")
+            if inflight is None and await self.store.claim(key, fingerprint):
+                break
+            if inflight is None:
+                record = await self._wait_for(key)
+                if record is not None:
+                    return await self._replay(record, fingerprint, send)
+                if await self.store.get(key) is not None:
+                    return await self._error(send, 409, "A request with this Idempotency-Key is still in progress")
+
+        done = asyncio.get_running_loop().create_future()
+        self._inflight[key] = done
+        response = {"status": None, "headers": [], "body": []}
+
+        async def replay_body():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    (k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", [])
+                ]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture)
+        finally:
+            try:
+                if response["status"] is not None and storable(response["status"]):
+                    await self.store.complete(key, {
+                        "state": DONE,
+                        "fingerprint": fingerprint,
+                        "status": response["status"],
+                        "headers": response["headers"],
+                        "body": b"".join(response["body"]).decode("latin-1"),
+                    })
+                    metrics.inc("idempotency.stored")
+                else:
+                    await self.store.release(key)
+            finally:
+                del self._inflight[key]
+                done.set_result(None)
@@ -0,0 +1,38 @@
+-- Stored responses for Idempotency-Key retries (see idempotency.py)
+-- Run this in Supabase SQL Editor, then set IDEMPOTENCY_TABLE=idempotency_keys
+-- so every API worker shares the same keys.
+--
+-- "key" is a hash of method, path, caller and the client's Idempotency-Key.
+-- A row is 'pending' while the first attempt runs and 'done' once its
+-- response is stored; the primary key is what makes the claim atomic.
+
+CREATE TABLE IF NOT EXISTS public.idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending' CHECK (state IN ('pending', 'done')),
+    response_status INTEGER,
+    response_headers JSONB,
+    response_body TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON public.idempotency_keys(expires_at);
+
+-- Only the API (service role) reads and writes this table
+ALTER TABLE public.idempotency_keys ENABLE ROW LEVEL SECURITY;
+
+-- Expired rows are ignored by the API; this clears them out
+CREATE OR REPLACE FUNCTION public.purge_idempotency_keys()
+RETURNS INTEGER AS $$
+DECLARE
+    deleted INTEGER;
+BEGIN
+    DELETE FROM public.idempotency_keys WHERE expires_at < NOW();
+    GET DIAGNOSTICS deleted = ROW_COUNT;
+    RETURN deleted;
+END;
+$$ LANGUAGE plpgsql;
+
+-- With pg_cron enabled:
+-- SELECT cron.schedule('purge-idempotency-keys', '*/15 * * * *', 'SELECT public.purge_idempotency_keys()');
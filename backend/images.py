@@ -0,0 +1,162 @@
+"""Resized image variants for event cards.
+
+When an event is created or imported, its ``image_url`` is downloaded once
+and re-encoded as WebP (and AVIF when the installed Pillow supports it) at a
+few widths. Variants are stored under keys derived from a hash of the source
+bytes, so an image shared by many events, or re-processed later, is only
+encoded once, and the keys can be cached forever by browsers and CDNs.
+
+Storage is pluggable through ``ImageStorage``; ``LocalImageStorage`` writes
+to a directory served by the API under /media.
+"""
+import asyncio
+import hashlib
+import io
+import os
+from abc import ABC, abstractmethod
+
+import httpx
+
+import metrics
+from singleflight import SingleFlight
+
+VARIANT_WIDTHS = [320, 640, 1280]
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+
+
+class ImageStorage(ABC):
+    @abstractmethod
+    def exists(self, key):
+        ...
+
+    @abstractmethod
+    def put(self, key, data, content_type):
+        ...
+
+    @abstractmethod
+    def url(self, key):
+        ...
+
+
+class LocalImageStorage(ImageStorage):
+    def __init__(self, root, base_url):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, key, data, content_type):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def url(self, key):
+        return f"{self.base_url}/{key}"
+
+
+def _formats():
+    from PIL import features
+
+    formats = [("webp", "WEBP")]
+    if features.check("avif"):
+        formats.append(("avif", "AVIF"))
+    return formats
+
+
+def render_variants(source, storage):
+    """Encode every missing variant of ``source`` bytes and return their URLs.
+
+    Returns ``{"webp": {"320": url, ...}, "avif": {...}}``.
+    """
+    from PIL import Image, ImageOps
+
+    digest = hashlib.sha256(source).hexdigest()[:24]
+    formats = _formats()
+    keys = {
+        (ext, width): f"{digest[:2]}/{digest}/{width}.{ext}"
+        for ext, _ in formats
+        for width in VARIANT_WIDTHS
+    }
+
+    missing = [(ext, width) for (ext, width), key in keys.items() if not storage.exists(key)]
+    if missing:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(source)))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        pillow_formats = dict(formats)
+        for ext, width in missing:
+            resized = image.copy()
+            # thumbnail() keeps the aspect ratio and never upscales
+            resized.thumbnail((width, width * 4), Image.LANCZOS)
+            out = io.BytesIO()
+            resized.save(out, pillow_formats[ext], quality=80)
+            storage.put(keys[(ext, width)], out.getvalue(), f"image/{ext}")
+            metrics.inc("images.variants_encoded")
+
+    variants = {}
+    for (ext, width), key in keys.items():
+        variants.setdefault(ext, {})[str(width)] = storage.url(key)
+    return variants
+
+
+def fetch_source(image_url, timeout=10.0):
+    with httpx.stream("GET", image_url, timeout=timeout, follow_redirects=True) as response:
+        response.raise_for_status()
+        data = bytearray()
+        for block in response.iter_bytes():
+            data.extend(block)
+            if len(data) > MAX_SOURCE_BYTES:
+                raise ValueError("Image too large")
+    return bytes(data)
+
+
+class ImagePipeline:
+    # Runs variant generation in worker threads, at most ``concurrency`` at a
+    # time, and hands the result to ``on_done(event_id, variants)``.
+
+    def __init__(self, storage, on_done, concurrency=2):
+        self.storage = storage
+        self.on_done = on_done
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._by_url = {}
+        self._flight = SingleFlight("images")
+        self._tasks = set()
+
+    async def variants_for(self, image_url):
+        # Many imported events share one image; download and encode it once
+        if image_url in self._by_url:
+            metrics.inc("images.url_cache_hits")
+            return self._by_url[image_url]
+        return await self._flight.do(image_url, lambda: self._render(image_url))
+
+    async def _render(self, image_url):
+        async with self._semaphore:
+            source = await asyncio.to_thread(fetch_source, image_url)
+            variants = await asyncio.to_thread(render_variants, source, self.storage)
+        if len(self._by_url) > 10_000:
+            self._by_url.clear()
+        self._by_url[image_url] = variants
+        return variants
+
+    async def _process(self, event_id, image_url):
+        try:
+            variants = await self.variants_for(image_url)
+            await self.on_done(event_id, variants)
+        except Exception as e:
+            metrics.inc("images.failed")
+            print(f"Image processing failed for event {event_id}: {str(e)}")
+
+    def schedule(self, event_id, image_url):
+        if not image_url or not image_url.startswith(("http://", "https://")):
+            return
+        task = asyncio.create_task(self._process(event_id, image_url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
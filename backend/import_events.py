@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import json
+import os
+from dotenv import load_dotenv
+from supabase import create_client
+from event_import import batch_id_for, read_rows, import_events
+
+# Load environment variables
+load_dotenv()
+
+# Usage:
+#   python import_events.py venues.csv
+#   python import_events.py events.jsonl --chunk-size 1000 --concurrency 8
+# Progress is saved to <file>.checkpoint; run the same command again to
+# resume after a failure.
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import events from CSV or JSONL")
+    parser.add_argument("path", help="CSV (with a header row) or JSONL file")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <path>.checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")  # Using service role key for admin access
+
+    if not supabase_url or not supabase_key:
+        print("Error: SUPABASE_URL and SUPABASE_KEY must be set in .env file")
+        exit(1)
+
+    supabase = create_client(supabase_url, supabase_key)
+
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".ndjson")) else "csv")
+    checkpoint_path = args.checkpoint or f"{args.path}.checkpoint"
+
+    with open(args.path, "rb") as f:
+        batch_id = batch_id_for(f)
+
+        start_after = 0
+        if os.path.exists(checkpoint_path) and not args.restart:
+            with open(checkpoint_path) as cp:
+                saved = json.load(cp)
+            if saved.get("batch_id") == batch_id:
+                start_after = saved["row"]
+                print(f"Resuming after row {start_after}")
+            else:
+                print("Checkpoint belongs to a different file version, starting over")
+
+        def save_checkpoint(row):
+            tmp = f"{checkpoint_path}.tmp"
+            with open(tmp, "w") as cp:
+                json.dump({"batch_id": batch_id, "row": row}, cp)
+            os.replace(tmp, checkpoint_path)
+
+        async def insert_chunk(events):
+            await asyncio.to_thread(
+                lambda: supabase.table("events")
+                .upsert(events, on_conflict="id", ignore_duplicates=True)
+                .execute()
+            )
+
+        result = asyncio.run(import_events(
+            read_rows(f, fmt),
+            insert_chunk,
+            batch_id,
+            chunk_size=args.chunk_size,
+            concurrency=args.concurrency,
+            start_after=start_after,
+            on_checkpoint=save_checkpoint
+        ))
+
+    for error in result["errors"]:
+        print(f"  ❌ Row {error['row']}: {error['error']}")
+
+    if result["aborted"]:
+        print(f"❌ Import stopped after row {result['checkpoint']}: {result['aborted']}")
+        print("Run the same command again to resume.")
+        exit(1)
+
+    print(f"✅ Imported {result['inserted']} of {result['processed']} rows ({result['failed']} failed)")
+
+if __name__ == "__main__":
+    main()
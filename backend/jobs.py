@@ -0,0 +1,211 @@
+"""In-process background job queue with a durable SQLite backing.
+
+``enqueue`` writes the job to SQLite (in a worker thread, so a busy database
+file never blocks the event loop) and returns, so request handlers only pay
+for one local insert. Worker tasks claim due jobs, run the
+registered handler and delete the job on success. Failures are retried with
+exponential backoff; after ``max_attempts`` the job moves to the dead-letter
+table. Jobs survive restarts, and a job claimed by a process that crashed
+becomes runnable again once its lease expires. Several API workers can
+share one queue file.
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at REAL NOT NULL,
+    enqueued_at REAL NOT NULL,
+    locked_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_run_at ON jobs(run_at);
+CREATE TABLE IF NOT EXISTS dead_jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    failed_at REAL NOT NULL
+);
+"""
+
+
+class JobQueue:
+    def __init__(self, path, concurrency=4, max_attempts=5, backoff=2.0, lease=300.0, poll_interval=1.0):
+        self.path = path
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._handlers = {}
+        self._local = threading.local()
+        self._wakeup = None
+        self._workers = []
+        self._stats = {"pending": 0, "oldest_due": None, "dead": 0}
+        self._stats_at = 0.0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection().executescript(SCHEMA)
+        self._refresh_stats()
+        metrics.register_gauge("jobs.pending", self.pending)
+        metrics.register_gauge("jobs.lag_seconds", self.lag)
+        metrics.register_gauge("jobs.dead", self.dead_count)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def handler(self, kind):
+        """Register an async handler: ``@queue.handler("send_confirmation")``."""
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    def _insert(self, kind, payload, delay):
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO jobs (kind, payload, run_at, enqueued_at) VALUES (?, ?, ?, ?)",
+            (kind, payload, now + delay, now),
+        )
+
+    async def enqueue(self, kind, payload, delay=0.0):
+        await asyncio.to_thread(self._insert, kind, json.dumps(payload), delay)
+        metrics.inc("jobs.enqueued")
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # Metrics. The gauges are read on the event loop, so they return numbers
+    # the workers refresh from their threads at most every poll_interval.
+
+    def _refresh_stats(self):
+        conn = self._connection()
+        now = time.time()
+        oldest_due = conn.execute(
+            "SELECT MIN(run_at) FROM jobs WHERE run_at <= ? AND (locked_until IS NULL OR locked_until < ?)",
+            (now, now),
+        ).fetchone()[0]
+        self._stats = {
+            "pending": conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0],
+            "oldest_due": oldest_due,
+            "dead": conn.execute("SELECT COUNT(*) FROM dead_jobs").fetchone()[0],
+        }
+        self._stats_at = now
+
+    def pending(self):
+        return self._stats["pending"]
+
+    def lag(self):
+        # How long the oldest due job has been waiting
+        oldest_due = self._stats["oldest_due"]
+        return round(time.time() - oldest_due, 3) if oldest_due else 0.0
+
+    def dead_count(self):
+        return self._stats["dead"]
+
+    def dead_letters(self, limit=100):
+        rows = self._connection().execute(
+            "SELECT id, kind, payload, attempts, error, failed_at FROM dead_jobs ORDER BY failed_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [
+            {"id": r[0], "kind": r[1], "payload": json.loads(r[2]), "attempts": r[3], "error": r[4], "failed_at": r[5]}
+            for r in rows
+        ]
+
+    # Workers
+
+    def _claim(self):
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts FROM jobs "
+                "WHERE run_at <= ? AND (locked_until IS NULL OR locked_until < ?) "
+                "ORDER BY run_at LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row:
+                # The lease makes a job claimed by a crashed worker runnable again
+                conn.execute("UPDATE jobs SET locked_until = ?, attempts = attempts + 1 WHERE id = ?",
+                             (now + self.lease, row[0]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if now - self._stats_at >= self.poll_interval:
+            self._refresh_stats()
+        return row
+
+    def _finish(self, job_id):
+        self._connection().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def _fail(self, job_id, kind, payload, attempts, error):
+        conn = self._connection()
+        if attempts >= self.max_attempts:
+            # Commits on success, rolls back if either statement fails
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    "INSERT INTO dead_jobs (id, kind, payload, attempts, error, failed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, payload, attempts, error, time.time()),
+                )
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            metrics.inc("jobs.dead_lettered")
+            return
+        delay = self.backoff * (2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        conn.execute("UPDATE jobs SET run_at = ?, locked_until = NULL WHERE id = ?", (time.time() + delay, job_id))
+        metrics.inc("jobs.retried")
+
+    async def _worker(self):
+        while True:
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            job_id, kind, payload, attempts = job
+            attempts += 1
+            handler = self._handlers.get(kind)
+            try:
+                if handler is None:
+                    raise LookupError(f"No handler for job kind {kind!r}")
+                await handler(json.loads(payload))
+            except Exception as e:
+                print(f"Job {job_id} ({kind}) failed on attempt {attempts}: {str(e)}")
+                await asyncio.to_thread(self._fail, job_id, kind, payload, attempts, str(e))
+                continue
+            await asyncio.to_thread(self._finish, job_id)
+            metrics.inc("jobs.completed")
+            metrics.inc(f"jobs.completed.{kind}")
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
@@ -0,0 +1,362 @@
+"""Durable storage for the in-memory backend (simple_backend.py).
+
+``MemoryDatabase`` is the single-process data layer used by simple_backend
+when LOCAL_BACKEND=memory (see sqlite_store.py for the multi-worker one).
+
+Every write is appended to a JSONL write-ahead log. A background thread
+batches pending records and fsyncs them together (group commit), so many
+concurrent bookings share one fsync. Every ``snapshot_every`` records the
+full state is written to a compact pickle snapshot and older log segments
+are dropped. On restart the snapshot is memory-mapped and only the log tail
+written after it is replayed.
+"""
+import asyncio
+import concurrent.futures
+import gc
+import json
+import mmap
+import os
+import pickle
+import threading
+import time
+
+from search import EventSearchIndex
+
+SNAPSHOT_FILE = "snapshot.pickle"
+SEGMENT_PREFIX = "wal-"
+SEGMENT_SUFFIX = ".jsonl"
+
+
+class _Roll:
+    # Marker queued behind the last record covered by a snapshot; the flusher
+    # starts a new log segment when it reaches it.
+    def __init__(self, next_seq):
+        self.next_seq = next_seq
+        self.done = threading.Event()
+
+
+class LocalStore:
+    def __init__(self, data_dir, fsync_interval=0.002, snapshot_every=100_000):
+        self.data_dir = data_dir
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = []
+        self._seq = 0
+        self._since_snapshot = 0
+        self._snapshotting = False
+        self._snapshot_worker = None
+        self._closed = False
+        self._log = None
+        self._flusher = None
+        os.makedirs(data_dir, exist_ok=True)
+
+    # Loading
+
+    def load(self, tables):
+        """Restore state and start the log writer.
+
+        Returns a dict mapping each table name in ``tables`` to a list of rows.
+        """
+        state = {name: [] for name in tables}
+        snapshot_seq = 0
+
+        # Unpickling a million small dicts triggers the cyclic GC constantly;
+        # none of the restored objects are cyclic, so pause it while loading.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    snapshot = pickle.loads(mm)
+                snapshot_seq = snapshot["seq"]
+                for name, rows in snapshot["tables"].items():
+                    state[name] = rows
+
+            self._seq = snapshot_seq
+            for start, segment in self._segments():
+                self._replay(segment, snapshot_seq, state)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        self._open_segment(self._seq + 1)
+        self._flusher = threading.Thread(target=self._flush_loop, name="local-store-wal", daemon=True)
+        self._flusher.start()
+        return state
+
+    def _segments(self):
+        segments = []
+        for name in os.listdir(self.data_dir):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                start = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                segments.append((start, os.path.join(self.data_dir, name)))
+        return sorted(segments)
+
+    def _replay(self, segment, snapshot_seq, state):
+        indexes = {}
+        good_offset = 0
+        with open(segment, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash: everything after it is garbage.
+                    break
+                good_offset += len(line)
+                if record["seq"] <= snapshot_seq:
+                    continue
+                self._apply(record, state, indexes)
+                self._seq = record["seq"]
+        if good_offset < os.path.getsize(segment):
+            with open(segment, "r+b") as f:
+                f.truncate(good_offset)
+
+    @staticmethod
+    def _apply(record, state, indexes):
+        rows = state.setdefault(record["table"], [])
+        op = record["op"]
+        if op == "insert":
+            rows.append(record["row"])
+            return
+
+        # Updates and deletes are rare, so the id index is only built on demand.
+        index = indexes.get(record["table"])
+        if index is None:
+            index = indexes[record["table"]] = {row["id"]: i for i, row in enumerate(rows)}
+        position = index.get(record["row"]["id"])
+        if position is None:
+            return
+        if op == "update":
+            rows[position] = {**rows[position], **record["row"]}
+        elif op == "delete":
+            rows.pop(position)
+            indexes.pop(record["table"])
+
+    # Writing
+
+    def append(self, op, table, row):
+        """Queue a record for the log.
+
+        Returns a ``concurrent.futures.Future`` resolved once the record has
+        been fsynced; async callers can await ``asyncio.wrap_future(...)``.
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._seq += 1
+            self._since_snapshot += 1
+            record = {"seq": self._seq, "op": op, "table": table, "row": row}
+            self._pending.append((json.dumps(record, separators=(",", ":")).encode() + b"\n", future))
+        self._wakeup.set()
+        return future
+
+    def _open_segment(self, start):
+        path = os.path.join(self.data_dir, f"{SEGMENT_PREFIX}{start:012d}{SEGMENT_SUFFIX}")
+        if self._log:
+            self._log.close()
+        self._log = open(path, "ab")
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait()
+            # Give concurrent writers a moment to join this batch.
+            time.sleep(self.fsync_interval)
+            with self._lock:
+                self._wakeup.clear()
+                batch, self._pending = self._pending, []
+                closed = self._closed
+            self._write_batch(batch)
+            if closed:
+                self._log.close()
+                return
+
+    def _write_batch(self, batch):
+        chunk, futures = [], []
+        for item in batch:
+            if isinstance(item, _Roll):
+                self._sync(chunk, futures)
+                chunk, futures = [], []
+                self._open_segment(item.next_seq)
+                item.done.set()
+            else:
+                chunk.append(item[0])
+                futures.append(item[1])
+        self._sync(chunk, futures)
+
+    def _sync(self, chunk, futures):
+        if not chunk:
+            return
+        try:
+            self._log.write(b"".join(chunk))
+            self._log.flush()
+            os.fsync(self._log.fileno())
+        except OSError as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future in futures:
+            future.set_result(None)
+
+    # Snapshots
+
+    def maybe_snapshot(self, state):
+        """Start a background snapshot if enough records have accumulated.
+
+        ``state`` maps table names to row lists. It must be called from the
+        thread that mutates them; the lists are copied here and rows are
+        expected to be replaced rather than mutated in place.
+        """
+        if self._since_snapshot < self.snapshot_every or self._snapshotting:
+            return
+        self.snapshot(state, wait=False)
+
+    def snapshot(self, state, wait=True):
+        # One snapshot at a time: two writers would race on the snapshot
+        # file and on deleting log segments
+        if self._snapshot_worker is not None:
+            self._snapshot_worker.join()
+        copy = {name: list(rows) for name, rows in state.items()}
+        with self._lock:
+            seq = self._seq
+            self._since_snapshot = 0
+            self._snapshotting = True
+            roll = _Roll(seq + 1)
+            self._pending.append(roll)
+        self._wakeup.set()
+        worker = threading.Thread(target=self._write_snapshot, args=(copy, seq, roll), daemon=True)
+        self._snapshot_worker = worker
+        worker.start()
+        if wait:
+            worker.join()
+
+    def _write_snapshot(self, tables, seq, roll):
+        try:
+            path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+            tmp = f"{path}.{seq}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump({"seq": seq, "tables": tables}, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+
+            # Segments before the roll point are fully covered by the snapshot.
+            roll.done.wait()
+            for start, segment in self._segments():
+                if start <= seq:
+                    os.remove(segment)
+        except OSError as e:
+            print(f"Snapshot failed: {str(e)}")
+        finally:
+            self._snapshotting = False
+
+    def close(self, state=None):
+        if state is not None:
+            self.snapshot(state)
+        with self._lock:
+            self._closed = True
+        self._wakeup.set()
+        if self._flusher:
+            self._flusher.join()
+
+
+class EventNotFound(Exception):
+    pass
+
+
+class NotEnoughCapacity(Exception):
+    pass
+
+
+class MemoryDatabase:
+    # Keeps every row in process memory. Only safe with a single worker:
+    # each uvicorn worker would load its own copy and append to the same log.
+
+    def __init__(self, store):
+        self.store = store
+        self.state = store.load(["events", "bookings"])
+        self.events = self.state["events"]
+        self.bookings = self.state["bookings"]
+        self._events_by_id = {}
+        self.search_index = EventSearchIndex()
+        for event in self.events:
+            self._index_event(event)
+        # Seats taken per event, kept in step with bookings so capacity checks
+        # and availability reads are O(1)
+        self._booked = {}
+        for booking in self.bookings:
+            self._booked[booking["event_id"]] = self._booked.get(booking["event_id"], 0) + booking["quantity"]
+
+    def _index_event(self, event):
+        self._events_by_id[event["id"]] = event
+        self.search_index.add(event)
+
+    def seed_events(self, rows):
+        if self.events:
+            return
+        for row in rows:
+            self.events.append(row)
+            self._index_event(row)
+            self.store.append("insert", "events", row)
+
+    async def _persist(self, table, row):
+        # Wait for the group-committed fsync, then compact the log if it has grown
+        await asyncio.wrap_future(self.store.append("insert", table, row))
+        self.store.maybe_snapshot(self.state)
+
+    def _with_availability(self, event):
+        return {**event, "remaining_seats": max(event["capacity"] - self._booked.get(event["id"], 0), 0)}
+
+    async def list_events(self):
+        return [self._with_availability(event) for event in self.events]
+
+    async def availability(self, event_ids):
+        return {
+            event_id: self._with_availability(self._events_by_id[event_id])["remaining_seats"]
+            for event_id in event_ids if event_id in self._events_by_id
+        }
+
+    async def get_event(self, event_id):
+        event = self._events_by_id.get(event_id)
+        return self._with_availability(event) if event else None
+
+    async def search_events(self, **filters):
+        return [self._with_availability(event) for event in self.search_index.search(**filters)]
+
+    async def add_event(self, row):
+        self.events.append(row)
+        self._index_event(row)
+        await self._persist("events", row)
+        return row
+
+    async def user_bookings(self, user_id):
+        return [b for b in self.bookings if b["user_id"] == user_id]
+
+    async def create_booking(self, row):
+        event = self._events_by_id.get(row["event_id"])
+        if not event:
+            raise EventNotFound(row["event_id"])
+
+        # Check and reserve in one step; there is no await in between
+        total_booked = self._booked.get(row["event_id"], 0)
+        if total_booked + row["quantity"] > event["capacity"]:
+            raise NotEnoughCapacity(row["event_id"])
+        self._booked[row["event_id"]] = total_booked + row["quantity"]
+
+        self.bookings.append(row)
+        try:
+            await asyncio.wrap_future(self.store.append("insert", "bookings", row))
+        except Exception:
+            # Not durable, so it didn't happen: give the seats back
+            self.bookings.remove(row)
+            self._booked[row["event_id"]] -= row["quantity"]
+            raise
+        self.store.maybe_snapshot(self.state)
+        return row
+
+    async def stats(self):
+        return {"total_events": len(self.events), "total_bookings": len(self.bookings)}
+
+    async def close(self):
+        await asyncio.to_thread(self.store.close, self.state)
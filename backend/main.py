@@ -1,61 +1,371 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, WebSocket, Request, UploadFile, File, status, Query
+from fastapi.responses import StreamingResponse, Response, JSONResponse
+from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, EmailStr
 from typing import Optional, List
-import os
-from dotenv import load_dotenv
-# Import only what we need to avoid realtime module issues
-from supabase import create_client
-from supabase.client import Client
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
 import jwt
+from config import get_settings
+from cache import TTLCache
+from availability_push import AvailabilityBroadcaster
+from rate_limit import RateLimitMiddleware, RatePolicy, MemoryBucketStore, SqliteBucketStore
+from idempotency import IdempotencyMiddleware, MemoryIdempotencyStore, DatabaseIdempotencyStore
+from checkins import CheckinTracker
+from singleflight import SingleFlight
+from upstream import Upstream, CircuitBreaker, LazyClient, build_client_options
+import metrics
+from models import Event, Booking, User, SeatShards, BatchRequest
+from batch import UserDirectory, verified_auth, batch_users, dispatch
+from event_import import batch_id_for, read_rows, import_events
+from images import ImagePipeline, LocalImageStorage
+from jobs import JobQueue
+from holds import HoldExpiry
+from replicas import ReplicaRouter
+from tickets import TicketCache, prerender, ticket_version
 
-load_dotenv()
+# Typed configuration from the environment and .env (see config.py)
+settings = get_settings()
 
 app = FastAPI(title="Event Booking API", version="1.0.0")
 
+# Rate limiting, per user when the token's signature verifies locally,
+# otherwise per client IP. Added before CORS so 429 responses still carry
+# CORS headers.
+app.add_middleware(
+    RateLimitMiddleware,
+    policies=[
+        # method, path regex, tokens per second, burst
+        RatePolicy("POST", r"/api/bookings", 0.5, 5),
+        RatePolicy("GET", r"/api/events/search", 5, 20),
+        RatePolicy("GET", r"/api/events/[^/]+", 10, 30),
+    ],
+    store=SqliteBucketStore(settings.rate_limit_sqlite_path) if settings.rate_limit_sqlite_path else MemoryBucketStore(),
+    verify=lambda token: verify_token_signature(token)
+)
+
+# Idempotency-Key on write endpoints: a retried request gets the stored
+# response of the first attempt (see idempotency.py). Outside the rate limiter,
+# so replays don't spend tokens; 429s are never stored.
+app.add_middleware(
+    IdempotencyMiddleware,
+    identify=lambda scope: identify_caller(scope),
+    paths=[
+        ("POST", r"/api/bookings"),
+        ("POST", r"/api/bookings/holds"),
+        ("POST", r"/api/bookings/holds/[^/]+/confirm"),
+        ("POST", r"/api/bookings/[^/]+/cancel"),
+        ("POST", r"/api/events/[^/]+/waitlist"),
+        ("PATCH", r"/api/admin/bookings/[^/]+/confirm"),
+        ("POST", r"/api/admin/bookings/verify-qr"),
+    ],
+    store=DatabaseIdempotencyStore(
+        LazyClient(lambda: supabase_client.get()),
+        table=settings.idempotency_table,
+        ttl=settings.idempotency_ttl_seconds,
+        max_keys=settings.idempotency_max_keys
+    ) if settings.idempotency_table else MemoryIdempotencyStore(
+        ttl=settings.idempotency_ttl_seconds,
+        max_keys=settings.idempotency_max_keys
+    )
+)
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://localhost:3001", "http://localhost:3002", "http://localhost:3003"],
+    allow_origins=settings.cors_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
     expose_headers=["Authorization"],
 )
 
-# Supabase Client (for non-auth endpoints)
-supabase_client: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
+def create_supabase_client(url: Optional[str] = None):
+    # Imported here: the supabase package is the slowest import in the app
+    from supabase import create_client
+    
+    if settings.missing():
+        raise RuntimeError(f"Missing settings: {', '.join(name.upper() for name in settings.missing())}")
+    return create_client(
+        url or settings.supabase_url,
+        settings.supabase_key,
+        options=build_client_options(
+            pool_size=settings.supabase_pool_size,
+            keepalive=settings.supabase_keepalive_connections,
+            connect_timeout=settings.supabase_connect_timeout,
+            read_timeout=settings.supabase_read_timeout
+        )
+    )
+
+# Supabase Client (for non-auth endpoints), with an explicit connection pool.
+# Built on first use rather than at import.
+supabase_client = LazyClient(create_supabase_client)
+
+# Reads that can tolerate a few seconds of lag go through db.read() and are
+# served by a healthy read replica when one is configured (see replicas.py)
+db = ReplicaRouter(
+    supabase_client,
+    [LazyClient(lambda url=url: create_supabase_client(url)) for url in settings.supabase_replica_urls],
+    max_lag=settings.replica_max_lag_seconds,
+    check_interval=settings.replica_check_interval,
+    sticky_seconds=settings.read_your_writes_seconds
+)
+
+# Signing keys for asymmetric Supabase JWTs, fetched once and cached
+jwks_client = jwt.PyJWKClient(settings.jwks_url, cache_keys=True, lifespan=3600) if settings.jwks_url else None
+
+# Timeouts, retries and circuit breaker for every Supabase call (see upstream.py)
+upstream = Upstream(
+    timeouts={
+        "read": settings.upstream_read_timeout,
+        "write": settings.upstream_write_timeout,
+        "auth": settings.upstream_auth_timeout
+    },
+    retries=settings.upstream_read_retries,
+    breaker=CircuitBreaker(
+        threshold=settings.upstream_breaker_threshold,
+        cooldown=settings.upstream_breaker_cooldown
+    ),
+    max_workers=settings.supabase_pool_size
 )
 
 security = HTTPBearer()
 
-# Models
-class Event(BaseModel):
-    title: str
-    description: str
-    date: str
-    location: str
-    price: float
-    capacity: int
-    image_url: Optional[str] = None
-
-class Booking(BaseModel):
-    event_id: str
-    quantity: int
-    user_id: Optional[str] = None  # Optional since we get it from auth
-
-class User(BaseModel):
-    email: EmailStr
-    name: str
-    role: str = "user"
+# Resized WebP/AVIF variants of event images, stored under content-hashed
+# keys and served from /media (see images.py and event_images.sql)
+class ImmutableStaticFiles(StaticFiles):
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        # Keys change whenever the content does
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+image_storage = LocalImageStorage(settings.media_root, settings.media_base_url)
+app.mount("/media", ImmutableStaticFiles(directory=settings.media_root), name="media")
+
+async def save_image_variants(event_id: str, variants: dict):
+    await upstream.call(
+        lambda: supabase_client.table("events").update({"image_variants": variants}).eq("id", event_id).execute(),
+        kind="write",
+        idempotent=True
+    )
+
+image_pipeline = ImagePipeline(
+    image_storage,
+    save_image_variants,
+    concurrency=settings.image_workers
+)
+
+# Concurrent identical reads share one upstream call (see singleflight.py)
+events_flight = SingleFlight("events")
+event_detail_flight = SingleFlight("event_detail")
+admin_stats_flight = SingleFlight("admin_stats")
+
+# With SEAT_SHARDS on, event reads also select booked_seats, which adds up
+# the counters of sharded events (see event_seat_shards.sql)
+EVENT_COLUMNS = "*, booked_seats" if settings.seat_shards else "*"
+
+# Remaining seats per event id, refreshed from events.booked_count
+# (see event_availability.sql). Short-lived so counts stay close to live.
+availability_cache = TTLCache(ttl=settings.availability_ttl_seconds)
+
+# Admin report rows per event id (see event_report.sql), dropped whenever a
+# booking for that event changes, plus the event ids in each requested date
+# range. A report request only recomputes the events that were invalidated.
+report_cache = TTLCache(ttl=settings.report_ttl_seconds)
+report_ranges = TTLCache(ttl=settings.report_ttl_seconds, maxsize=100)
+
+def invalidate_event_report(event_id: str):
+    report_cache.delete(event_id)
+
+def with_availability(event: dict, cache: bool = True) -> dict:
+    booked = event.get("booked_seats", event.get("booked_count"))
+    remaining = max(event["capacity"] - (booked or 0), 0)
+    if cache:
+        # Only primary reads fill the cache; replica counts may lag behind
+        availability_cache.set(event["id"], remaining)
+    event["remaining_seats"] = remaining
+    return event
+
+def fetch_availability(event_ids: List[str]) -> dict:
+    response = supabase_client.table("events")\
+        .select("id, capacity, booked_count, booked_seats" if settings.seat_shards else "id, capacity, booked_count")\
+        .in_("id", event_ids)\
+        .execute()
+    return {event["id"]: with_availability(event)["remaining_seats"] for event in response.data}
+
+async def fetch_availability_async(event_ids: List[str]) -> dict:
+    return await upstream.call(lambda: fetch_availability(event_ids))
+
+# Pushes remaining-seat changes to /ws/availability subscribers, at most
+# one message per event every AVAILABILITY_PUSH_INTERVAL seconds
+broadcaster = AvailabilityBroadcaster(
+    fetch_availability_async,
+    interval=settings.availability_push_interval
+)
+
+# Per-event confirmed / checked_in counters for the door dashboard stream
+checkin_tracker = CheckinTracker()
+
+async def fetch_checkin_rows() -> list:
+    # One row per event and status (see checkin_counts.sql)
+    response = await upstream.call(lambda: supabase_client.rpc("checkin_counts", {}).execute())
+    return response.data
+
+# Post-booking side effects run here instead of in the request (see jobs.py)
+job_queue = JobQueue(
+    settings.job_queue_path,
+    concurrency=settings.job_workers,
+    max_attempts=settings.job_max_attempts
+)
+
+@job_queue.handler("send_confirmation")
+async def send_confirmation(payload: dict):
+    import smtplib
+    from email.message import EmailMessage
+    
+    if not settings.smtp_host:
+        print(f"SMTP_HOST not set, skipping confirmation for booking {payload['booking_id']}")
+        return
+    
+    message = EmailMessage()
+    message["Subject"] = "Your booking is confirmed"
+    message["From"] = settings.smtp_from
+    message["To"] = payload["email"]
+    message.set_content(
+        f"Your booking {payload['booking_id']} for {payload['quantity']} ticket(s) is confirmed."
+    )
+    
+    def send():
+        with smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=10) as smtp:
+            smtp.starttls()
+            if settings.smtp_user:
+                smtp.login(settings.smtp_user, settings.smtp_password)
+            smtp.send_message(message)
+    
+    await asyncio.to_thread(send)
+
+# Rendered tickets, keyed by booking id and status (see tickets.py)
+ticket_cache = TicketCache(settings.ticket_cache_dir)
+
+async def fetch_ticket_booking(booking_id: str) -> Optional[dict]:
+    response = await upstream.call(
+        lambda: supabase_client.table("bookings").select("*, events(*)").eq("id", booking_id).execute()
+    )
+    return response.data[0] if response.data else None
+
+@job_queue.handler("render_ticket")
+async def render_ticket(payload: dict):
+    booking = await fetch_ticket_booking(payload["booking_id"])
+    if booking:
+        await asyncio.to_thread(ticket_cache.render, booking, booking["events"] or {}, "png")
+
+@job_queue.handler("waitlist_promoted")
+async def send_waitlist_confirmation(payload: dict):
+    user = await upstream.call(
+        lambda: supabase_client.auth.admin.get_user_by_id(payload["user_id"]), kind="auth"
+    )
+    await send_confirmation({**payload, "email": user.user.email})
+
+@job_queue.handler("update_analytics")
+async def update_analytics(payload: dict):
+    metrics.inc("analytics.bookings")
+    metrics.inc("analytics.seats", payload["quantity"])
+
+async def expire_holds(hold_ids: Optional[List[str]]):
+    response = await upstream.call(
+        lambda: supabase_client.rpc("expire_seat_holds", {"p_hold_ids": hold_ids}).execute(),
+        kind="write",
+        idempotent=True
+    )
+    released = {row["event_id"] for row in response.data if row["kind"] == "released"}
+    await apply_waitlist_changes([row for row in response.data if row["kind"] == "promoted"])
+    for event_id in released:
+        availability_cache.delete(event_id)
+        broadcaster.publish(event_id)
+
+# Releases seat holds when they run out (see holds.py)
+hold_expiry = HoldExpiry(expire_holds)
+
+async def start_hold_expiry():
+    try:
+        response = await upstream.call(
+            lambda: supabase_client.table("seat_holds").select("id, expires_at").execute()
+        )
+        hold_expiry.recover(
+            (hold["id"], datetime.fromisoformat(hold["expires_at"]).timestamp()) for hold in response.data
+        )
+    except Exception as e:
+        print(f"Could not recover seat holds: {str(e)}")
+    await hold_expiry.sweep()
+    await hold_expiry.run()
+
+# Readiness: set once the warm-up below has loaded the catalog (see /readyz)
+readiness = {"ready": False, "warmup": {}}
+
+async def warm_up():
+    started = time.perf_counter()
+    
+    async def step(name, fn):
+        try:
+            result = await asyncio.wait_for(fn(), timeout=settings.warmup_timeout)
+            readiness["warmup"][name] = "skipped" if result == "skipped" else "ok"
+        except Exception as e:
+            readiness["warmup"][name] = f"failed: {str(e) or type(e).__name__}"
+    
+    async def fetch_jwks():
+        if jwks_client is None:
+            return "skipped"
+        # Projects that still sign with HS256 publish an empty key set
+        jwk_set = await asyncio.to_thread(jwks_client.fetch_data)
+        if not jwk_set.get("keys"):
+            return "skipped"
+        await asyncio.to_thread(jwks_client.get_signing_keys)
+    
+    if not settings.missing():
+        # Builds the client and opens pooled connections on the way
+        await asyncio.gather(
+            step("jwks", fetch_jwks),
+            step("catalog", load_events),
+            step("stats", load_admin_stats)
+        )
+    readiness["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    print(f"Warm-up finished in {readiness['warmup_seconds']}s: {readiness['warmup']}")
+    if settings.missing():
+        return
+    
+    # Serving the catalog is the least the app must do; JWKS and stats only
+    # make the first requests faster. Keep trying until Supabase answers.
+    while readiness["warmup"].get("catalog") != "ok":
+        print(f"Catalog warm-up {readiness['warmup'].get('catalog')}, retrying")
+        await asyncio.sleep(5)
+        await step("catalog", load_events)
+    readiness["ready"] = True
+
+@app.on_event("startup")
+async def start_background_tasks():
+    asyncio.create_task(warm_up())
+    asyncio.create_task(db.run())
+    asyncio.create_task(broadcaster.run())
+    asyncio.create_task(start_hold_expiry())
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
 
 # Auth Dependency
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
+        
+        # Already verified for this request by /api/batch for its sub-requests
+        authenticated = verified_auth.get()
+        if authenticated is not None and authenticated[0] == token:
+            return authenticated[1]
+        
         print(f"Received token (first 20 chars): {token[:20] if token else 'None'}...")
         
         if not token:
@@ -63,8 +373,9 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         
         # Use Supabase client to verify the token
         try:
-            # Get user from Supabase using the token
-            user_response = supabase_client.auth.get_user(token)
+            # Get user from Supabase using the token; if Supabase is down or
+            # slow this fails fast and falls through to local JWT verification
+            user_response = await upstream.call(lambda: supabase_client.auth.get_user(token), kind="auth")
             
             if not user_response or not user_response.user:
                 raise HTTPException(status_code=401, detail="Invalid token")
@@ -75,17 +386,26 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             return {
                 "sub": user_response.user.id,
                 "email": user_response.user.email,
-                "user_metadata": user_response.user.user_metadata or {}
+                "user_metadata": user_response.user.user_metadata or {},
+                "app_metadata": user_response.user.app_metadata or {}
             }
             
         except Exception as e:
             print(f"Supabase token verification error: {str(e)}")
-            # Fallback to JWT decode
+            # Fallback to JWT decode: HS256 with the project secret, or the
+            # asymmetric keys published at the project's JWKS endpoint
             try:
+                if jwt.get_unverified_header(token).get("alg") == "HS256":
+                    key, algorithms = settings.supabase_jwt_secret, ["HS256"]
+                elif jwks_client is not None:
+                    signing_key = await asyncio.to_thread(jwks_client.get_signing_key_from_jwt, token)
+                    key, algorithms = signing_key.key, ["RS256", "ES256"]
+                else:
+                    raise jwt.InvalidTokenError("No JWKS endpoint configured")
                 payload = jwt.decode(
                     token,
-                    os.getenv("SUPABASE_JWT_SECRET"),
-                    algorithms=["HS256"],
+                    key,
+                    algorithms=algorithms,
                     audience="authenticated",
                     options={"verify_exp": True}
                 )
@@ -107,72 +427,624 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         print(f"Unexpected auth error: {str(e)}")
         raise HTTPException(status_code=401, detail="Authentication failed")
 
+# EventSource can't set headers, so streams also accept ?access_token=
+async def get_stream_user(request: Request, access_token: Optional[str] = None):
+    token = access_token
+    auth_header = request.headers.get("Authorization", "")
+    if auth_header.lower().startswith("bearer "):
+        token = auth_header[7:]
+    if not token:
+        raise HTTPException(status_code=401, detail="No token provided")
+    return await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
+async def fetch_auth_user(user_id: str):
+    response = await upstream.call(lambda: supabase_client.auth.admin.get_user_by_id(user_id), kind="auth")
+    return response.user if response else None
+
+def user_directory() -> UserDirectory:
+    # One per /api/batch call, shared by its sub-requests; otherwise one per request
+    return batch_users.get() or UserDirectory(fetch_auth_user)
+
+async def verify_token_signature(token: str) -> Optional[str]:
+    # Local check for picking a rate limit bucket: no Supabase round trip, and
+    # only JWKS keys already fetched, so a made-up kid can't force a refetch
+    try:
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") == "HS256":
+            if not settings.supabase_jwt_secret:
+                return None
+            key, algorithms = settings.supabase_jwt_secret, ["HS256"]
+        elif jwks_client is not None:
+            signing_keys = await asyncio.to_thread(jwks_client.get_signing_keys)
+            key = next((k.key for k in signing_keys if k.key_id == header.get("kid")), None)
+            if key is None:
+                return None
+            algorithms = ["RS256", "ES256"]
+        else:
+            return None
+        return jwt.decode(token, key, algorithms=algorithms, audience="authenticated").get("sub")
+    except Exception:
+        return None
+
+async def identify_caller(scope) -> Optional[str]:
+    # Verified user id for the idempotency middleware. It runs before the
+    # rate limiter, so it checks the signature locally like the limiter does:
+    # rotating keys must not buy Supabase auth round trips ahead of a 429.
+    auth_header = next((v.decode("latin-1") for k, v in scope.get("headers", []) if k == b"authorization"), "")
+    if not auth_header.lower().startswith("bearer "):
+        return None
+    return await verify_token_signature(auth_header[7:])
+
+# Admin rule shared with the database's is_admin() (see admin_policies.sql):
+# role "admin" in the app metadata, which handle_new_user copies to profiles.
+# Users can edit their own user metadata, so it never grants admin.
+def is_admin(current_user: dict) -> bool:
+    return (current_user.get("app_metadata") or {}).get("role") == "admin"
+
+def require_admin(current_user: dict):
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+
 # Routes
 @app.get("/")
 async def root():
     return {"message": "Event Booking API", "version": "1.0.0"}
 
+# Liveness: the process is up and serving
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+# Readiness: configured, warmed up and Supabase not failing
+@app.get("/readyz")
+async def readyz():
+    problems = []
+    if settings.missing():
+        problems.append(f"missing settings: {', '.join(name.upper() for name in settings.missing())}")
+    if not readiness["ready"]:
+        catalog = readiness["warmup"].get("catalog")
+        problems.append(f"catalog warm-up {catalog}" if catalog else "warming up")
+    if upstream.breaker.state == "open":
+        problems.append("upstream circuit open")
+    
+    body = {**readiness, "ready": not problems, "problems": problems}
+    return JSONResponse(body, status_code=200 if not problems else 503)
+
+async def load_events():
+    def load():
+        response = db.read(lambda client: client.table("events").select(EVENT_COLUMNS).execute())
+        return {"events": [with_availability(event, cache=False) for event in response.data]}
+    
+    return await events_flight.do("all", lambda: upstream.call(load, stale_key="events"))
+
+async def load_admin_stats():
+    def load():
+        events_count = db.read(lambda client: client.table("events").select("*", count="exact").execute())
+        bookings_count = db.read(lambda client: client.table("bookings").select("*", count="exact").execute())
+        
+        # Get unique users from bookings
+        bookings_response = db.read(lambda client: client.table("bookings").select("user_id").execute())
+        unique_users = len(set([b["user_id"] for b in bookings_response.data]))
+        
+        return {
+            "total_users": unique_users,
+            "total_events": events_count.count,
+            "total_bookings": bookings_count.count
+        }
+    
+    # Same result for every admin, so all concurrent admin requests share it
+    return await admin_stats_flight.do("admin", lambda: upstream.call(load, stale_key="admin_stats"))
+
 @app.get("/api/events")
 async def get_events():
     try:
-        response = supabase_client.table("events").select("*").execute()
+        return await load_events()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/events/search")
+async def search_events(
+    q: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    location: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    try:
+        # search_events() is defined in event_search.sql and backed by the
+        # full-text, trigram and date indexes created there
+        response = await upstream.call(lambda: db.read(lambda client: client.rpc("search_events", {
+            "q": q,
+            "date_from": date_from,
+            "date_to": date_to,
+            "min_price": min_price,
+            "max_price": max_price,
+            "loc": location,
+            "max_results": limit
+        }).execute()))
         return {"events": response.data}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/events/availability")
+async def get_events_availability(ids: str):
+    try:
+        event_ids = [event_id for event_id in dict.fromkeys(ids.split(",")) if event_id]
+        if len(event_ids) > 500:
+            raise HTTPException(status_code=400, detail="Too many event ids (max 500)")
+
+        availability = {}
+        missing = []
+        for event_id in event_ids:
+            remaining = availability_cache.get(event_id)
+            if remaining is None:
+                missing.append(event_id)
+            else:
+                availability[event_id] = remaining
+
+        # One query for every id not served from the cache
+        if missing:
+            availability.update(await fetch_availability_async(missing))
+
+        return {"availability": availability}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.websocket("/ws/availability")
+async def availability_socket(websocket: WebSocket, ids: str = ""):
+    await broadcaster.serve(websocket, [event_id for event_id in ids.split(",") if event_id])
+
 @app.get("/api/events/{event_id}")
 async def get_event(event_id: str):
+    def load():
+        response = db.read(lambda client: client.table("events").select(EVENT_COLUMNS).eq("id", event_id).execute())
+        return with_availability(response.data[0], cache=False) if response.data else None
+    
     try:
-        response = supabase_client.table("events").select("*").eq("id", event_id).execute()
-        if not response.data:
+        event = await event_detail_flight.do(
+            event_id, lambda: upstream.call(load, stale_key=f"event:{event_id}")
+        )
+        if not event:
             raise HTTPException(status_code=404, detail="Event not found")
-        return response.data[0]
+        return event
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/events", status_code=status.HTTP_201_CREATED)
 async def create_event(event: Event, current_user: dict = Depends(get_current_user)):
-    if current_user.get("user_metadata", {}).get("role") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
+    require_admin(current_user)
+    
+    try:
+        response = await upstream.call(
+            lambda: supabase_client.table("events").insert(event.dict()).execute(), kind="write"
+        )
+        created = response.data[0]
+        # image_variants is filled in once the resized images are ready
+        image_pipeline.schedule(created["id"], created.get("image_url"))
+        report_ranges.clear()
+        return created
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/events/import")
+async def import_events_file(
+    file: UploadFile = File(...),
+    chunk_size: int = 500,
+    concurrency: int = 4,
+    start_after: int = 0,
+    current_user: dict = Depends(get_current_user)
+):
+    require_admin(current_user)
+    
+    fmt = "jsonl" if (file.filename or "").endswith((".jsonl", ".ndjson")) else "csv"
+    batch_id = await asyncio.to_thread(batch_id_for, file.file)
+    
+    async def insert_chunk(events):
+        # Row ids are deterministic per file, so retrying an upsert is safe
+        await upstream.call(
+            lambda: supabase_client.table("events")
+            .upsert(events, on_conflict="id", ignore_duplicates=True)
+            .execute(),
+            kind="write",
+            idempotent=True
+        )
+        for event in events:
+            image_pipeline.schedule(event["id"], event.get("image_url"))
+        report_ranges.clear()
     
     try:
-        response = supabase_client.table("events").insert(event.dict()).execute()
-        return response.data[0]
+        # Pass the returned checkpoint as start_after to resume a failed import
+        return await import_events(
+            read_rows(file.file, fmt),
+            insert_chunk,
+            batch_id,
+            chunk_size=max(1, min(chunk_size, 1000)),
+            concurrency=max(1, min(concurrency, 8)),
+            start_after=start_after
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def booking_summary(row: dict) -> dict:
+    # Same shape as bookings joined with events(*), which the frontend expects
+    return {
+        "id": row["booking_id"],
+        "user_id": row["user_id"],
+        "event_id": row["event_id"],
+        "quantity": row["quantity"],
+        "total_price": row["total_price"],
+        "status": row["status"],
+        "created_at": row["created_at"],
+        "events": {
+            "id": row["event_id"],
+            "title": row["event_title"],
+            "date": row["event_date"],
+            "location": row["event_location"],
+            "price": row["event_price"],
+            "image_url": row["event_image_url"],
+            "image_variants": row["event_image_variants"]
+        }
+    }
+
 @app.get("/api/bookings")
-async def get_user_bookings(current_user: dict = Depends(get_current_user)):
+async def get_user_bookings(include_archived: bool = False, current_user: dict = Depends(get_current_user)):
     try:
         user_id = current_user.get("sub")
-        response = supabase_client.table("bookings").select("*, events(*)").eq("user_id", user_id).execute()
-        return {"bookings": response.data}
+        # Denormalized read model kept current by triggers (see user_bookings.sql)
+        # Users who just booked read from the primary (read-your-writes)
+        response = await upstream.call(lambda: db.read(
+            lambda client: client.table("user_bookings")
+            .select("*")
+            .eq("user_id", user_id)
+            .order("event_date")
+            .execute(),
+            user_id=user_id
+        ))
+        bookings = [booking_summary(row) for row in response.data]
+        if include_archived:
+            # Past events moved out by archive_bookings.py (see bookings_archive.sql)
+            archived = await upstream.call(lambda: db.read(
+                lambda client: client.table("bookings_archive")
+                .select("*, events(*)")
+                .eq("user_id", user_id)
+                .order("event_date")
+                .execute()
+            ))
+            bookings = [{**row, "archived": True} for row in archived.data] + bookings
+        return {"bookings": bookings}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def ensure_not_booked(user_id: str, event_id: str):
+    existing_booking = await upstream.call(
+        lambda: supabase_client.table("bookings")
+        .select("id")
+        .eq("user_id", user_id)
+        .eq("event_id", event_id)
+        .neq("status", "cancelled")
+        .execute()
+    )
+    
+    if existing_booking.data and len(existing_booking.data) > 0:
+        raise HTTPException(
+            status_code=400, 
+            detail="You have already booked this event"
+        )
+
+async def after_booking_created(created: dict, email: Optional[str]):
+    db.mark_write(created["user_id"])
+    availability_cache.delete(created["event_id"])
+    invalidate_event_report(created["event_id"])
+    broadcaster.publish(created["event_id"])
+    checkin_tracker.record_booking(created["event_id"])
+    
+    # Everything else happens after the response
+    job_payload = {
+        "booking_id": created["id"],
+        "event_id": created["event_id"],
+        "email": email,
+        "quantity": created["quantity"]
+    }
+    await job_queue.enqueue("send_confirmation", job_payload)
+    await job_queue.enqueue("update_analytics", job_payload)
+    await job_queue.enqueue("render_ticket", job_payload)
+
 @app.post("/api/bookings", status_code=status.HTTP_201_CREATED)
 async def create_booking(booking: Booking, current_user: dict = Depends(get_current_user)):
     try:
         user_id = current_user.get("sub")
         
         # Check if user already has a booking for this event
-        existing_booking = supabase_client.table("bookings")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .eq("event_id", booking.event_id)\
-            .execute()
-        
-        if existing_booking.data and len(existing_booking.data) > 0:
-            raise HTTPException(
-                status_code=400, 
-                detail="You have already booked this event"
-            )
+        await ensure_not_booked(user_id, booking.event_id)
         
         # Create the booking
         booking_data = booking.dict()
         booking_data["user_id"] = user_id
-        response = supabase_client.table("bookings").insert(booking_data).execute()
-        return response.data[0]
+        try:
+            response = await upstream.call(
+                lambda: supabase_client.table("bookings").insert(booking_data).execute(), kind="write"
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            # Raised by the booked_count trigger when the event is full
+            if "Not enough capacity" in str(e):
+                raise HTTPException(status_code=400, detail="Not enough capacity")
+            raise
+        created = response.data[0]
+        await after_booking_created(created, current_user.get("email"))
+        return created
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Two-phase booking: hold seats, then confirm (see seat_holds.sql and holds.py)
+
+@app.post("/api/bookings/holds", status_code=status.HTTP_201_CREATED)
+async def hold_seats(booking: Booking, current_user: dict = Depends(get_current_user)):
+    try:
+        user_id = current_user.get("sub")
+        await ensure_not_booked(user_id, booking.event_id)
+        
+        expires_at = datetime.now(timezone.utc) + timedelta(minutes=settings.hold_minutes)
+        try:
+            response = await upstream.call(
+                lambda: supabase_client.table("seat_holds").insert({
+                    "event_id": booking.event_id,
+                    "user_id": user_id,
+                    "quantity": booking.quantity,
+                    "expires_at": expires_at.isoformat()
+                }).execute(),
+                kind="write"
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            if "Not enough capacity" in str(e):
+                raise HTTPException(status_code=400, detail="Not enough capacity")
+            if "duplicate key" in str(e):
+                raise HTTPException(status_code=400, detail="You already have seats on hold for this event")
+            raise
+        hold = response.data[0]
+        hold_expiry.add(hold["id"], expires_at.timestamp())
+        availability_cache.delete(booking.event_id)
+        broadcaster.publish(booking.event_id)
+        return hold
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/bookings/holds/{hold_id}/confirm", status_code=status.HTTP_201_CREATED)
+async def confirm_hold(hold_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        try:
+            response = await upstream.call(
+                lambda: supabase_client.rpc("confirm_hold", {
+                    "p_hold_id": hold_id,
+                    "p_user_id": current_user.get("sub")
+                }).execute(),
+                kind="write"
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            if "Hold expired" in str(e):
+                raise HTTPException(status_code=410, detail="Hold expired")
+            raise
+        hold_expiry.discard(hold_id)
+        created = response.data[0]
+        await after_booking_created(created, current_user.get("email"))
+        return created
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/bookings/holds/{hold_id}")
+async def release_hold(hold_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        # Deletes the hold and promotes waiters into its seats (see seat_holds.sql)
+        response = await upstream.call(
+            lambda: supabase_client.rpc("release_seat_hold", {
+                "p_hold_id": hold_id,
+                "p_user_id": current_user.get("sub")
+            }).execute(),
+            kind="write",
+            idempotent=True
+        )
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Hold not found")
+        hold_expiry.discard(hold_id)
+        await apply_waitlist_changes([row for row in response.data if row["kind"] == "promoted"])
+        event_id = response.data[0]["event_id"]
+        availability_cache.delete(event_id)
+        broadcaster.publish(event_id)
+        return {"message": "Hold released"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+TICKET_MEDIA_TYPES = {"png": "image/png", "pdf": "application/pdf"}
+
+async def ticket_response(booking_id: str, fmt: str, request: Request, v: Optional[str], current_user: dict):
+    booking = await fetch_ticket_booking(booking_id)
+    if not booking or (booking["user_id"] != current_user.get("sub") and not is_admin(current_user)):
+        raise HTTPException(status_code=404, detail="Booking not found")
+    
+    version = ticket_version(booking)
+    etag = f'"{booking_id}-{version}"'
+    # ?v=<version> URLs never change content: a new status means a new URL
+    cache_control = "private, max-age=31536000, immutable" if v == version else "private, no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "X-Ticket-Version": version}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    data = ticket_cache.get(booking, fmt)
+    if data is None:
+        metrics.inc("tickets.rendered_on_demand")
+        data = await asyncio.to_thread(ticket_cache.render, booking, booking["events"] or {}, fmt)
+    if fmt == "pdf":
+        headers["Content-Disposition"] = f'inline; filename="ticket-{booking_id[:8]}.pdf"'
+    return Response(content=data, media_type=TICKET_MEDIA_TYPES[fmt], headers=headers)
+
+# <img> and download links can't send headers, so these also take ?access_token=
+@app.get("/api/bookings/{booking_id}/ticket.png")
+async def get_ticket_png(booking_id: str, request: Request, v: Optional[str] = None, current_user: dict = Depends(get_stream_user)):
+    try:
+        return await ticket_response(booking_id, "png", request, v, current_user)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/bookings/{booking_id}/ticket.pdf")
+async def get_ticket_pdf(booking_id: str, request: Request, v: Optional[str] = None, current_user: dict = Depends(get_stream_user)):
+    try:
+        return await ticket_response(booking_id, "pdf", request, v, current_user)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def apply_waitlist_changes(rows: list):
+    # rows come from cancel_booking() / promote_waitlist() (see waitlist.sql):
+    # rows without a booking_id are the cancellation, the rest are promotions
+    event_ids = set()
+    for row in rows:
+        event_ids.add(row["event_id"])
+        if row.get("booking_id") is None:
+            checkin_tracker.record_cancellation(row["event_id"])
+            continue
+        checkin_tracker.record_booking(row["event_id"])
+        db.mark_write(row["user_id"])
+        job_payload = {
+            "booking_id": row["booking_id"],
+            "event_id": row["event_id"],
+            "user_id": row["user_id"],
+            "quantity": row["quantity"]
+        }
+        await job_queue.enqueue("waitlist_promoted", job_payload)
+        await job_queue.enqueue("update_analytics", job_payload)
+        await job_queue.enqueue("render_ticket", job_payload)
+    for event_id in event_ids:
+        availability_cache.delete(event_id)
+        invalidate_event_report(event_id)
+        broadcaster.publish(event_id)
+
+@app.post("/api/bookings/{booking_id}/cancel")
+async def cancel_booking(booking_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        # Cancellation and waitlist promotion commit together in one transaction
+        response = await upstream.call(
+            lambda: supabase_client.rpc("cancel_booking", {
+                "p_booking_id": booking_id,
+                "p_user_id": None if is_admin(current_user) else current_user.get("sub")
+            }).execute(),
+            kind="write"
+        )
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Booking not found or cannot be cancelled")
+        
+        db.mark_write(current_user.get("sub"))
+        await apply_waitlist_changes(response.data)
+        return {
+            "message": "Booking cancelled",
+            "promoted": sum(1 for row in response.data if row.get("booking_id"))
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/events/{event_id}/waitlist", status_code=status.HTTP_201_CREATED)
+async def join_waitlist(event_id: str, quantity: int = 1, current_user: dict = Depends(get_current_user)):
+    try:
+        user_id = current_user.get("sub")
+        if quantity < 1:
+            raise HTTPException(status_code=400, detail="Quantity must be at least 1")
+        
+        event = await upstream.call(
+            lambda: supabase_client.table("events").select("id").eq("id", event_id).execute()
+        )
+        if not event.data:
+            raise HTTPException(status_code=404, detail="Event not found")
+        
+        await ensure_not_booked(user_id, event_id)
+        
+        try:
+            entry = await upstream.call(
+                lambda: supabase_client.table("waitlist")
+                .insert({"event_id": event_id, "user_id": user_id, "quantity": quantity})
+                .execute(),
+                kind="write"
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            if "duplicate key" in str(e):
+                raise HTTPException(status_code=400, detail="You are already on the waitlist")
+            if "foreign key" in str(e):
+                # Deleted since the check above
+                raise HTTPException(status_code=404, detail="Event not found")
+            raise
+        entry = entry.data[0]
+        
+        # Seats may have freed up since the client saw the event as full
+        promoted = await upstream.call(
+            lambda: supabase_client.rpc("promote_waitlist", {"p_event_id": event_id}).execute(),
+            kind="write"
+        )
+        await apply_waitlist_changes([{**row, "event_id": event_id} for row in promoted.data])
+        if any(row["waitlist_id"] == entry["id"] for row in promoted.data):
+            return {"waitlist_id": entry["id"], "status": "promoted"}
+        
+        ahead = await upstream.call(
+            lambda: supabase_client.table("waitlist")
+            .select("id", count="exact")
+            .eq("event_id", event_id)
+            .eq("status", "waiting")
+            .lt("id", entry["id"])
+            .execute()
+        )
+        return {"waitlist_id": entry["id"], "status": "waiting", "position": (ahead.count or 0) + 1}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/events/{event_id}/waitlist")
+async def leave_waitlist(event_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        response = await upstream.call(
+            lambda: supabase_client.table("waitlist")
+            .update({"status": "left"})
+            .eq("event_id", event_id)
+            .eq("user_id", current_user.get("sub"))
+            .eq("status", "waiting")
+            .execute(),
+            kind="write",
+            idempotent=True
+        )
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Not on the waitlist")
+        return {"message": "Left the waitlist"}
     except HTTPException:
         raise
     except Exception as e:
@@ -180,82 +1052,74 @@ async def create_booking(booking: Booking, current_user: dict = Depends(get_curr
 
 @app.get("/api/admin/users")
 async def get_all_users(current_user: dict = Depends(get_current_user)):
-    if current_user.get("user_metadata", {}).get("role") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
+    require_admin(current_user)
     
     try:
         # Get all bookings to find unique users
-        bookings_response = supabase_client.table("bookings").select("user_id, created_at").execute()
+        bookings_response = await upstream.call(
+            lambda: db.read(lambda client: client.table("bookings").select("user_id, created_at").execute())
+        )
         
         if not bookings_response.data:
             return {"users": []}
         
-        # Get unique user IDs
-        user_ids = list(set([b["user_id"] for b in bookings_response.data]))
+        # Booking counts and first booking per user, from the rows already loaded
+        booking_counts = {}
+        first_bookings = {}
+        for b in bookings_response.data:
+            booking_counts[b["user_id"]] = booking_counts.get(b["user_id"], 0) + 1
+            first_bookings.setdefault(b["user_id"], b)
+        
+        # User details, fetched concurrently and at most once per user
+        users = await user_directory().get_many(booking_counts)
         
-        # For each user, get their details and booking count
         users_list = []
-        for user_id in user_ids:
-            try:
-                # Get user from Supabase auth using service role
-                user_response = supabase_client.auth.admin.get_user_by_id(user_id)
-                
-                # Get booking count
-                bookings_count = supabase_client.table("bookings")\
-                    .select("*", count="exact")\
-                    .eq("user_id", user_id)\
-                    .execute()
-                
-                # Get first booking date
-                first_booking = next((b for b in bookings_response.data if b["user_id"] == user_id), None)
-                
-                if user_response and user_response.user:
-                    users_list.append({
-                        "id": user_response.user.id,
-                        "email": user_response.user.email,
-                        "created_at": user_response.user.created_at,
-                        "booking_count": bookings_count.count or 0,
-                        "user_metadata": user_response.user.user_metadata or {}
-                    })
-                else:
-                    # Fallback if user not found in auth
-                    users_list.append({
-                        "id": user_id,
-                        "email": f"user_{user_id[:8]}@deleted.com",
-                        "created_at": first_booking["created_at"] if first_booking else None,
-                        "booking_count": bookings_count.count or 0,
-                        "user_metadata": {}
-                    })
-            except Exception as user_error:
-                print(f"Error fetching user {user_id}: {str(user_error)}")
-                # Add user with limited info if fetch fails
-                bookings_count = supabase_client.table("bookings")\
-                    .select("*", count="exact")\
-                    .eq("user_id", user_id)\
-                    .execute()
-                first_booking = next((b for b in bookings_response.data if b["user_id"] == user_id), None)
-                
+        for user_id, user in users.items():
+            first_booking = first_bookings[user_id]
+            if isinstance(user, Exception):
+                print(f"Error fetching user {user_id}: {str(user)}")
                 users_list.append({
                     "id": user_id,
                     "email": f"user_{user_id[:8]}@unknown.com",
-                    "created_at": first_booking["created_at"] if first_booking else None,
-                    "booking_count": bookings_count.count or 0,
+                    "created_at": first_booking["created_at"],
+                    "booking_count": booking_counts[user_id],
+                    "user_metadata": {}
+                })
+            elif user:
+                users_list.append({
+                    "id": user.id,
+                    "email": user.email,
+                    "created_at": user.created_at,
+                    "booking_count": booking_counts[user_id],
+                    "user_metadata": user.user_metadata or {}
+                })
+            else:
+                # Fallback if user not found in auth
+                users_list.append({
+                    "id": user_id,
+                    "email": f"user_{user_id[:8]}@deleted.com",
+                    "created_at": first_booking["created_at"],
+                    "booking_count": booking_counts[user_id],
                     "user_metadata": {}
                 })
         
         return {"users": users_list}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching users: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/admin/users/{user_id}")
 async def delete_user(user_id: str, current_user: dict = Depends(get_current_user)):
-    if current_user.get("user_metadata", {}).get("role") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
+    require_admin(current_user)
     
     try:
-        # Delete user's bookings
-        supabase_client.table("bookings").delete().eq("user_id", user_id).execute()
+        # Delete user's bookings; deleting again deletes nothing, so it's safe to retry
+        await upstream.call(
+            lambda: supabase_client.table("bookings").delete().eq("user_id", user_id).execute(),
+            kind="write", idempotent=True
+        )
         
         return {"message": "User bookings deleted successfully"}
     except Exception as e:
@@ -263,8 +1127,7 @@ async def delete_user(user_id: str, current_user: dict = Depends(get_current_use
 
 @app.post("/api/admin/users/{user_id}/block")
 async def block_user(user_id: str, current_user: dict = Depends(get_current_user)):
-    if current_user.get("user_metadata", {}).get("role") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
+    require_admin(current_user)
     
     try:
         # Store blocked status in a separate table or user metadata
@@ -275,49 +1138,116 @@ async def block_user(user_id: str, current_user: dict = Depends(get_current_user
 
 @app.get("/api/admin/stats")
 async def get_admin_stats(current_user: dict = Depends(get_current_user)):
-    if current_user.get("user_metadata", {}).get("role") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
+    require_admin(current_user)
     
     try:
-        events_count = supabase_client.table("events").select("*", count="exact").execute()
-        bookings_count = supabase_client.table("bookings").select("*", count="exact").execute()
-        
-        # Get unique users from bookings
-        bookings_response = supabase_client.table("bookings").select("user_id").execute()
-        unique_users = len(set([b["user_id"] for b in bookings_response.data]))
+        return await load_admin_stats()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def merge_archived_report(report: list, archived: list) -> list:
+    # Adds archived_event_report() rows (see bookings_archive.sql) into the live ones
+    merged = {row["event_id"]: dict(row) for row in report}
+    for row in archived:
+        target = merged.setdefault(row["event_id"], dict(row, bookings=0, sold=0, confirmed=0,
+                                                          checked_in=0, cancelled=0, revenue=0))
+        for key in ("bookings", "sold", "confirmed", "checked_in", "cancelled"):
+            target[key] += row[key]
+        target["revenue"] = float(target["revenue"]) + float(row["revenue"])
+        # Archived events have all taken place, so the no-show rate applies
+        if target["bookings"]:
+            target["no_show_rate"] = round(target["confirmed"] / target["bookings"], 4)
+    return sorted(merged.values(), key=lambda row: row["date"])
+
+@app.get("/api/admin/reports/events")
+async def get_event_report(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    include_archived: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    require_admin(current_user)
+    
+    def fetch(event_ids=None):
+        return supabase_client.rpc("event_report", {
+            "date_from": date_from,
+            "date_to": date_to,
+            "event_ids": event_ids
+        }).execute().data
+    
+    try:
+        range_key = (date_from, date_to)
+        event_ids = report_ranges.get(range_key)
+        if event_ids is None:
+            rows = await upstream.call(fetch)
+            event_ids = [row["event_id"] for row in rows]
+            report_ranges.set(range_key, event_ids)
+        else:
+            missing = [event_id for event_id in event_ids if report_cache.get(event_id) is None]
+            rows = await upstream.call(lambda: fetch(missing)) if missing else []
+        for row in rows:
+            report_cache.set(row["event_id"], row)
         
+        report = [report_cache.get(event_id) for event_id in event_ids]
+        report = [row for row in report if row is not None]
+        if include_archived:
+            archived = await upstream.call(lambda: db.read(
+                lambda client: client.rpc("archived_event_report", {
+                    "date_from": date_from,
+                    "date_to": date_to
+                }).execute()
+            ))
+            report = merge_archived_report(report, archived.data)
         return {
-            "total_users": unique_users,
-            "total_events": events_count.count,
-            "total_bookings": bookings_count.count
+            "events": report,
+            "totals": {
+                "sold": sum(row["sold"] for row in report),
+                "checked_in": sum(row["checked_in"] for row in report),
+                "revenue": round(sum(float(row["revenue"]) for row in report), 2)
+            }
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/admin/bookings")
-async def get_all_bookings(current_user: dict = Depends(get_current_user)):
-    if current_user.get("user_metadata", {}).get("role") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
+async def get_all_bookings(include_archived: bool = False, current_user: dict = Depends(get_current_user)):
+    require_admin(current_user)
     
     try:
         # Get all bookings with event details
-        response = supabase_client.table("bookings")\
-            .select("*, events(*)")\
-            .order("created_at", desc=True)\
+        response = await upstream.call(lambda: db.read(
+            lambda client: client.table("bookings")
+            .select("*, events(*)")
+            .order("created_at", desc=True)
             .execute()
+        ))
+        rows = response.data
+        if include_archived:
+            archived = await upstream.call(lambda: db.read(
+                lambda client: client.table("bookings_archive")
+                .select("*, events(*)")
+                .order("created_at", desc=True)
+                .execute()
+            ))
+            rows = rows + [{**row, "archived": True} for row in archived.data]
         
-        # Enrich with user details
+        # Enrich with user details, fetching each user once
+        users = await user_directory().get_many(booking["user_id"] for booking in rows)
         bookings_with_users = []
-        for booking in response.data:
-            try:
-                user_response = supabase_client.auth.admin.get_user_by_id(booking["user_id"])
+        for booking in rows:
+            user = users[booking["user_id"]]
+            if user and not isinstance(user, Exception):
                 booking["user"] = {
-                    "id": user_response.user.id,
-                    "email": user_response.user.email,
-                    "user_metadata": user_response.user.user_metadata or {}
+                    "id": user.id,
+                    "email": user.email,
+                    "user_metadata": user.user_metadata or {}
                 }
-            except Exception as e:
-                print(f"Error fetching user {booking['user_id']}: {str(e)}")
+            else:
+                print(f"Error fetching user {booking['user_id']}: {str(user)}")
                 booking["user"] = {
                     "id": booking["user_id"],
                     "email": "unknown@user.com",
@@ -326,24 +1256,40 @@ async def get_all_bookings(current_user: dict = Depends(get_current_user)):
             bookings_with_users.append(booking)
         
         return {"bookings": bookings_with_users}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.patch("/api/admin/bookings/{booking_id}/confirm")
 async def confirm_booking_entry(booking_id: str, current_user: dict = Depends(get_current_user)):
-    if current_user.get("user_metadata", {}).get("role") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
+    require_admin(current_user)
     
     try:
-        # Update booking status to 'checked_in'
-        response = supabase_client.table("bookings")\
-            .update({"status": "checked_in"})\
-            .eq("id", booking_id)\
-            .execute()
+        # Update booking status to 'checked_in'. Only confirmed bookings qualify,
+        # so an arrival counts once and a cancelled booking (even one cancelled
+        # a moment ago) never takes its seats back. A retry finds it checked in.
+        response = await upstream.call(
+            lambda: supabase_client.table("bookings")
+                .update({"status": "checked_in"})
+                .eq("id", booking_id)
+                .eq("status", "confirmed")
+                .execute(),
+            kind="write", idempotent=True
+        )
         
         if not response.data:
-            raise HTTPException(status_code=404, detail="Booking not found")
+            existing = await upstream.call(
+                lambda: supabase_client.table("bookings").select("*").eq("id", booking_id).execute()
+            )
+            if not existing.data:
+                raise HTTPException(status_code=404, detail="Booking not found")
+            if existing.data[0]["status"] != "checked_in":
+                raise HTTPException(status_code=409, detail=f"Booking is {existing.data[0]['status']}")
+            return {"message": "Entry already confirmed", "booking": existing.data[0]}
         
+        checkin_tracker.record_checkin(response.data[0]["event_id"])
+        invalidate_event_report(response.data[0]["event_id"])
         return {"message": "Entry confirmed successfully", "booking": response.data[0]}
     except HTTPException:
         raise
@@ -352,8 +1298,7 @@ async def confirm_booking_entry(booking_id: str, current_user: dict = Depends(ge
 
 @app.post("/api/admin/bookings/verify-qr")
 async def verify_qr_code(qr_data: dict, current_user: dict = Depends(get_current_user)):
-    if current_user.get("user_metadata", {}).get("role") != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
+    require_admin(current_user)
     
     try:
         ticket_id = qr_data.get("ticketId")
@@ -361,23 +1306,24 @@ async def verify_qr_code(qr_data: dict, current_user: dict = Depends(get_current
             raise HTTPException(status_code=400, detail="Invalid QR code data")
         
         # Get booking details
-        response = supabase_client.table("bookings")\
-            .select("*, events(*)")\
-            .eq("id", ticket_id)\
-            .execute()
+        response = await upstream.call(
+            lambda: supabase_client.table("bookings").select("*, events(*)").eq("id", ticket_id).execute()
+        )
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Booking not found")
         
         booking = response.data[0]
+        if booking.get("status") == "cancelled":
+            raise HTTPException(status_code=409, detail="Booking is cancelled")
         
         # Get user details
         try:
-            user_response = supabase_client.auth.admin.get_user_by_id(booking["user_id"])
+            user = await fetch_auth_user(booking["user_id"])
             booking["user"] = {
-                "id": user_response.user.id,
-                "email": user_response.user.email,
-                "user_metadata": user_response.user.user_metadata or {}
+                "id": user.id,
+                "email": user.email,
+                "user_metadata": user.user_metadata or {}
             }
         except Exception:
             booking["user"] = {
@@ -386,12 +1332,26 @@ async def verify_qr_code(qr_data: dict, current_user: dict = Depends(get_current
                 "user_metadata": {}
             }
         
-        # Auto-confirm entry
-        supabase_client.table("bookings")\
-            .update({"status": "checked_in"})\
-            .eq("id", ticket_id)\
-            .execute()
+        # Auto-confirm entry; conditional, so a cancel that lands in between wins
+        updated = await upstream.call(
+            lambda: supabase_client.table("bookings")
+                .update({"status": "checked_in"})
+                .eq("id", ticket_id)
+                .eq("status", "confirmed")
+                .execute(),
+            kind="write", idempotent=True
+        )
         
+        if updated.data:
+            checkin_tracker.record_checkin(booking["event_id"])
+            invalidate_event_report(booking["event_id"])
+        else:
+            current = await upstream.call(
+                lambda: supabase_client.table("bookings").select("status").eq("id", ticket_id).execute()
+            )
+            current_status = current.data[0]["status"] if current.data else None
+            if current_status != "checked_in":
+                raise HTTPException(status_code=409, detail=f"Booking is {current_status or 'gone'}")
         booking["status"] = "checked_in"
         
         return {
@@ -404,6 +1364,122 @@ async def verify_qr_code(qr_data: dict, current_user: dict = Depends(get_current
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Splits a hot event's seat counter over several rows so concurrent bookings
+# stop queueing on the event row (see event_seat_shards.sql)
+@app.post("/api/admin/events/{event_id}/seat-shards")
+async def shard_event_seats(event_id: str, body: SeatShards, current_user: dict = Depends(get_current_user)):
+    require_admin(current_user)
+    
+    if not 0 <= body.shards <= 64:
+        raise HTTPException(status_code=400, detail="shards must be between 0 and 64")
+    try:
+        await upstream.call(
+            lambda: supabase_client.rpc(
+                "shard_event_seats", {"p_event_id": event_id, "p_shards": body.shards}
+            ).execute(),
+            kind="write"
+        )
+        return {"event_id": event_id, "shards": body.shards}
+    except HTTPException:
+        raise
+    except Exception as e:
+        if "Event not found" in str(e):
+            raise HTTPException(status_code=404, detail="Event not found")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/events/{event_id}/tickets/prerender")
+async def prerender_event_tickets(event_id: str, current_user: dict = Depends(get_current_user)):
+    require_admin(current_user)
+    
+    try:
+        event = await upstream.call(
+            lambda: supabase_client.table("events").select("*").eq("id", event_id).execute()
+        )
+        if not event.data:
+            raise HTTPException(status_code=404, detail="Event not found")
+        # Paged, since PostgREST returns at most 1000 rows per request; each
+        # page is rendered before the next one is fetched
+        page_size = 1000
+        total = rendered = 0
+        while True:
+            page = await upstream.call(
+                lambda offset=total: supabase_client.table("bookings")
+                    .select("id, user_id, event_id, quantity, status, created_at")
+                    .eq("event_id", event_id)
+                    .order("id")
+                    .range(offset, offset + page_size - 1)
+                    .execute()
+            )
+            rendered += await prerender(ticket_cache, page.data, event.data[0])
+            total += len(page.data)
+            if len(page.data) < page_size:
+                break
+        
+        metrics.inc("tickets.prerendered", rendered)
+        return {"bookings": total, "rendered": rendered}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/metrics")
+async def get_metrics(current_user: dict = Depends(get_current_user)):
+    require_admin(current_user)
+    
+    return {"metrics": metrics.snapshot(), "dead_jobs": job_queue.dead_letters(), "replicas": db.status()}
+
+@app.get("/api/admin/checkins/stream")
+async def stream_checkins(event_id: Optional[str] = None, current_user: dict = Depends(get_stream_user)):
+    require_admin(current_user)
+    
+    try:
+        # Loaded from the bookings table once per process; scans keep it current
+        await checkin_tracker.ensure_loaded(fetch_checkin_rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(
+        checkin_tracker.stream(event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Several GET routes in one round trip, e.g. everything the admin dashboard
+# needs for first paint. Authenticates once; sub-requests run concurrently and
+# share one user directory (see batch.py).
+@app.post("/api/batch")
+async def batch_requests(body: BatchRequest, request: Request, current_user: dict = Depends(get_current_user)):
+    if not body.requests:
+        return {"responses": []}
+    if len(body.requests) > settings.batch_max_requests:
+        raise HTTPException(status_code=400, detail=f"At most {settings.batch_max_requests} requests per batch")
+    for item in body.requests:
+        path = item.path.split("?", 1)[0]
+        # Streams never finish, and tickets are binary
+        if (not path.startswith("/api/") or path == "/api/batch" or path.endswith("/stream")
+                or path.endswith((".png", ".pdf"))):
+            raise HTTPException(status_code=400, detail=f"Path can't be batched: {item.path}")
+    
+    # Only the credentials are passed on; the sub-responses are embedded as JSON
+    headers = [(k, v) for k, v in request.scope["headers"] if k == b"authorization"]
+    token = request.headers.get("Authorization", "")[7:]
+    auth_token = verified_auth.set((token, current_user))
+    users_token = batch_users.set(UserDirectory(fetch_auth_user))
+    try:
+        results = await asyncio.gather(*[dispatch(app, request.scope, item.path, headers) for item in body.requests])
+    finally:
+        verified_auth.reset(auth_token)
+        batch_users.reset(users_token)
+    
+    metrics.inc("batch.requests")
+    metrics.inc("batch.sub_requests", len(body.requests))
+    return {
+        "responses": [
+            {"id": item.id, "path": item.path, "status": status_code, "body": result}
+            for item, (status_code, result) in zip(body.requests, results)
+        ]
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
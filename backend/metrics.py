@@ -0,0 +1,21 @@
+"""Process-local counters and gauges exposed on /api/admin/metrics."""
+from collections import defaultdict
+
+_counters = defaultdict(int)
+_gauges = {}
+
+
+def inc(name, value=1):
+    _counters[name] += value
+
+
+def register_gauge(name, fn):
+    # fn is called on every snapshot, so it should be cheap
+    _gauges[name] = fn
+
+
+def snapshot():
+    data = dict(_counters)
+    for name, fn in _gauges.items():
+        data[name] = fn()
+    return data
@@ -0,0 +1,32 @@
+from pydantic import BaseModel, EmailStr
+from typing import Optional, List
+
+# Models
+class Event(BaseModel):
+    title: str
+    description: str
+    date: str
+    location: str
+    price: float
+    capacity: int
+    image_url: Optional[str] = None
+
+class Booking(BaseModel):
+    event_id: str
+    quantity: int
+    user_id: Optional[str] = None  # Optional since we get it from auth
+
+class User(BaseModel):
+    email: EmailStr
+    name: str
+    role: str = "user"
+
+class SeatShards(BaseModel):
+    shards: int  # 0 goes back to the single counter on the event row
+
+class BatchItem(BaseModel):
+    path: str  # GET path with optional query string, e.g. "/api/admin/bookings?include_archived=true"
+    id: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
@@ -0,0 +1,163 @@
+"""Token-bucket rate limiting as an ASGI middleware.
+
+Requests are keyed by user when the bearer token's signature checks out,
+otherwise by client IP. ``verify`` does that check locally (no auth round
+trip); an unverified ``sub`` is never used, since minting tokens with random
+subs would otherwise give an attacker a fresh bucket per request, or let them
+drain a chosen user's bucket. Limited requests get a 429 with
+``Retry-After`` before any database work.
+
+Each bucket is two floats in an OrderedDict used as an LRU, so lookups are
+O(1) and idle keys are evicted once ``max_keys`` is exceeded. With several
+workers, set RATE_LIMIT_SQLITE_PATH to share buckets through a SQLite file.
+"""
+import asyncio
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class RatePolicy:
+    def __init__(self, method, path_pattern, rate, burst):
+        # rate: tokens added per second; burst: bucket size
+        self.method = method
+        self.path_re = re.compile(path_pattern)
+        self.rate = rate
+        self.burst = burst
+        self.name = f"{method} {path_pattern}"
+
+
+class MemoryBucketStore:
+    blocking = False
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def take(self, key, rate, burst, now):
+        """Spend one token. Returns 0 if allowed, else seconds until one is available."""
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class SqliteBucketStore:
+    # Shares buckets between worker processes. Costs one short write
+    # transaction per limited request, so only use it when running several
+    # workers. take() blocks, so the middleware runs it in a worker thread.
+
+    blocking = True
+
+    def __init__(self, path, max_keys=100_000):
+        self.path = path
+        self.max_keys = max_keys
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_buckets_updated ON rate_buckets(updated)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=1000")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst, now):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                # Buckets idle for an hour are full again; dropping them is free
+                conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - 3600,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, policies, store=None, verify=None):
+        # verify: async fn(token) -> user id if the signature is valid, else None
+        self.app = app
+        self.policies = policies
+        self.store = store or MemoryBucketStore()
+        self.verify = verify
+
+    def _policy(self, method, path):
+        for policy in self.policies:
+            if policy.method == method and policy.path_re.fullmatch(path):
+                return policy
+        return None
+
+    async def _client_key(self, scope):
+        if self.verify is not None:
+            for name, value in scope.get("headers", []):
+                if name == b"authorization":
+                    value = value.decode("latin-1")
+                    if value.lower().startswith("bearer "):
+                        user_id = await self.verify(value[7:])
+                        if user_id:
+                            return f"user:{user_id}"
+                    break
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        policy = self._policy(scope["method"], scope["path"])
+        if policy is None:
+            return await self.app(scope, receive, send)
+
+        key = f"{policy.name}|{await self._client_key(scope)}"
+        if self.store.blocking:
+            wait = await asyncio.to_thread(self.store.take, key, policy.rate, policy.burst, time.time())
+        else:
+            wait = self.store.take(key, policy.rate, policy.burst, time.time())
+        if not wait:
+            return await self.app(scope, receive, send)
+
+        body = json.dumps({"detail": "Too many requests"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(wait)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,27 @@
+-- Replication lag probe used by the API's replica router (see replicas.py)
+-- Run this in Supabase SQL Editor on the primary; it replicates to the read
+-- replicas with everything else.
+--
+-- On a replica this is the age of the last replayed transaction; on the
+-- primary it is 0. When the primary is idle the age grows even though the
+-- replica is fully caught up, so the API treats a lagging replica as "use
+-- the primary for now", never as an error.
+--
+-- A replica whose WAL receiver isn't streaming (primary unreachable,
+-- replication slot gone) has replayed everything it received and would look
+-- caught up, so it returns NULL, which the API counts as unhealthy. The
+-- function runs as its owner because pg_stat_wal_receiver hides its columns
+-- from roles without pg_read_all_stats.
+
+CREATE OR REPLACE FUNCTION public.replica_lag_seconds()
+RETURNS DOUBLE PRECISION AS $$
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+        ELSE
+            COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+            * (CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 ELSE 1 END)
+    END::DOUBLE PRECISION;
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = pg_catalog;
+
+GRANT EXECUTE ON FUNCTION public.replica_lag_seconds TO anon, authenticated, service_role;
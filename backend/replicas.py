@@ -0,0 +1,104 @@
+"""Read/write splitting between the Supabase primary and read replicas.
+
+Writes, and reads that must see them, use the primary. Other reads are
+spread round-robin over the replicas that passed their last health check
+and are within ``max_lag`` seconds of the primary (see read_replicas.sql for
+the lag probe). If no replica qualifies, reads go to the primary.
+
+A user who just wrote is pinned to the primary for ``sticky_seconds``, so
+"book, then open My Bookings" always shows the new booking.
+"""
+import asyncio
+import itertools
+import time
+
+import metrics
+from cache import TTLCache
+from upstream import RETRYABLE
+
+
+class Replica:
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.healthy = False
+        self.lag = None
+        self.checked_at = None
+
+
+class ReplicaRouter:
+    def __init__(self, primary, replicas, max_lag=5.0, check_interval=5.0, sticky_seconds=10.0):
+        # primary and replicas: supabase clients (or LazyClient wrappers)
+        self.primary = primary
+        self.replicas = [Replica(f"replica-{i}", client) for i, client in enumerate(replicas)]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._recent_writers = TTLCache(ttl=sticky_seconds, maxsize=100_000)
+        self._next = itertools.count()
+        metrics.register_gauge("replicas.healthy", lambda: sum(1 for r in self.replicas if self._usable(r)))
+
+    def _usable(self, replica):
+        return replica.healthy and replica.lag is not None and replica.lag <= self.max_lag
+
+    def mark_write(self, user_id):
+        if user_id:
+            self._recent_writers.set(user_id, True)
+
+    def _pick(self, user_id=None):
+        if user_id and self._recent_writers.get(user_id):
+            metrics.inc("replicas.sticky_primary_reads")
+            return None
+        usable = [replica for replica in self.replicas if self._usable(replica)]
+        if not usable:
+            return None
+        return usable[next(self._next) % len(usable)]
+
+    def read(self, fn, user_id=None):
+        """Run ``fn(client)`` on a replica, or on the primary when none is usable.
+
+        Blocking; call it inside ``upstream.call``. A replica that fails with a
+        transport error is marked unhealthy and the read is retried on the
+        primary.
+        """
+        replica = self._pick(user_id)
+        if replica is None:
+            metrics.inc("replicas.primary_reads")
+            return fn(self.primary)
+        try:
+            result = fn(replica.client)
+        except RETRYABLE as e:
+            replica.healthy = False
+            metrics.inc("replicas.failovers")
+            print(f"Read from {replica.name} failed, using primary: {str(e)}")
+            return fn(self.primary)
+        metrics.inc("replicas.replica_reads")
+        return result
+
+    def _check(self, replica):
+        try:
+            response = replica.client.rpc("replica_lag_seconds", {}).execute()
+            if response.data is None:
+                raise RuntimeError("not streaming from the primary")
+            replica.lag = float(response.data)
+            replica.healthy = True
+        except Exception as e:
+            if replica.healthy:
+                print(f"{replica.name} failed its health check: {str(e)}")
+            replica.healthy = False
+        replica.checked_at = time.time()
+
+    def status(self):
+        return [
+            {"name": r.name, "healthy": r.healthy, "lag": r.lag, "usable": self._usable(r), "checked_at": r.checked_at}
+            for r in self.replicas
+        ]
+
+    async def run(self):
+        if not self.replicas:
+            return
+        while True:
+            await asyncio.gather(
+                *[asyncio.to_thread(self._check, replica) for replica in self.replicas],
+                return_exceptions=True
+            )
+            await asyncio.sleep(self.check_interval)
@@ -0,0 +1,45 @@
+-- Minimal stand-in for Supabase's auth schema and roles, so the project's SQL
+-- files run on a plain local Postgres. Used by scale/generate_dataset.py.
+-- Do not run this on a Supabase project.
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        CREATE ROLE anon NOLOGIN;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'authenticated') THEN
+        CREATE ROLE authenticated NOLOGIN;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'service_role') THEN
+        CREATE ROLE service_role NOLOGIN BYPASSRLS;
+    END IF;
+END
+$$;
+
+CREATE SCHEMA IF NOT EXISTS auth;
+
+CREATE TABLE IF NOT EXISTS auth.users (
+    id UUID PRIMARY KEY,
+    email TEXT,
+    raw_user_meta_data JSONB,
+    raw_app_meta_data JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE auth.users ADD COLUMN IF NOT EXISTS raw_app_meta_data JSONB;
+
+-- Same behaviour as Supabase: claims come from the request.jwt.claims setting
+CREATE OR REPLACE FUNCTION auth.jwt()
+RETURNS JSONB AS $$
+    SELECT COALESCE(NULLIF(current_setting('request.jwt.claims', true), ''), '{}')::JSONB;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION auth.uid()
+RETURNS UUID AS $$
+    SELECT NULLIF(auth.jwt() ->> 'sub', '')::UUID;
+$$ LANGUAGE sql STABLE;
+
+GRANT USAGE ON SCHEMA auth, public TO anon, authenticated, service_role;
+GRANT EXECUTE ON ALL FUNCTIONS IN SCHEMA auth TO anon, authenticated, service_role;
+ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT ALL ON TABLES TO anon, authenticated, service_role;
+ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT ALL ON SEQUENCES TO anon, authenticated, service_role;
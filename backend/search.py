@@ -0,0 +1,75 @@
+"""In-process event search for the in-memory backend.
+
+Text and location terms are looked up in an inverted index (token -> event
+ids) and intersected smallest-first, so a query only touches events that
+contain every term. Queries with no text terms start from a date-sorted list
+instead, narrowed with binary search.
+"""
+import bisect
+import heapq
+import re
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return set(TOKEN_RE.findall(text.lower())) if text else set()
+
+
+class EventSearchIndex:
+    def __init__(self):
+        self._events = {}
+        self._text = {}
+        self._location = {}
+        self._by_date = []
+
+    def add(self, event):
+        event_id = event["id"]
+        self._events[event_id] = event
+        for token in tokenize(event.get("title")) | tokenize(event.get("description")):
+            self._text.setdefault(token, set()).add(event_id)
+        for token in tokenize(event.get("location")):
+            self._location.setdefault(token, set()).add(event_id)
+        bisect.insort(self._by_date, (event["date"], event_id))
+
+    def search(self, q=None, date_from=None, date_to=None, min_price=None, max_price=None,
+               location=None, limit=50):
+        postings = [self._text.get(token, set()) for token in tokenize(q)]
+        postings += [self._location.get(token, set()) for token in tokenize(location)]
+
+        if postings:
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for ids in postings[1:]:
+                candidates &= ids
+                if not candidates:
+                    return []
+            # Filter first, then only order the page that is returned
+            matches = (self._events[event_id] for event_id in candidates)
+            filtered = (e for e in matches if self._matches(e, date_from, date_to, min_price, max_price))
+            return heapq.nsmallest(limit, filtered, key=lambda e: e["date"])
+
+        # ISO-8601 strings sort chronologically, so compare them directly;
+        # date_to is inclusive of anything it prefixes ("2026-03-15" covers the whole day)
+        lo = bisect.bisect_left(self._by_date, (date_from,)) if date_from else 0
+        hi = bisect.bisect_left(self._by_date, (date_to + "\uffff",)) if date_to else len(self._by_date)
+        results = []
+        for _, event_id in self._by_date[lo:hi]:
+            event = self._events[event_id]
+            if self._matches(event, date_from, date_to, min_price, max_price):
+                results.append(event)
+                if len(results) >= limit:
+                    break
+        return results
+
+    @staticmethod
+    def _matches(event, date_from, date_to, min_price, max_price):
+        if date_from and event["date"] < date_from:
+            return False
+        if date_to and event["date"][:len(date_to)] > date_to:
+            return False
+        if min_price is not None and event["price"] < min_price:
+            return False
+        if max_price is not None and event["price"] > max_price:
+            return False
+        return True
@@ -0,0 +1,177 @@
+-- Two-phase booking: time-limited seat holds
+-- Run this in Supabase SQL Editor after event_availability.sql and waitlist.sql
+--
+-- A hold takes seats out of events.booked_count exactly like a booking does,
+-- so remaining seats, the capacity check and waitlist promotion need no
+-- changes. confirm_hold() swaps a hold for a booking in one transaction.
+-- Expired holds are deleted by the API's in-process expiry heap; the
+-- expires_at index is how it recovers holds after a restart.
+
+CREATE TABLE IF NOT EXISTS seat_holds (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    event_id UUID NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW())
+);
+
+CREATE INDEX IF NOT EXISTS idx_seat_holds_expires_at ON seat_holds(expires_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_seat_holds_one_per_user ON seat_holds(event_id, user_id);
+
+ALTER TABLE seat_holds ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view their own holds" ON seat_holds;
+CREATE POLICY "Users can view their own holds"
+    ON seat_holds FOR SELECT
+    USING (auth.uid() = user_id);
+
+CREATE OR REPLACE FUNCTION public.track_held_seats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE events
+        SET booked_count = booked_count - OLD.quantity
+        WHERE id = OLD.event_id;
+        RETURN OLD;
+    END IF;
+
+    UPDATE events
+    SET booked_count = booked_count + NEW.quantity
+    WHERE id = NEW.event_id
+    AND booked_count + NEW.quantity <= capacity;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Not enough capacity' USING ERRCODE = 'check_violation';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS seat_holds_track_held_seats ON seat_holds;
+CREATE TRIGGER seat_holds_track_held_seats
+    AFTER INSERT OR DELETE ON seat_holds
+    FOR EACH ROW EXECUTE FUNCTION public.track_held_seats();
+
+-- Releases the hold's seats and takes them again as a booking. Raises
+-- 'Hold expired' if the hold is gone or past its deadline.
+CREATE OR REPLACE FUNCTION public.confirm_hold(p_hold_id UUID, p_user_id UUID)
+RETURNS SETOF bookings AS $$
+DECLARE
+    hold seat_holds%ROWTYPE;
+BEGIN
+    DELETE FROM seat_holds
+    WHERE id = p_hold_id
+      AND user_id = p_user_id
+      AND expires_at > NOW()
+    RETURNING * INTO hold;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Hold expired' USING ERRCODE = 'no_data_found';
+    END IF;
+
+    RETURN QUERY
+    INSERT INTO bookings (event_id, user_id, quantity, status)
+    VALUES (hold.event_id, hold.user_id, hold.quantity, 'confirmed')
+    RETURNING *;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Releases a hold before its deadline and hands the seats to waiters in the
+-- same transaction. Returns a 'released' row and one 'promoted' row per
+-- waitlist promotion, like expire_seat_holds, or no rows if the user has no
+-- such hold.
+CREATE OR REPLACE FUNCTION public.release_seat_hold(p_hold_id UUID, p_user_id UUID)
+RETURNS TABLE (kind TEXT, event_id UUID, waitlist_id BIGINT, booking_id UUID, user_id UUID, quantity INTEGER) AS $$
+DECLARE
+    hold seat_holds%ROWTYPE;
+BEGIN
+    SELECT * INTO hold FROM seat_holds h WHERE h.id = p_hold_id AND h.user_id = p_user_id;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    -- promote_waitlist locks the event row; take it before the seats are
+    -- released so every path locks the event before its seat counters
+    PERFORM 1 FROM events e WHERE e.id = hold.event_id FOR NO KEY UPDATE;
+
+    DELETE FROM seat_holds h
+    WHERE h.id = p_hold_id AND h.user_id = p_user_id
+    RETURNING * INTO hold;
+
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    kind := 'released';
+    event_id := hold.event_id;
+    user_id := hold.user_id;
+    quantity := hold.quantity;
+    RETURN NEXT;
+
+    RETURN QUERY
+    SELECT 'promoted'::TEXT, hold.event_id, p.waitlist_id, p.booking_id, p.user_id, p.quantity
+    FROM promote_waitlist(hold.event_id) p;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Deletes expired holds, either the given ids or (for recovery) any expired
+-- hold found through idx_seat_holds_expires_at, then hands the freed seats
+-- to waiters. Returns one 'released' row per hold and one 'promoted' row per
+-- waitlist promotion.
+CREATE OR REPLACE FUNCTION public.expire_seat_holds(p_hold_ids UUID[] DEFAULT NULL, p_limit INTEGER DEFAULT 5000)
+RETURNS TABLE (kind TEXT, event_id UUID, waitlist_id BIGINT, booking_id UUID, user_id UUID, quantity INTEGER) AS $$
+DECLARE
+    expired_event UUID;
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS expired_holds (event_id UUID, user_id UUID, quantity INTEGER) ON COMMIT DROP;
+
+    CREATE TEMP TABLE IF NOT EXISTS due_holds (id UUID, event_id UUID) ON COMMIT DROP;
+
+    INSERT INTO due_holds
+    SELECT h.id, h.event_id
+    FROM seat_holds h
+    WHERE h.expires_at <= NOW()
+      AND (p_hold_ids IS NULL OR h.id = ANY(p_hold_ids))
+    LIMIT p_limit;
+
+    -- promote_waitlist locks the event rows; take them before any seats are
+    -- released, like release_seat_hold does, and in event order so that
+    -- concurrent batches don't deadlock
+    PERFORM 1 FROM events e
+    WHERE e.id IN (SELECT d.event_id FROM due_holds d)
+    ORDER BY e.id
+    FOR NO KEY UPDATE;
+
+    -- Holds someone is confirming or releasing right now are theirs
+    WITH due AS (
+        SELECT h.id
+        FROM seat_holds h
+        JOIN due_holds d ON d.id = h.id
+        FOR UPDATE OF h SKIP LOCKED
+    ), deleted AS (
+        DELETE FROM seat_holds h
+        USING due
+        WHERE h.id = due.id
+        RETURNING h.event_id, h.user_id, h.quantity
+    )
+    INSERT INTO expired_holds SELECT * FROM deleted;
+
+    RETURN QUERY
+    SELECT 'released'::TEXT, e.event_id, NULL::BIGINT, NULL::UUID, e.user_id, e.quantity
+    FROM expired_holds e;
+
+    FOR expired_event IN SELECT DISTINCT e.event_id FROM expired_holds e LOOP
+        RETURN QUERY
+        SELECT 'promoted'::TEXT, expired_event, p.waitlist_id, p.booking_id, p.user_id, p.quantity
+        FROM promote_waitlist(expired_event) p;
+    END LOOP;
+
+    DELETE FROM expired_holds;
+    DELETE FROM due_holds;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+GRANT EXECUTE ON FUNCTION public.confirm_hold TO service_role;
+GRANT EXECUTE ON FUNCTION public.release_seat_hold TO service_role;
+GRANT EXECUTE ON FUNCTION public.expire_seat_holds TO service_role;
@@ -1,18 +1,35 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, WebSocket, status, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
+import asyncio
 import os
 from dotenv import load_dotenv
 import jwt
 import uuid
 from datetime import datetime
+from local_store import LocalStore, MemoryDatabase, EventNotFound, NotEnoughCapacity
+from availability_push import AvailabilityBroadcaster
+from rate_limit import RateLimitMiddleware, RatePolicy, MemoryBucketStore, SqliteBucketStore
 
 load_dotenv()
 
 app = FastAPI(title="Event Booking API", version="1.0.0")
 
+# Rate limiting, per client IP. Added before CORS so
+# 429 responses still carry CORS headers.
+app.add_middleware(
+    RateLimitMiddleware,
+    policies=[
+        # method, path regex, tokens per second, burst
+        RatePolicy("POST", r"/api/bookings", 0.5, 5),
+        RatePolicy("GET", r"/api/events/search", 5, 20),
+        RatePolicy("GET", r"/api/events/[^/]+", 10, 30),
+    ],
+    store=SqliteBucketStore(os.environ["RATE_LIMIT_SQLITE_PATH"]) if os.getenv("RATE_LIMIT_SQLITE_PATH") else MemoryBucketStore()
+)
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -45,9 +62,19 @@ class User(BaseModel):
     name: str
     role: str = "user"
 
-# In-memory storage for testing
-events_db = []
-bookings_db = []
+# Storage backend:
+#   memory - rows in process memory, persisted to a write-ahead log + snapshots
+#            in LOCAL_STORE_DIR (single worker only)
+#   sqlite - shared SQLite file in WAL mode, safe with several uvicorn workers
+if os.getenv("LOCAL_BACKEND", "memory") == "sqlite":
+    from sqlite_store import SqliteDatabase
+    db = SqliteDatabase(os.getenv("SQLITE_PATH", "local_data/events.db"))
+else:
+    db = MemoryDatabase(LocalStore(
+        os.getenv("LOCAL_STORE_DIR", "local_data"),
+        fsync_interval=float(os.getenv("LOCAL_STORE_FSYNC_MS", "2")) / 1000,
+        snapshot_every=int(os.getenv("LOCAL_STORE_SNAPSHOT_EVERY", "100000")),
+    ))
 
 # Sample events for testing
 sample_events = [
@@ -73,7 +100,22 @@ sample_events = [
     }
 ]
 
-events_db.extend(sample_events)
+# Seed the sample events only on first start
+db.seed_events(sample_events)
+
+# Pushes remaining-seat changes to /ws/availability subscribers
+broadcaster = AvailabilityBroadcaster(
+    db.availability,
+    interval=float(os.getenv("AVAILABILITY_PUSH_INTERVAL", "0.5"))
+)
+
+@app.on_event("startup")
+async def start_broadcaster():
+    asyncio.create_task(broadcaster.run())
+
+@app.on_event("shutdown")
+async def close_db():
+    await db.close()
 
 # Auth Dependency
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -154,48 +196,61 @@ async def root():
 
 @app.get("/api/events")
 async def get_events():
-    return {"events": events_db}
+    return {"events": await db.list_events()}
+
+@app.get("/api/events/search")
+async def search_events(
+    q: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    location: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    events = await db.search_events(
+        q=q, date_from=date_from, date_to=date_to, min_price=min_price,
+        max_price=max_price, location=location, limit=limit
+    )
+    return {"events": events}
+
+@app.get("/api/events/availability")
+async def get_events_availability(ids: str):
+    event_ids = [event_id for event_id in dict.fromkeys(ids.split(",")) if event_id]
+    if len(event_ids) > 500:
+        raise HTTPException(status_code=400, detail="Too many event ids (max 500)")
+    return {"availability": await db.availability(event_ids)}
+
+@app.websocket("/ws/availability")
+async def availability_socket(websocket: WebSocket, ids: str = ""):
+    await broadcaster.serve(websocket, [event_id for event_id in ids.split(",") if event_id])
 
 @app.get("/api/events/{event_id}")
 async def get_event(event_id: str):
-    event = next((e for e in events_db if e["id"] == event_id), None)
+    event = await db.get_event(event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     return event
 
 @app.post("/api/events", status_code=status.HTTP_201_CREATED)
 async def create_event(event: Event, current_user: dict = Depends(get_current_user)):
-    if current_user.get("user_metadata", {}).get("role") != "admin":
+    if current_user.get("app_metadata", {}).get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     new_event = {
         "id": str(uuid.uuid4()),
         **event.dict()
     }
-    events_db.append(new_event)
-    return new_event
+    return await db.add_event(new_event)
 
 @app.get("/api/bookings")
 async def get_user_bookings(current_user: dict = Depends(get_current_user)):
     user_id = current_user.get("sub")
-    user_bookings = [b for b in bookings_db if b["user_id"] == user_id]
-    return {"bookings": user_bookings}
+    return {"bookings": await db.user_bookings(user_id)}
 
 @app.post("/api/bookings", status_code=status.HTTP_201_CREATED)
 async def create_booking(booking: Booking, current_user: dict = Depends(get_current_user)):
     try:
-        # Check if event exists and has capacity
-        event = next((e for e in events_db if e["id"] == booking.event_id), None)
-        if not event:
-            raise HTTPException(status_code=404, detail="Event not found")
-        
-        # Check capacity (simplified for demo)
-        existing_bookings = [b for b in bookings_db if b["event_id"] == booking.event_id]
-        total_booked = sum(b["quantity"] for b in existing_bookings)
-        
-        if total_booked + booking.quantity > event["capacity"]:
-            raise HTTPException(status_code=400, detail="Not enough capacity")
-        
         # Create booking
         new_booking = {
             "id": str(uuid.uuid4()),
@@ -205,21 +260,28 @@ async def create_booking(booking: Booking, current_user: dict = Depends(get_curr
             "created_at": datetime.now().isoformat()
         }
         
-        bookings_db.append(new_booking)
-        return new_booking
+        # The capacity check happens atomically inside the data layer
+        created = await db.create_booking(new_booking)
+        broadcaster.publish(booking.event_id)
+        return created
         
+    except EventNotFound:
+        raise HTTPException(status_code=404, detail="Event not found")
+    except NotEnoughCapacity:
+        raise HTTPException(status_code=400, detail="Not enough capacity")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/admin/stats")
 async def get_admin_stats(current_user: dict = Depends(get_current_user)):
-    if current_user.get("user_metadata", {}).get("role") != "admin":
+    if current_user.get("app_metadata", {}).get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     return {
         "total_users": 100,  # Dummy data
-        "total_events": len(events_db),
-        "total_bookings": len(bookings_db)
+        **await db.stats()
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,28 @@
+"""Request coalescing for hot read endpoints.
+
+Concurrent calls with the same key share one in-flight upstream call and
+its result instead of each issuing an identical query. The shared call runs
+in its own task, so a caller that disconnects doesn't cancel it for the
+others. Results are shared objects and must not be mutated by callers.
+"""
+import asyncio
+
+import metrics
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._inflight = {}
+
+    async def do(self, key, fn):
+        # fn: zero-argument callable returning an awaitable
+        task = self._inflight.get(key)
+        if task is None:
+            metrics.inc(f"singleflight.{self.name}.calls")
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            metrics.inc(f"singleflight.{self.name}.collapsed")
+        return await asyncio.shield(task)
@@ -0,0 +1,235 @@
+"""Shared SQLite data layer for running simple_backend.py with several workers.
+
+Selected with LOCAL_BACKEND=sqlite. Every uvicorn worker opens the same
+database file in WAL mode, so readers never block the single writer and all
+processes see the same seat counts. Each thread keeps one connection for its
+lifetime instead of reconnecting per request, and the capacity check and the
+booking insert run in one ``BEGIN IMMEDIATE`` transaction against a
+``booked`` counter on the event row, so two processes can never oversell.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+
+from local_store import EventNotFound, NotEnoughCapacity
+from search import tokenize
+
+PRAGMAS = [
+    # First, so switching to WAL waits for a lock held by another process
+    # instead of failing with "database is locked"
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA journal_mode=WAL",
+    # WAL + NORMAL only fsyncs at checkpoints; committed writes survive a
+    # process crash, the last few may be lost on power failure.
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT,
+    date TEXT NOT NULL,
+    location TEXT NOT NULL,
+    price REAL NOT NULL,
+    capacity INTEGER NOT NULL,
+    image_url TEXT,
+    booked INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS bookings (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    event_id TEXT NOT NULL REFERENCES events(id),
+    quantity INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_date ON events(date);
+CREATE INDEX IF NOT EXISTS idx_events_price ON events(price);
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+    title, description, location, content='events', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON events BEGIN
+    INSERT INTO events_fts(rowid, title, description, location)
+    VALUES (new.rowid, new.title, new.description, new.location);
+END;
+CREATE INDEX IF NOT EXISTS idx_bookings_user_id ON bookings(user_id);
+CREATE INDEX IF NOT EXISTS idx_bookings_event_id ON bookings(event_id);
+"""
+
+EVENT_COLUMNS = ["id", "title", "description", "date", "location", "price", "capacity", "image_url"]
+BOOKING_COLUMNS = ["id", "user_id", "event_id", "quantity", "created_at"]
+
+
+class SqliteDatabase:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            # Index events created before the full-text table existed
+            conn.execute("INSERT INTO events_fts(events_fts) VALUES ('rebuild')")
+            conn.execute("PRAGMA user_version = 1")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly below.
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+        return conn
+
+    async def _run(self, fn, *args):
+        # busy_timeout can block for a while under write contention, so keep
+        # it off the event loop.
+        return await asyncio.to_thread(fn, *args)
+
+    @staticmethod
+    def _event(row):
+        event = {column: row[column] for column in EVENT_COLUMNS}
+        event["remaining_seats"] = max(row["capacity"] - row["booked"], 0)
+        return event
+
+    def seed_events(self, rows):
+        conn = self._connection()
+        values = [[row.get(column) for column in EVENT_COLUMNS] for row in rows]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM events LIMIT 1").fetchone() is None:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO events ({', '.join(EVENT_COLUMNS)}) VALUES ({', '.join('?' * len(EVENT_COLUMNS))})",
+                    values,
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _list_events(self):
+        rows = self._connection().execute("SELECT * FROM events ORDER BY date").fetchall()
+        return [self._event(row) for row in rows]
+
+    async def list_events(self):
+        return await self._run(self._list_events)
+
+    def _get_event(self, event_id):
+        row = self._connection().execute("SELECT * FROM events WHERE id = ?", (event_id,)).fetchone()
+        return self._event(row) if row else None
+
+    async def get_event(self, event_id):
+        return await self._run(self._get_event, event_id)
+
+    @staticmethod
+    def _fts_query(column, text):
+        # Quote every token so user input can't inject FTS5 query syntax
+        tokens = tokenize(text)
+        return " AND ".join(f'{column}:"{token}"' for token in tokens)
+
+    def _search_events(self, q=None, date_from=None, date_to=None, min_price=None, max_price=None,
+                       location=None, limit=50):
+        clauses, params = [], []
+        match = " AND ".join(filter(None, [self._fts_query("{title description}", q),
+                                           self._fts_query("location", location)]))
+        if match:
+            clauses.append("rowid IN (SELECT rowid FROM events_fts WHERE events_fts MATCH ?)")
+            params.append(match)
+        if date_from:
+            clauses.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("date < ?")
+            params.append(date_to + "\uffff")
+        if min_price is not None:
+            clauses.append("price >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            clauses.append("price <= ?")
+            params.append(max_price)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(
+            f"SELECT * FROM events {where} ORDER BY date LIMIT ?", [*params, limit]
+        ).fetchall()
+        return [self._event(row) for row in rows]
+
+    async def search_events(self, **filters):
+        return await self._run(lambda: self._search_events(**filters))
+
+    def _availability(self, event_ids):
+        rows = self._connection().execute(
+            f"SELECT id, capacity, booked FROM events WHERE id IN ({', '.join('?' * len(event_ids))})",
+            list(event_ids),
+        ).fetchall()
+        return {row["id"]: max(row["capacity"] - row["booked"], 0) for row in rows}
+
+    async def availability(self, event_ids):
+        if not event_ids:
+            return {}
+        return await self._run(self._availability, event_ids)
+
+    def _add_event(self, row):
+        self._connection().execute(
+            f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}) VALUES ({', '.join('?' * len(EVENT_COLUMNS))})",
+            [row.get(column) for column in EVENT_COLUMNS],
+        )
+        return row
+
+    async def add_event(self, row):
+        return await self._run(self._add_event, row)
+
+    def _user_bookings(self, user_id):
+        rows = self._connection().execute(
+            "SELECT * FROM bookings WHERE user_id = ? ORDER BY created_at", (user_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    async def user_bookings(self, user_id):
+        return await self._run(self._user_bookings, user_id)
+
+    def _create_booking(self, row):
+        conn = self._connection()
+        # Take the write lock up front so concurrent bookings queue on
+        # busy_timeout instead of failing on a read->write upgrade.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            updated = conn.execute(
+                "UPDATE events SET booked = booked + ? WHERE id = ? AND booked + ? <= capacity",
+                (row["quantity"], row["event_id"], row["quantity"]),
+            ).rowcount
+            if not updated:
+                exists = conn.execute("SELECT 1 FROM events WHERE id = ?", (row["event_id"],)).fetchone()
+                raise NotEnoughCapacity(row["event_id"]) if exists else EventNotFound(row["event_id"])
+            conn.execute(
+                f"INSERT INTO bookings ({', '.join(BOOKING_COLUMNS)}) VALUES ({', '.join('?' * len(BOOKING_COLUMNS))})",
+                [row[column] for column in BOOKING_COLUMNS],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    async def create_booking(self, row):
+        return await self._run(self._create_booking, row)
+
+    def _stats(self):
+        conn = self._connection()
+        return {
+            "total_events": conn.execute("SELECT COUNT(*) FROM events").fetchone()[0],
+            "total_bookings": conn.execute("SELECT COUNT(*) FROM bookings").fetchone()[0],
+        }
+
+    async def stats(self):
+        return await self._run(self._stats)
+
+    async def close(self):
+        # Connections belong to the worker threads and close with the process.
+        pass
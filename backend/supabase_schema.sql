@@ -40,14 +40,32 @@ ALTER TABLE profiles ENABLE ROW LEVEL SECURITY;
 ALTER TABLE events ENABLE ROW LEVEL SECURITY;
 ALTER TABLE bookings ENABLE ROW LEVEL SECURITY;
 
+-- Admin check for the policies below: one lookup per statement when called
+-- as (SELECT public.is_admin()), instead of a profiles subquery per row
+CREATE OR REPLACE FUNCTION public.is_admin()
+RETURNS BOOLEAN AS $$
+    SELECT EXISTS (
+        SELECT 1 FROM public.profiles
+        WHERE id = auth.uid()
+        AND role = 'admin'
+    );
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+GRANT EXECUTE ON FUNCTION public.is_admin TO authenticated, service_role;
+
 -- Profiles policies
 CREATE POLICY "Users can view their own profile"
     ON profiles FOR SELECT
-    USING (auth.uid() = id);
+    USING ((SELECT auth.uid()) = id);
 
 CREATE POLICY "Users can update their own profile"
     ON profiles FOR UPDATE
-    USING (auth.uid() = id);
+    USING ((SELECT auth.uid()) = id)
+    WITH CHECK ((SELECT auth.uid()) = id);
+
+-- role (and id, email) stay as the server set them
+REVOKE UPDATE ON profiles FROM anon, authenticated;
+GRANT UPDATE (name, updated_at) ON profiles TO authenticated;
 
 -- Events policies
 CREATE POLICY "Anyone can view events"
@@ -58,44 +76,26 @@ CREATE POLICY "Anyone can view events"
 CREATE POLICY "Admins can create events"
     ON events FOR INSERT
     TO authenticated
-    WITH CHECK (
-        EXISTS (
-            SELECT 1 FROM profiles
-            WHERE profiles.id = auth.uid()
-            AND profiles.role = 'admin'
-        )
-    );
+    WITH CHECK ((SELECT public.is_admin()));
 
 CREATE POLICY "Admins can update events"
     ON events FOR UPDATE
     TO authenticated
-    USING (
-        EXISTS (
-            SELECT 1 FROM profiles
-            WHERE profiles.id = auth.uid()
-            AND profiles.role = 'admin'
-        )
-    );
+    USING ((SELECT public.is_admin()));
 
 -- Bookings policies
 CREATE POLICY "Users can view their own bookings"
     ON bookings FOR SELECT
-    USING (auth.uid() = user_id);
+    USING ((SELECT auth.uid()) = user_id);
 
 CREATE POLICY "Users can create bookings"
     ON bookings FOR INSERT
-    WITH CHECK (auth.uid() = user_id);
+    WITH CHECK ((SELECT auth.uid()) = user_id);
 
 CREATE POLICY "Admins can view all bookings"
     ON bookings FOR SELECT
     TO authenticated
-    USING (
-        EXISTS (
-            SELECT 1 FROM profiles
-            WHERE profiles.id = auth.uid()
-            AND profiles.role = 'admin'
-        )
-    );
+    USING ((SELECT public.is_admin()));
 
 -- Function to create profile on signup
 CREATE OR REPLACE FUNCTION public.handle_new_user()
@@ -106,7 +106,7 @@ BEGIN
         NEW.id,
         NEW.email,
         NEW.raw_user_meta_data->>'name',
-        COALESCE(NEW.raw_user_meta_data->>'role', 'user')
+        COALESCE(NEW.raw_app_meta_data->>'role', 'user')
     );
     RETURN NEW;
 END;
@@ -0,0 +1,94 @@
+"""Cold start checks: import time of main.py and start-to-ready time.
+
+Run from the backend directory:  python -m pytest test_cold_start.py
+Starts uvicorn in a fresh process and polls /healthz and /readyz. Needs
+SUPABASE_URL and SUPABASE_KEY (environment or .env), since readiness
+means the catalog warm-up reached Supabase; without them it is skipped.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from config import get_settings
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+PORT = int(os.getenv("COLD_START_PORT", "8765"))
+BUDGET = float(os.getenv("COLD_START_BUDGET", "5"))
+IMPORT_BUDGET = float(os.getenv("COLD_START_IMPORT_BUDGET", "2"))
+
+pytestmark = pytest.mark.skipif(
+    bool(get_settings().missing()), reason="needs SUPABASE_URL and SUPABASE_KEY"
+)
+
+
+def get(path):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{PORT}{path}", timeout=1) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def wait_for(path, deadline):
+    # Returns (time it answered 200, body), or (None, last body)
+    body = None
+    while time.perf_counter() < deadline:
+        try:
+            status, body = get(path)
+            if status == 200:
+                return time.perf_counter(), body
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.02)
+    return None, body
+
+
+@pytest.fixture(scope="module")
+def server():
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=BACKEND
+    )
+    try:
+        yield started
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def test_import_time():
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=BACKEND)
+    elapsed = float(output.stdout.strip().splitlines()[-1])
+    print(f"Import of main.py: {elapsed:.3f}s")
+    assert elapsed <= IMPORT_BUDGET
+
+
+def test_ready_within_budget(server):
+    deadline = server + BUDGET * 4
+    live, _ = wait_for("/healthz", deadline)
+    assert live is not None, "server never became live"
+    ready, body = wait_for("/readyz", deadline)
+    assert ready is not None, f"server never became ready: {body}"
+
+    print(f"Start to live: {live - server:.3f}s, to ready: {ready - server:.3f}s (budget {BUDGET}s)")
+    # No JWKS to fetch on projects that sign with HS256
+    assert body["warmup"]["jwks"] in ("ok", "skipped")
+    assert body["warmup"]["catalog"] == "ok"
+    assert body["warmup"]["stats"] == "ok"
+    assert ready - server <= BUDGET
+
+
+def test_catalog_served(server):
+    ready, _ = wait_for("/readyz", server + BUDGET * 4)
+    assert ready is not None
+    status, body = get("/api/events")
+    assert status == 200
+    assert isinstance(body["events"], list)
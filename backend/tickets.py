@@ -0,0 +1,134 @@
+"""Server-side ticket rendering (PNG and PDF) with an on-disk cache.
+
+A ticket only changes when its booking status does, so rendered files are
+cached under ``<booking id>-<version>.<ext>`` where the version is derived
+from the status. Views after the first one are a file read, and URLs that
+carry the version can be cached by the browser forever.
+
+``prerender`` fills the cache for a whole event using a process pool, since
+QR encoding is pure Python and would otherwise be bound to one core.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+TICKET_SIZE = (800, 1100)
+_pool = None
+
+
+def ticket_version(booking):
+    return hashlib.sha1((booking.get("status") or "confirmed").encode()).hexdigest()[:12]
+
+
+def qr_payload(booking):
+    # Same payload as the QR code in TicketPage.jsx, so verify-qr accepts both
+    return json.dumps({
+        "ticketId": booking["id"],
+        "userId": booking["user_id"],
+        "eventId": booking["event_id"],
+        "timestamp": booking.get("created_at"),
+    })
+
+
+def render_ticket_image(booking, event):
+    import qrcode
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new("RGB", TICKET_SIZE, "white")
+    draw = ImageDraw.Draw(image)
+    title_font = ImageFont.load_default(size=44)
+    body_font = ImageFont.load_default(size=28)
+
+    draw.rectangle([0, 0, TICKET_SIZE[0], 160], fill="#111827")
+    draw.text((40, 55), (event.get("title") or "Event")[:32], font=title_font, fill="white")
+
+    lines = [
+        f"Date: {(event.get('date') or '')[:16].replace('T', ' ')}",
+        f"Location: {(event.get('location') or '')[:40]}",
+        f"Tickets: {booking.get('quantity', 1)}",
+        f"Status: {booking.get('status') or 'confirmed'}",
+    ]
+    for i, line in enumerate(lines):
+        draw.text((40, 200 + i * 50), line, font=body_font, fill="#111827")
+
+    qr = qrcode.QRCode(box_size=10, border=2, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(qr_payload(booking))
+    qr.make(fit=True)
+    qr_image = qr.make_image(fill_color="black", back_color="white").convert("RGB").resize((460, 460))
+    image.paste(qr_image, ((TICKET_SIZE[0] - 460) // 2, 440))
+
+    draw.text((40, 1020), f"Ticket ID: {booking['id'][:13]}", font=body_font, fill="#6b7280")
+    return image
+
+
+class TicketCache:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, booking, fmt):
+        return os.path.join(self.root, f"{booking['id']}-{ticket_version(booking)}.{fmt}")
+
+    def get(self, booking, fmt):
+        path = self.path(booking, fmt)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read()
+        return None
+
+    def render(self, booking, event, fmt):
+        return self.render_formats(booking, event, [fmt])[fmt]
+
+    def render_formats(self, booking, event, formats):
+        # The ticket is drawn at most once and encoded to every missing format
+        image = None
+        rendered = {}
+        for fmt in formats:
+            data = self.get(booking, fmt)
+            if data is None:
+                if image is None:
+                    image = render_ticket_image(booking, event)
+                data = encode_ticket(image, fmt)
+                self._write(self.path(booking, fmt), data)
+            rendered[fmt] = data
+        return rendered
+
+    @staticmethod
+    def _write(path, data):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+def encode_ticket(image, fmt):
+    out = io.BytesIO()
+    if fmt == "pdf":
+        image.save(out, "PDF", resolution=150)
+    else:
+        # The default zlib level; optimize=True retries every level for a few
+        # percent on a mostly white image
+        image.save(out, "PNG")
+    return out.getvalue()
+
+
+def _prerender_one(root, booking, event, formats):
+    TicketCache(root).render_formats(booking, event, formats)
+
+
+async def prerender(cache, bookings, event, formats=("png", "pdf"), workers=None):
+    """Render every missing ticket for ``bookings`` of one event. Returns the number rendered."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+
+    missing = [b for b in bookings if any(not os.path.exists(cache.path(b, fmt)) for fmt in formats)]
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*[
+        loop.run_in_executor(_pool, _prerender_one, cache.root, booking, event, formats)
+        for booking in missing
+    ])
+    return len(missing)
@@ -15,13 +15,9 @@
 CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status);
 
 -- Add policy for admins to update booking status
-CREATE POLICY IF NOT EXISTS "Admins can update bookings"
+-- (is_admin() is defined in supabase_schema.sql)
+DROP POLICY IF EXISTS "Admins can update bookings" ON bookings;
+CREATE POLICY "Admins can update bookings"
     ON bookings FOR UPDATE
     TO authenticated
-    USING (
-        EXISTS (
-            SELECT 1 FROM profiles
-            WHERE profiles.id = auth.uid()
-            AND profiles.role = 'admin'
-        )
-    );
+    USING ((SELECT public.is_admin()));
@@ -0,0 +1,240 @@
+"""Resilience around calls to Supabase.
+
+- Client construction with an explicit connection pool, keep-alive and
+  HTTP/2 (when the installed supabase-py lets us pass our own httpx client),
+  deferred until first use.
+- Per-operation timeouts, so one slow response can't hold a request for the
+  library's default timeout.
+- Jittered exponential-backoff retries, only for idempotent reads and only
+  on transport errors / timeouts.
+- A circuit breaker that opens when the recent error rate spikes. While it
+  is open, reads are answered from the last good result if there is one,
+  and everything else fails fast with 503. Errors Supabase answers with a
+  5xx count against it; 4xx answers don't.
+- A bounded pool of worker threads for the blocking calls. A timed-out call
+  keeps its thread until the client's own timeout ends it, so a slow
+  upstream can tie up at most ``max_workers`` threads, and never the
+  default executor the rest of the app uses.
+"""
+import asyncio
+import concurrent.futures
+import dataclasses
+import importlib.util
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+from fastapi import HTTPException
+
+import metrics
+from cache import TTLCache
+
+RETRYABLE = (httpx.TransportError, httpx.TimeoutException, asyncio.TimeoutError, TimeoutError, ConnectionError)
+
+# SQLSTATE classes PostgREST answers with a 5xx: connection, transaction,
+# resource and internal errors, as opposed to bad input or permissions
+SERVER_ERROR_CLASSES = {"08", "09", "25", "2D", "38", "39", "3B", "40", "53", "54", "55", "57", "58", "F0", "HV", "XX"}
+
+
+def is_server_error(e):
+    """True if ``e`` is an error response that says the upstream is unwell.
+
+    Auth errors carry the HTTP status. PostgREST's APIError carries the
+    SQLSTATE or PGRST code, or the HTTP status when the body wasn't JSON.
+    """
+    status = getattr(e, "status", None)
+    if status is None:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    code = str(getattr(e, "code", None) or "")
+    if code.isdigit() and len(code) == 3:
+        return int(code) >= 500
+    # PGRST0xx: PostgREST couldn't reach or use the database
+    return code.startswith("PGRST0") or code[:2] in SERVER_ERROR_CLASSES
+
+
+def build_client_options(pool_size=20, keepalive=10, keepalive_expiry=30.0,
+                         connect_timeout=2.0, read_timeout=5.0):
+    from supabase.client import ClientOptions
+
+    kwargs = {"postgrest_client_timeout": read_timeout, "storage_client_timeout": read_timeout}
+    fields = {field.name for field in dataclasses.fields(ClientOptions)}
+    if "httpx_client" in fields:
+        kwargs["httpx_client"] = httpx.Client(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=keepalive,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+    else:
+        print("Warning: supabase ClientOptions has no httpx_client, so the connection pool "
+              "(SUPABASE_POOL_SIZE, SUPABASE_KEEPALIVE_CONNECTIONS) and connect timeout are not used")
+    return ClientOptions(**kwargs)
+
+
+class LazyClient:
+    # Stands in for a client that is expensive to import or construct. The
+    # factory runs on first attribute access, so importing the app stays
+    # cheap and a missing setting fails the request instead of the import.
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._client is not None
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+class CircuitBreaker:
+    # Tracks the outcome of the last ``window`` calls. Opens when at least
+    # ``min_calls`` were made and the failure ratio reaches ``threshold``;
+    # after ``cooldown`` seconds one trial call is let through (half-open).
+
+    def __init__(self, threshold=0.5, window=50, min_calls=10, cooldown=10.0):
+        self.threshold = threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def retry_after(self):
+        if self._opened_at is None:
+            return 0
+        return max(self.cooldown - (time.monotonic() - self._opened_at), 0)
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record(self, success):
+        if self._opened_at is not None:
+            self._trial_running = False
+            if success:
+                self._opened_at = None
+                self._outcomes.clear()
+            else:
+                self._opened_at = time.monotonic()
+            return
+
+        self._outcomes.append(success)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.threshold:
+            self._opened_at = time.monotonic()
+            metrics.inc("upstream.breaker_opened")
+
+    def release(self):
+        # The half-open trial ended without an outcome (e.g. it was
+        # cancelled); let the next call be the trial
+        self._trial_running = False
+
+
+class Upstream:
+    def __init__(self, timeouts, retries=2, backoff=0.1, breaker=None, stale_ttl=600, max_workers=20):
+        # timeouts: {operation kind: seconds}, e.g. {"read": 3, "write": 8}
+        self.timeouts = timeouts
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix="upstream")
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._last_good = TTLCache(ttl=stale_ttl, maxsize=5_000)
+        metrics.register_gauge("upstream.breaker_state", lambda: self.breaker.state)
+
+    def _unavailable(self):
+        metrics.inc("upstream.rejected")
+        raise HTTPException(
+            status_code=503,
+            detail="Service temporarily unavailable",
+            headers={"Retry-After": str(max(int(self.breaker.retry_after()), 1))}
+        )
+
+    async def call(self, fn, kind="read", idempotent=None, stale_key=None):
+        """Run the blocking upstream call ``fn`` in a worker thread.
+
+        ``idempotent`` defaults to True for reads. ``stale_key`` enables
+        serving the last good result for that key while the breaker is open.
+        """
+        if idempotent is None:
+            idempotent = kind == "read"
+
+        trial = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            stale = self._last_good.get(stale_key) if stale_key is not None else None
+            if stale is not None:
+                metrics.inc("upstream.served_stale")
+                return stale
+            self._unavailable()
+
+        try:
+            return await self._attempt(fn, kind, idempotent, stale_key)
+        finally:
+            if trial:
+                self.breaker.release()
+
+    async def _attempt(self, fn, kind, idempotent, stale_key):
+        loop = asyncio.get_running_loop()
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            try:
+                # A call still queued for a thread when it times out is dropped
+                result = await asyncio.wait_for(loop.run_in_executor(self._executor, fn), timeout=self.timeouts[kind])
+            except RETRYABLE as e:
+                metrics.inc(f"upstream.{kind}.errors")
+                self.breaker.record(False)
+                if attempt + 1 >= attempts or not self.breaker.allow():
+                    stale = self._last_good.get(stale_key) if stale_key is not None else None
+                    if stale is not None:
+                        metrics.inc("upstream.served_stale")
+                        return stale
+                    if isinstance(e, (asyncio.TimeoutError, TimeoutError, httpx.TimeoutException)):
+                        raise HTTPException(status_code=504, detail="Upstream timed out")
+                    raise
+                metrics.inc(f"upstream.{kind}.retries")
+                # Full jitter: spreads retries from many clients over the window
+                await asyncio.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+                continue
+            except Exception as e:
+                # Supabase answered. A 4xx says nothing bad about its health;
+                # a 5xx (statement timeout, pool exhausted, ...) does.
+                if is_server_error(e):
+                    metrics.inc(f"upstream.{kind}.errors")
+                    self.breaker.record(False)
+                else:
+                    self.breaker.record(True)
+                raise
+
+            self.breaker.record(True)
+            if stale_key is not None:
+                self._last_good.set(stale_key, result)
+            return result
@@ -0,0 +1,102 @@
+-- "My Bookings" read model: one row per booking with a slim event snapshot
+-- Run this in Supabase SQL Editor after supabase_schema.sql and event_images.sql
+--
+-- GET /api/bookings used to embed the full events row into every booking
+-- with a join. This table is kept up to date by triggers on bookings and
+-- events, so the page is a single range read on (user_id, event_date).
+
+CREATE TABLE IF NOT EXISTS user_bookings (
+    booking_id UUID PRIMARY KEY REFERENCES bookings(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL,
+    event_id UUID NOT NULL,
+    quantity INTEGER NOT NULL,
+    total_price DECIMAL(10, 2),
+    status TEXT,
+    created_at TIMESTAMP WITH TIME ZONE,
+    event_title TEXT NOT NULL,
+    event_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    event_location TEXT NOT NULL,
+    event_price DECIMAL(10, 2) NOT NULL,
+    event_image_url TEXT,
+    event_image_variants JSONB
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_bookings_user_date ON user_bookings(user_id, event_date, booking_id);
+CREATE INDEX IF NOT EXISTS idx_user_bookings_event_id ON user_bookings(event_id);
+
+ALTER TABLE user_bookings ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view their own booking summaries" ON user_bookings;
+CREATE POLICY "Users can view their own booking summaries"
+    ON user_bookings FOR SELECT
+    USING (auth.uid() = user_id);
+
+-- Backfill
+INSERT INTO user_bookings (
+    booking_id, user_id, event_id, quantity, total_price, status, created_at,
+    event_title, event_date, event_location, event_price, event_image_url, event_image_variants
+)
+SELECT b.id, b.user_id, b.event_id, b.quantity, b.total_price, b.status, b.created_at,
+       e.title, e.date, e.location, e.price, e.image_url, e.image_variants
+FROM bookings b
+JOIN events e ON e.id = b.event_id
+ON CONFLICT (booking_id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION public.sync_user_booking()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM user_bookings WHERE booking_id = OLD.id;
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO user_bookings (
+        booking_id, user_id, event_id, quantity, total_price, status, created_at,
+        event_title, event_date, event_location, event_price, event_image_url, event_image_variants
+    )
+    SELECT NEW.id, NEW.user_id, NEW.event_id, NEW.quantity, NEW.total_price, NEW.status, NEW.created_at,
+           e.title, e.date, e.location, e.price, e.image_url, e.image_variants
+    FROM events e
+    WHERE e.id = NEW.event_id
+    ON CONFLICT (booking_id) DO UPDATE SET
+        user_id = EXCLUDED.user_id,
+        event_id = EXCLUDED.event_id,
+        quantity = EXCLUDED.quantity,
+        total_price = EXCLUDED.total_price,
+        status = EXCLUDED.status,
+        event_title = EXCLUDED.event_title,
+        event_date = EXCLUDED.event_date,
+        event_location = EXCLUDED.event_location,
+        event_price = EXCLUDED.event_price,
+        event_image_url = EXCLUDED.event_image_url,
+        event_image_variants = EXCLUDED.event_image_variants;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS bookings_sync_user_booking ON bookings;
+CREATE TRIGGER bookings_sync_user_booking
+    AFTER INSERT OR UPDATE OR DELETE ON bookings
+    FOR EACH ROW EXECUTE FUNCTION public.sync_user_booking();
+
+-- Event edits are copied to every booking of that event. Only the columns in
+-- the snapshot fire the trigger, so booked_count updates never do.
+CREATE OR REPLACE FUNCTION public.sync_user_booking_event()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE user_bookings
+    SET event_title = NEW.title,
+        event_date = NEW.date,
+        event_location = NEW.location,
+        event_price = NEW.price,
+        event_image_url = NEW.image_url,
+        event_image_variants = NEW.image_variants
+    WHERE event_id = NEW.id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS events_sync_user_bookings ON events;
+CREATE TRIGGER events_sync_user_bookings
+    AFTER UPDATE OF title, date, location, price, image_url, image_variants ON events
+    FOR EACH ROW EXECUTE FUNCTION public.sync_user_booking_event();
@@ -0,0 +1,114 @@
+-- Booking cancellation and a FIFO waitlist per event
+-- Run this in Supabase SQL Editor after event_availability.sql and event_report.sql
+--
+-- Cancelling a booking and promoting waiters into the freed seats happens in
+-- one transaction (cancel_booking). Each promotion takes the head of the
+-- event's queue through a partial index, so the cost per freed seat doesn't
+-- depend on how many people are waiting.
+
+CREATE TABLE IF NOT EXISTS waitlist (
+    id BIGSERIAL PRIMARY KEY,
+    event_id UUID NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    quantity INTEGER NOT NULL DEFAULT 1 CHECK (quantity > 0),
+    status TEXT NOT NULL DEFAULT 'waiting',  -- 'waiting' | 'promoted' | 'left'
+    booking_id UUID REFERENCES bookings(id) ON DELETE SET NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW()),
+    promoted_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Queue order per event; only waiting rows are indexed
+CREATE INDEX IF NOT EXISTS idx_waitlist_queue ON waitlist(event_id, id) WHERE status = 'waiting';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_waitlist_one_per_user
+    ON waitlist(event_id, user_id) WHERE status = 'waiting';
+
+ALTER TABLE waitlist ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view their own waitlist entries" ON waitlist;
+CREATE POLICY "Users can view their own waitlist entries"
+    ON waitlist FOR SELECT
+    USING (auth.uid() = user_id);
+
+-- Moves waiters into free seats, oldest first, and returns the promotions.
+-- Stops at the first waiter that doesn't fit, so nobody is overtaken.
+CREATE OR REPLACE FUNCTION public.promote_waitlist(p_event_id UUID)
+RETURNS TABLE (waitlist_id BIGINT, booking_id UUID, user_id UUID, quantity INTEGER) AS $$
+DECLARE
+    free_seats INTEGER;
+    waiter waitlist%ROWTYPE;
+    new_booking_id UUID;
+BEGIN
+    -- Serializes promotions per event; booked_count is current under this lock
+    SELECT e.capacity - e.booked_count INTO free_seats
+    FROM events e
+    WHERE e.id = p_event_id
+    FOR UPDATE;
+
+    LOOP
+        EXIT WHEN free_seats IS NULL OR free_seats <= 0;
+
+        SELECT * INTO waiter
+        FROM waitlist w
+        WHERE w.event_id = p_event_id AND w.status = 'waiting'
+        ORDER BY w.id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED;
+
+        EXIT WHEN NOT FOUND OR waiter.quantity > free_seats;
+
+        INSERT INTO bookings (event_id, user_id, quantity, status)
+        VALUES (p_event_id, waiter.user_id, waiter.quantity, 'confirmed')
+        RETURNING id INTO new_booking_id;
+
+        UPDATE waitlist w
+        SET status = 'promoted', booking_id = new_booking_id, promoted_at = NOW()
+        WHERE w.id = waiter.id;
+
+        free_seats := free_seats - waiter.quantity;
+        waitlist_id := waiter.id;
+        booking_id := new_booking_id;
+        user_id := waiter.user_id;
+        quantity := waiter.quantity;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Cancels a booking (the booked_count trigger releases its seats) and
+-- promotes waiters in the same transaction. p_user_id NULL means an admin
+-- cancellation. Returns no rows if there was nothing to cancel.
+CREATE OR REPLACE FUNCTION public.cancel_booking(p_booking_id UUID, p_user_id UUID DEFAULT NULL)
+RETURNS TABLE (event_id UUID, waitlist_id BIGINT, booking_id UUID, user_id UUID, quantity INTEGER) AS $$
+DECLARE
+    cancelled_event_id UUID;
+BEGIN
+    -- promote_waitlist locks the event row; take it before the seats are
+    -- released so every path locks the event before its seat counters
+    PERFORM 1 FROM events e
+    WHERE e.id = (SELECT b.event_id FROM bookings b WHERE b.id = p_booking_id)
+    FOR NO KEY UPDATE;
+
+    UPDATE bookings b
+    SET status = 'cancelled', updated_at = NOW()
+    WHERE b.id = p_booking_id
+      AND (p_user_id IS NULL OR b.user_id = p_user_id)
+      AND b.status IS DISTINCT FROM 'cancelled'
+      AND b.status IS DISTINCT FROM 'checked_in'
+    RETURNING b.event_id INTO cancelled_event_id;
+
+    IF cancelled_event_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- Always return one row for the cancellation itself, even with no waiters
+    event_id := cancelled_event_id;
+    RETURN NEXT;
+
+    RETURN QUERY
+    SELECT cancelled_event_id, p.waitlist_id, p.booking_id, p.user_id, p.quantity
+    FROM promote_waitlist(cancelled_event_id) p;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+GRANT EXECUTE ON FUNCTION public.promote_waitlist TO service_role;
+GRANT EXECUTE ON FUNCTION public.cancel_booking TO service_role;
@@ -32,7 +32,7 @@ export default function AdminBookings() {
   const [showMenu, setShowMenu] = useState(false)
 
   useEffect(() => {
-    if (user?.user_metadata?.role !== 'admin') {
+    if (user?.app_metadata?.role !== 'admin') {
       navigate('/dashboard')
     } else {
       fetchBookings()
@@ -28,13 +28,13 @@ export default function AdminDashboard() {
     if (!loading && !user) {
       navigate('/admin/login')
     }
-    if (!loading && user && user.user_metadata?.role !== 'admin') {
+    if (!loading && user && user.app_metadata?.role !== 'admin') {
       navigate('/dashboard')
     }
   }, [user, loading, navigate])
 
   useEffect(() => {
-    if (user && user.user_metadata?.role === 'admin') {
+    if (user && user.app_metadata?.role === 'admin') {
       fetchData()
     }
   }, [user])
@@ -34,13 +34,13 @@ export default function AdminEvents() {
     if (!loading && !user) {
       navigate('/admin/login')
     }
-    if (!loading && user && user.user_metadata?.role !== 'admin') {
+    if (!loading && user && user.app_metadata?.role !== 'admin') {
       navigate('/dashboard')
     }
   }, [user, loading, navigate])
 
   useEffect(() => {
-    if (user && user.user_metadata?.role === 'admin') {
+    if (user && user.app_metadata?.role === 'admin') {
       fetchEvents()
     }
   }, [user])
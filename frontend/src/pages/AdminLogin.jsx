@@ -24,7 +24,7 @@ export default function AdminLogin() {
       setLoading(false)
     } else {
       // Check if user is admin
-      if (data.user?.user_metadata?.role === 'admin') {
+      if (data.user?.app_metadata?.role === 'admin') {
         navigate('/admin/dashboard')
       } else {
         setError('Unauthorized: Admin access only')